@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 import gevent
 import structlog
 from eth_utils import is_binary_address, is_hex, to_bytes, to_checksum_address
@@ -29,6 +31,7 @@ from raiden.exceptions import (
 )
 from raiden.messages import RequestMonitoring
 from raiden.settings import DEFAULT_RETRY_TIMEOUT
+from raiden.storage.utils import PaymentHistoryEvent
 from raiden.transfer import architecture, views
 from raiden.transfer.events import (
     EventPaymentReceivedSuccess,
@@ -38,7 +41,7 @@ from raiden.transfer.events import (
 from raiden.transfer.mediated_transfer.state import LockedTransferState
 from raiden.transfer.state import BalanceProofSignedState, NettingChannelState, TransferTask
 from raiden.transfer.state_change import ActionChannelClose
-from raiden.utils import pex, sha3, typing
+from raiden.utils import optional_address_to_string, pex, sha3, typing
 from raiden.utils.gas_reserve import has_enough_gas_reserve
 
 log = structlog.get_logger(__name__)  # pylint: disable=invalid-name
@@ -49,6 +52,25 @@ EVENTS_PAYMENT_HISTORY_RELATED = (
     EventPaymentReceivedSuccess,
 )
 
+# The names of the payment history events by status of the payment
+PAYMENT_STATUS_EVENT_TYPES = {
+    'success': [EventPaymentSentSuccess.__name__, EventPaymentReceivedSuccess.__name__],
+    'failed': [EventPaymentSentFailed.__name__],
+}
+
+
+def log_time_from_datetime(value: typing.Optional[datetime]) -> typing.Optional[str]:
+    """ Format `value` as the `log_time` of the write-ahead-log, which is in
+    UTC with milliseconds, naive values are considered to be in UTC.
+    """
+    if value is None:
+        return None
+
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return value.isoformat(timespec='milliseconds')
+
 
 def event_filter_for_payments(
         event: architecture.Event,
@@ -803,7 +825,19 @@ class RaidenAPI:
             target_address: typing.Address = None,
             limit: int = None,
             offset: int = None,
-    ):
+            from_time: datetime = None,
+            to_time: datetime = None,
+            status: str = None,
+            after_event_identifier: int = 0,
+    ) -> typing.List[PaymentHistoryEvent]:
+        """ Return the payment events, in the order they were written.
+
+        The history is paginated by passing the `event_identifier` of the last
+        event of a page as the `after_event_identifier` of the next one, which
+        unlike an `offset` does not skip the events of the previous pages.
+        `from_time` and `to_time` are inclusive, and `status` is either
+        'success' or 'failed'.
+        """
         if token_address and not is_binary_address(token_address):
             raise InvalidAddress(
                 'Expected binary address format for token in get_raiden_events_payment_history',
@@ -815,7 +849,14 @@ class RaidenAPI:
                 'target_address in get_raiden_events_payment_history',
             )
 
-        token_network_identifier = None
+        event_types = None
+        if status is not None:
+            if status not in PAYMENT_STATUS_EVENT_TYPES:
+                raise ValueError(f'Unknown payment status {status}')
+
+            event_types = PAYMENT_STATUS_EVENT_TYPES[status]
+
+        token_network = None
         if token_address:
             token_network_identifier = views.get_token_network_identifier_by_token_address(
                 chain_state=views.state_from_raiden(self.raiden),
@@ -823,19 +864,27 @@ class RaidenAPI:
                 token_address=token_address,
             )
 
-        events = [
-            event
-            for event in self.raiden.wal.storage.get_events_with_timestamps(
-                limit=limit,
-                offset=offset,
-            ) if event_filter_for_payments(
-                event=event.wrapped_event,
-                token_network_identifier=token_network_identifier,
-                partner_address=target_address,
-            )
-        ]
+            # Unknown token, there are no payments
+            if token_network_identifier is None:
+                return []
+
+            token_network = to_checksum_address(token_network_identifier)
 
-        return events
+        records = self.raiden.wal.storage.iterate_payment_history(
+            token_network_identifier=token_network,
+            partner=optional_address_to_string(target_address),
+            event_types=event_types,
+            from_time=log_time_from_datetime(from_time),
+            to_time=log_time_from_datetime(to_time),
+            after_event_identifier=after_event_identifier,
+            limit=limit,
+            offset=offset,
+        )
+
+        return [
+            PaymentHistoryEvent(record.data, record.log_time, record.event_identifier)
+            for record in records
+        ]
 
     def get_raiden_events_payment_history(
             self,
@@ -843,12 +892,20 @@ class RaidenAPI:
             target_address: typing.Address = None,
             limit: int = None,
             offset: int = None,
+            from_time: datetime = None,
+            to_time: datetime = None,
+            status: str = None,
+            after_event_identifier: int = 0,
     ):
         timestamped_events = self.get_raiden_events_payment_history_with_timestamps(
             token_address=token_address,
             target_address=target_address,
             limit=limit,
             offset=offset,
+            from_time=from_time,
+            to_time=to_time,
+            status=status,
+            after_event_identifier=after_event_identifier,
         )
 
         return [event.wrapped_event for event in timestamped_events]
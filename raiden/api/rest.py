@@ -2,6 +2,7 @@ import errno
 import json
 import logging
 import socket
+from datetime import datetime
 from http import HTTPStatus
 from typing import Dict
 
@@ -48,6 +49,7 @@ from raiden.api.v1.resources import (
     PendingTransfersResourceByTokenAndPartnerAddress,
     RaidenInternalEventsResource,
     RegisterTokenResource,
+    StateTransitionsProfileResource,
     TokensResource,
     create_blueprint,
     NetworkResource)
@@ -74,7 +76,7 @@ from raiden.exceptions import (
     TransactionThrew,
     UnknownTokenAddress,
     RaidenRecoverableError)
-from raiden.transfer import channel, views
+from raiden.transfer import channel, profiling, views
 from raiden.transfer.events import (
     EventPaymentReceivedSuccess,
     EventPaymentSentFailed,
@@ -194,6 +196,10 @@ URLS_V1 = [
         '/_debug/raiden_events',
         RaidenInternalEventsResource,
     ),
+    (
+        '/_debug/state_transitions',
+        StateTransitionsProfileResource,
+    ),
     (
         '/network_graph/<hexaddress:token_network_address>',
         NetworkResource,
@@ -908,6 +914,10 @@ class RestAPI:
             target_address: typing.Address = None,
             limit: int = None,
             offset: int = None,
+            from_time: datetime = None,
+            to_time: datetime = None,
+            status: str = None,
+            after_event_identifier: int = 0,
     ):
         log.debug(
             'Getting payment history',
@@ -916,6 +926,10 @@ class RestAPI:
             target_address=optional_address_to_string(target_address),
             limit=limit,
             offset=offset,
+            from_time=from_time,
+            to_time=to_time,
+            status=status,
+            after_event_identifier=after_event_identifier,
         )
         try:
             service_result = self.raiden_api.get_raiden_events_payment_history_with_timestamps(
@@ -923,6 +937,10 @@ class RestAPI:
                 target_address=target_address,
                 limit=limit,
                 offset=offset,
+                from_time=from_time,
+                to_time=to_time,
+                status=status,
+                after_event_identifier=after_event_identifier,
             )
         except (InvalidNumberInput, InvalidAddress) as e:
             return api_error(str(e), status_code=HTTPStatus.CONFLICT)
@@ -948,12 +966,16 @@ class RestAPI:
     def get_raiden_internal_events_with_timestamps(self, limit, offset):
         return [
             str(e)
-            for e in self.raiden_api.raiden.wal.storage.get_events_with_timestamps(
+            for e in self.raiden_api.raiden.wal.storage.iterate_events_with_timestamps(
                 limit=limit,
                 offset=offset,
             )
         ]
 
+    @staticmethod
+    def get_state_transitions_profile():
+        return api_response(result=profiling.get_stats())
+
     def get_blockchain_events_channel(
             self,
             token_address: typing.TokenAddress,
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from eth_utils import (
     is_0x_prefixed,
     is_checksum_address,
@@ -84,6 +86,25 @@ class DataField(fields.Field):
         return data_decoder(value)
 
 
+class TimeField(fields.Field):
+    """ A time in the ISO 8601 format of `datetime.isoformat`, e.g. the
+    `log_time` of the events.
+    """
+    default_error_messages = {
+        'invalid': 'Not a valid ISO 8601 time.',
+    }
+
+    @staticmethod
+    def _serialize(value, attr, obj):
+        return value.isoformat()
+
+    def _deserialize(self, value, attr, data):
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            self.fail('invalid')
+
+
 class BaseOpts(SchemaOpts):
     """
     This allows for having the Object the Schema encodes to inside of the class Meta
@@ -147,6 +168,21 @@ class RaidenEventsRequestSchema(BaseSchema):
         decoding_class = dict
 
 
+class PaymentHistoryRequestSchema(RaidenEventsRequestSchema):
+    from_time = TimeField(missing=None)
+    to_time = TimeField(missing=None)
+    status = fields.String(
+        missing=None,
+        validate=validate.OneOf(['success', 'failed']),
+    )
+    after_event_identifier = fields.Integer(missing=0, validate=validate.Range(min=0))
+
+    class Meta:
+        strict = True
+        # decoding to a dict is required by the @use_kwargs decorator from webargs
+        decoding_class = dict
+
+
 class AddressSchema(BaseSchema):
     address = AddressField()
 
@@ -285,9 +321,10 @@ class EventPaymentSentFailedSchema(BaseSchema):
     reason = fields.Str()
     target = AddressField()
     log_time = fields.String()
+    event_identifier = fields.Integer()
 
     class Meta:
-        fields = ('block_number', 'event', 'reason', 'target', 'log_time')
+        fields = ('block_number', 'event', 'reason', 'target', 'log_time', 'event_identifier')
         strict = True
         decoding_class = dict
 
@@ -299,9 +336,18 @@ class EventPaymentSentSuccessSchema(BaseSchema):
     amount = fields.Integer()
     target = AddressField()
     log_time = fields.String()
+    event_identifier = fields.Integer()
 
     class Meta:
-        fields = ('block_number', 'event', 'amount', 'target', 'identifier', 'log_time')
+        fields = (
+            'block_number',
+            'event',
+            'amount',
+            'target',
+            'identifier',
+            'log_time',
+            'event_identifier',
+        )
         strict = True
         decoding_class = dict
 
@@ -313,8 +359,17 @@ class EventPaymentReceivedSuccessSchema(BaseSchema):
     amount = fields.Integer()
     initiator = AddressField()
     log_time = fields.String()
+    event_identifier = fields.Integer()
 
     class Meta:
-        fields = ('block_number', 'event', 'amount', 'initiator', 'identifier', 'log_time')
+        fields = (
+            'block_number',
+            'event',
+            'amount',
+            'initiator',
+            'identifier',
+            'log_time',
+            'event_identifier',
+        )
         strict = True
         decoding_class = dict
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from flask import Blueprint
 from flask_restful import Resource
 from webargs.flaskparser import use_kwargs
@@ -8,6 +10,7 @@ from raiden.api.v1.encoding import (
     ChannelPutSchema,
     ConnectionsConnectSchema,
     ConnectionsLeaveSchema,
+    PaymentHistoryRequestSchema,
     PaymentSchema,
     RaidenEventsRequestSchema,
 )
@@ -164,6 +167,12 @@ class RaidenInternalEventsResource(BaseResource):
         )
 
 
+class StateTransitionsProfileResource(BaseResource):
+
+    def get(self):
+        return self.rest_api.get_state_transitions_profile()
+
+
 class RegisterTokenResource(BaseResource):
 
     def get(self, token_address):
@@ -221,7 +230,7 @@ class PaymentResource(BaseResource):
     post_schema = PaymentSchema(
         only=('amount', 'identifier', 'secret', 'secret_hash'),
     )
-    get_schema = RaidenEventsRequestSchema()
+    get_schema = PaymentHistoryRequestSchema()
 
     @use_kwargs(get_schema, locations=('query',))
     def get(
@@ -230,12 +239,20 @@ class PaymentResource(BaseResource):
             target_address: typing.Address = None,
             limit: int = None,
             offset: int = None,
+            from_time: datetime = None,
+            to_time: datetime = None,
+            status: str = None,
+            after_event_identifier: int = 0,
     ):
         return self.rest_api.get_raiden_events_payment_history_with_timestamps(
             token_address=token_address,
             target_address=target_address,
             limit=limit,
             offset=offset,
+            from_time=from_time,
+            to_time=to_time,
+            status=status,
+            after_event_identifier=after_event_identifier,
         )
 
     @use_kwargs(post_schema, locations=('json',))
@@ -1,7 +1,7 @@
 import structlog
 from eth_utils import to_checksum_address
 
-from raiden.constants import DISCOVERY_DEFAULT_ROOM
+from raiden.constants import DISCOVERY_DEFAULT_ROOM, SNAPSHOT_STATE_CHANGES_COUNT
 from raiden.exceptions import InvalidSettleTimeout
 from raiden.network.blockchain_service import BlockChainService
 from raiden.network.proxies import Discovery, SecretRegistry, TokenNetworkRegistry
@@ -14,6 +14,9 @@ from raiden.settings import (
     DEFAULT_REVEAL_TIMEOUT,
     DEFAULT_SETTLE_TIMEOUT,
     DEFAULT_SHUTDOWN_TIMEOUT,
+    DEFAULT_STORAGE_GROUP_COMMIT_MAX_SIZE,
+    DEFAULT_STORAGE_GROUP_COMMIT_WINDOW,
+    DEFAULT_STORAGE_SNAPSHOT_FULL_INTERVAL,
     DEFAULT_TRANSPORT_MATRIX_RETRY_INTERVAL,
     DEFAULT_TRANSPORT_RETRIES_BEFORE_BACKOFF,
     DEFAULT_TRANSPORT_THROTTLE_CAPACITY,
@@ -63,12 +66,31 @@ class App:  # pylint: disable=too-few-public-methods
         },
         'rpc': True,
         'console': False,
+        'profile_state_transitions': False,
         'shutdown_timeout': DEFAULT_SHUTDOWN_TIMEOUT,
         'services': {
             'pathfinding_service_address': None,
             'pathfinding_max_paths': 3,
             'monitoring_enabled': False,
         },
+        'storage': {
+            'serializer': 'json',
+            'compression': None,
+            'compress_state_changes': False,
+            'group_commit': False,
+            'group_commit_window': DEFAULT_STORAGE_GROUP_COMMIT_WINDOW,
+            'group_commit_max_size': DEFAULT_STORAGE_GROUP_COMMIT_MAX_SIZE,
+            'snapshot_state_changes_count': SNAPSHOT_STATE_CHANGES_COUNT,
+            'snapshot_interval': None,
+            'snapshot_replay_cost': None,
+            'snapshot_full_interval': DEFAULT_STORAGE_SNAPSHOT_FULL_INTERVAL,
+            'compaction_retained_snapshots': None,
+            'replay_decode_workers': 0,
+            'read_connections': 0,
+            'io_thread': False,
+            'state_cache': False,
+            'copy_on_write': False,
+        },
     }
 
     def __init__(
@@ -105,6 +105,8 @@ def handle_channel_new(raiden: 'RaidenService', event: Event):
             block_hash=block_hash,
         )
         raiden.handle_and_track_state_change(new_channel)
+        # The connection manager started below reads the new channel
+        raiden.flush_state_changes()
 
         partner_address = channel_state.partner_state.address
 
@@ -142,6 +144,7 @@ def handle_channel_new_balance(raiden: 'RaidenService', event: Event):
     total_deposit = args['total_deposit']
     transaction_hash = data['transaction_hash']
 
+    raiden.flush_state_changes()
     previous_channel_state = views.get_channelstate_by_token_network_identifier(
         views.state_from_raiden(raiden),
         token_network_identifier,
@@ -170,6 +173,9 @@ def handle_channel_new_balance(raiden: 'RaidenService', event: Event):
         raiden.handle_and_track_state_change(newbalance_statechange)
 
         if balance_was_zero and participant_address != raiden.address:
+            # The connection manager started below reads the new deposit
+            raiden.flush_state_changes()
+
             connection_manager = raiden.connection_manager_for_token_network(
                 token_network_identifier,
             )
@@ -192,6 +198,7 @@ def handle_channel_closed(raiden: 'RaidenService', event: Event):
     transaction_hash = data['transaction_hash']
     block_hash = data['block_hash']
 
+    raiden.flush_state_changes()
     channel_state = views.get_channelstate_by_token_network_identifier(
         views.state_from_raiden(raiden),
         token_network_identifier,
@@ -232,6 +239,7 @@ def handle_channel_update_transfer(raiden: 'RaidenService', event: Event):
     block_number = data['block_number']
     block_hash = data['block_hash']
 
+    raiden.flush_state_changes()
     channel_state = views.get_channelstate_by_token_network_identifier(
         views.state_from_raiden(raiden),
         token_network_identifier,
@@ -258,6 +266,7 @@ def handle_channel_settled(raiden: 'RaidenService', event: Event):
     block_hash = data['block_hash']
     transaction_hash = data['transaction_hash']
 
+    raiden.flush_state_changes()
     channel_state = views.get_channelstate_by_token_network_identifier(
         views.state_from_raiden(raiden),
         token_network_identifier,
@@ -113,6 +113,8 @@ class MessageHandler:
     def handle_message_refundtransfer(raiden: RaidenService, message: RefundTransfer):
         token_network_address = message.token_network_address
         from_transfer = lockedtransfersigned_from_message(message)
+
+        raiden.flush_state_changes()
         chain_state = views.state_from_raiden(raiden)
 
         routes = get_best_routes(
@@ -169,6 +171,8 @@ class MessageHandler:
             )
             return
 
+        # The initialization of the transfer reads the state
+        raiden.flush_state_changes()
         if message.target == raiden.address:
             raiden.target_mediated_transfer(message)
         else:
@@ -70,6 +70,7 @@ from raiden.utils.typing import (
     Iterable,
     Iterator,
     List,
+    MessageID,
     NamedTuple,
     NewType,
     Optional,
@@ -217,12 +218,24 @@ class _RetryQueue(Runnable):
             if next(data.expiration_generator)
         ]
 
+        queueids_to_queues = self.transport._queueids_to_queues
+        # The identifiers of the messages of each queue, computed once per queue
+        # instead of scanning the queue for every retried message
+        queueids_to_message_identifiers: Dict[QueueIdentifier, Set[MessageID]] = dict()
+
         def message_is_in_queue(data: _RetryQueue._MessageData) -> bool:
-            return any(
-                isinstance(data.message, RetrieableMessage) and
-                send_event.message_identifier == data.message.message_identifier
-                for send_event in self.transport._queueids_to_queues[data.queue_identifier]
-            )
+            if not isinstance(data.message, RetrieableMessage):
+                return False
+
+            message_identifiers = queueids_to_message_identifiers.get(data.queue_identifier)
+            if message_identifiers is None:
+                message_identifiers = {
+                    send_event.message_identifier
+                    for send_event in queueids_to_queues[data.queue_identifier]
+                }
+                queueids_to_message_identifiers[data.queue_identifier] = message_identifiers
+
+            return data.message.message_identifier in message_identifiers
 
         # clean after composing, so any queued messages (e.g. Delivered) are sent at least once
         for msg_data in self._message_queue[:]:
@@ -232,7 +245,7 @@ class _RetryQueue(Runnable):
                 # TODO: Is this correct? Will a missed Delivered be 'fixed' by the
                 #       later `Processed` message?
                 remove = True
-            elif msg_data.queue_identifier not in self.transport._queueids_to_queues:
+            elif msg_data.queue_identifier not in queueids_to_queues:
                 remove = True
                 self.log.debug(
                     'Stopping message send retry',
@@ -891,14 +904,24 @@ class MatrixTransport(Runnable):
             room=room,
         )
 
-        for message in messages:
-            if isinstance(message, Delivered):
-                self._receive_delivered(message)
-            elif isinstance(message, Processed):
-                self._receive_message(message)
-            else:
-                assert isinstance(message, SignedRetrieableMessage)
-                self._receive_message(message)
+        # The state changes of the messages are dispatched together, their
+        # Delivered are only sent once the batch is committed, i.e. once the
+        # block exits
+        assert self._raiden_service is not None
+        pending_delivered: List[Tuple[Address, Delivered]] = list()
+        with self._raiden_service.batch_state_changes():
+            for message in messages:
+                if isinstance(message, Delivered):
+                    self._receive_delivered(message)
+                elif isinstance(message, Processed):
+                    self._receive_message(message, pending_delivered)
+                else:
+                    assert isinstance(message, SignedRetrieableMessage)
+                    self._receive_message(message, pending_delivered)
+
+        for receiver, delivered_message in pending_delivered:
+            retrier = self._get_retrier(receiver)
+            retrier.enqueue_global(delivered_message)
 
         return True
 
@@ -912,7 +935,17 @@ class MatrixTransport(Runnable):
         assert self._raiden_service is not None
         self._raiden_service.on_message(delivered)
 
-    def _receive_message(self, message: Union[SignedRetrieableMessage, Processed]):
+    def _receive_message(
+            self,
+            message: Union[SignedRetrieableMessage, Processed],
+            pending_delivered: Optional[List[Tuple[Address, Delivered]]] = None,
+    ):
+        """ Handle the message and acknowledge it.
+
+        If `pending_delivered` is given the Delivered is appended to it instead
+        of being sent, the caller sends it once the batch of state changes
+        which includes the message is committed.
+        """
         assert self._raiden_service is not None
         self.log.debug(
             'Message received',
@@ -922,20 +955,31 @@ class MatrixTransport(Runnable):
         )
 
         try:
-            # TODO: Maybe replace with Matrix read receipts.
-            #       Unfortunately those work on an 'up to' basis, not on individual messages
-            #       which means that message order is important which isn't guaranteed between
-            #       federated servers.
-            #       See: https://matrix.org/docs/spec/client_server/r0.3.0.html#id57
-            delivered_message = Delivered(delivered_message_identifier=message.message_identifier)
-            self._raiden_service.sign(delivered_message)
-            retrier = self._get_retrier(message.sender)
-            retrier.enqueue_global(delivered_message)
             self._raiden_service.on_message(message)
 
         except (InvalidAddress, UnknownAddress, UnknownTokenAddress):
+            # The message is rejected, it is still acknowledged so that the
+            # partner stops sending it
             self.log.warning('Exception while processing message', exc_info=True)
-            return
+
+        # The Delivered is only sent once the state change of the message is
+        # committed, i.e. once `on_message` returned, otherwise the retry
+        # queue could send it while the write-ahead-log waits for a group
+        # commit, and a crash would lose an acknowledged message.
+        #
+        # TODO: Maybe replace with Matrix read receipts.
+        #       Unfortunately those work on an 'up to' basis, not on individual messages
+        #       which means that message order is important which isn't guaranteed between
+        #       federated servers.
+        #       See: https://matrix.org/docs/spec/client_server/r0.3.0.html#id57
+        delivered_message = Delivered(delivered_message_identifier=message.message_identifier)
+        self._raiden_service.sign(delivered_message)
+
+        if pending_delivered is not None:
+            pending_delivered.append((message.sender, delivered_message))
+        else:
+            retrier = self._get_retrier(message.sender)
+            retrier.enqueue_global(delivered_message)
 
     def _get_retrier(self, receiver: Address) -> _RetryQueue:
         """ Construct and return a _RetryQueue for receiver """
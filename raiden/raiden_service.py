@@ -1,7 +1,9 @@
 # pylint: disable=too-many-lines
 import os
 import random
+import time
 from collections import defaultdict
+from contextlib import contextmanager
 from typing import Dict, List, NamedTuple, Union
 
 import filelock
@@ -16,7 +18,7 @@ from raiden import constants, routing
 from raiden.blockchain.events import BlockchainEvents
 from raiden.blockchain_events_handler import on_blockchain_event
 from raiden.connection_manager import ConnectionManager
-from raiden.constants import GENESIS_BLOCK_NUMBER, SNAPSHOT_STATE_CHANGES_COUNT, Environment
+from raiden.constants import GENESIS_BLOCK_NUMBER, Environment
 from raiden.exceptions import (
     InvalidAddress,
     InvalidDBData,
@@ -33,10 +35,18 @@ from raiden.messages import (
 )
 from raiden.network.blockchain_service import BlockChainService
 from raiden.network.proxies import SecretRegistry, TokenNetworkRegistry
-from raiden.storage import serialize, sqlite, wal
+from raiden.storage import serialize, sqlite, state_cache, wal
+from raiden.storage.executor import StorageExecutor
+from raiden.storage.snapshots import SnapshotScheduler
+from raiden.storage.versions import (
+    archive_db_file,
+    state_cache_file,
+    state_transitions_profile_file,
+)
 from raiden.tasks import AlarmTask
-from raiden.transfer import node, views
-from raiden.transfer.architecture import Event as RaidenEvent, State, StateChange
+from raiden.transfer import node, profiling, views
+from raiden.transfer.architecture import Event as RaidenEvent, State, StateChange, StateManager
+from raiden.transfer.copy_on_write import CopyOnWriteStateManager
 from raiden.transfer.mediated_transfer.events import SendLockedTransfer
 from raiden.transfer.mediated_transfer.state import (
     TransferDescriptionWithSecretState,
@@ -108,6 +118,15 @@ def _redact_secret(
     return data
 
 
+def _end_startup_phase(timings: Dict[str, float], phase: str, phase_start: float) -> float:
+    """ Record the duration of the startup `phase` and return the start of
+    the next one.
+    """
+    now = time.monotonic()
+    timings[phase] = now - phase_start
+    return now
+
+
 def initiator_init(
         raiden: 'RaidenService',
         transfer_identifier: PaymentID,
@@ -249,13 +268,16 @@ class RaidenService(Runnable):
         self.greenlets = list()
 
         self.wal: Optional[wal.WriteAheadLog] = None
-        self.snapshot_group = 0
+        self.snapshot_scheduler: Optional[SnapshotScheduler] = None
 
         # This flag will be used to prevent the service from processing
         # state changes events until we know that pending transactions
         # have been dispatched.
         self.dispatch_events_lock = Semaphore(1)
 
+        # The state changes collected by `batch_state_changes`, per greenlet
+        self.state_changes_batches: Dict[Greenlet, List[StateChange]] = dict()
+
         self.contract_manager = ContractManager(config['contracts_path'])
         self.database_path = config['database_path']
         if self.database_path != ':memory:':
@@ -264,6 +286,12 @@ class RaidenService(Runnable):
 
             self.database_dir = database_dir
 
+            self.archive_path = archive_db_file(self.database_path)
+            self.state_cache_path = state_cache_file(self.database_path)
+            self.state_transitions_profile_path = state_transitions_profile_file(
+                self.database_path,
+            )
+
             # Two raiden processes must not write to the same database, even
             # though the database itself may be consistent. If more than one
             # nodes writes state changes to the same WAL there are no
@@ -274,6 +302,9 @@ class RaidenService(Runnable):
         else:
             self.database_path = ':memory:'
             self.database_dir = None
+            self.archive_path = ':memory:'
+            self.state_cache_path = None
+            self.state_transitions_profile_path = None
             self.serialization_file = None
             self.db_lock = None
 
@@ -292,6 +323,11 @@ class RaidenService(Runnable):
             self.db_lock.acquire(timeout=0)
             assert self.db_lock.is_locked
 
+        # Enabled before the state is restored, the replay of the state changes
+        # is profiled as well
+        if self.config['profile_state_transitions']:
+            profiling.enable()
+
         # start the registration early to speed up the start
         if self.config['transport_type'] == 'udp':
             endpoint_registration_greenlet = gevent.spawn(
@@ -301,18 +337,65 @@ class RaidenService(Runnable):
                 self.config['transport']['udp']['external_port'],
             )
 
+        startup_timings: Dict[str, float] = dict()
+        phase_start = time.monotonic()
+
         self.maybe_upgrade_db()
+        phase_start = _end_startup_phase(startup_timings, 'db_upgrade', phase_start)
 
+        storage_config = self.config['storage']
         storage = sqlite.SerializedSQLiteStorage(
             database_path=self.database_path,
-            serializer=serialize.JSONSerializer(),
+            serializer=serialize.SERIALIZERS[storage_config['serializer']](),
+            compression=storage_config['compression'],
+            compress_state_changes=storage_config['compress_state_changes'],
+            read_connections=storage_config['read_connections'],
+            executor=StorageExecutor(dedicated_thread=storage_config['io_thread']),
         )
         storage.log_run()
-        self.wal = wal.restore_to_state_change(
-            transition_function=node.state_transition,
-            storage=storage,
-            state_change_identifier='latest',
-        )
+        storage.convert_serialization()
+        if storage_config['compaction_retained_snapshots'] is not None:
+            storage.attach_archive(self.archive_path)
+        phase_start = _end_startup_phase(startup_timings, 'storage_open', phase_start)
+
+        cached_state = None
+        if storage_config['state_cache'] and self.state_cache_path is not None:
+            cached_state = state_cache.read_state_cache(self.state_cache_path, storage)
+
+        if cached_state is not None:
+            log.debug('Restored state from the state cache', node=pex(self.address))
+            state_manager_class = (
+                CopyOnWriteStateManager if storage_config['copy_on_write'] else StateManager
+            )
+            self.wal = wal.WriteAheadLog(
+                state_manager=state_manager_class(node.state_transition, cached_state),
+                storage=storage,
+                full_snapshot_interval=storage_config['snapshot_full_interval'],
+            )
+        else:
+            self.wal = wal.restore_to_state_change(
+                transition_function=node.state_transition,
+                storage=storage,
+                state_change_identifier='latest',
+                full_snapshot_interval=storage_config['snapshot_full_interval'],
+                decode_workers=storage_config['replay_decode_workers'],
+                copy_on_write=storage_config['copy_on_write'],
+            )
+
+        if storage_config['group_commit']:
+            self.wal = wal.GroupCommitWriteAheadLog(
+                state_manager=self.wal.state_manager,
+                storage=storage,
+                commit_window=storage_config['group_commit_window'],
+                max_batch_size=storage_config['group_commit_max_size'],
+                full_snapshot_interval=storage_config['snapshot_full_interval'],
+            )
+
+        # The rows archived while running are only released here, rebuilding
+        # the database blocks for too long to be done while running.
+        phase_start = _end_startup_phase(startup_timings, 'restore', phase_start)
+        self._compact_storage(vacuum=True)
+        phase_start = _end_startup_phase(startup_timings, 'compaction', phase_start)
 
         if self.wal.state_manager.current_state is None:
             log.debug(
@@ -369,9 +452,14 @@ class RaidenService(Runnable):
                     f'smart contracts {known_registries}',
                 )
 
-        # Restore the current snapshot group
-        state_change_qty = self.wal.storage.count_state_changes()
-        self.snapshot_group = state_change_qty // SNAPSHOT_STATE_CHANGES_COUNT
+        # Seed the scheduler with the state changes that are not covered by
+        # the latest snapshot, from here on the counters are kept in memory.
+        self.snapshot_scheduler = SnapshotScheduler(
+            state_changes_count=storage_config['snapshot_state_changes_count'],
+            interval=storage_config['snapshot_interval'],
+            replay_cost=storage_config['snapshot_replay_cost'],
+            pending_state_changes=self.wal.storage.count_state_changes_since_latest_snapshot(),
+        )
 
         # Install the filters using the correct from_block value, otherwise
         # blockchain logs can be lost.
@@ -380,6 +468,7 @@ class RaidenService(Runnable):
             self.default_secret_registry,
             last_log_block_number,
         )
+        phase_start = _end_startup_phase(startup_timings, 'blockchain_filters', phase_start)
 
         # Complete the first_run of the alarm task and synchronize with the
         # blockchain since the last run.
@@ -392,6 +481,7 @@ class RaidenService(Runnable):
         self.alarm.register_callback(self._callback_new_block)
         with self.dispatch_events_lock:
             self.alarm.first_run(last_log_block_number)
+        phase_start = _end_startup_phase(startup_timings, 'blockchain_sync', phase_start)
 
         chain_state = views.state_from_raiden(self)
         self._initialize_transactions_queues(chain_state)
@@ -411,6 +501,7 @@ class RaidenService(Runnable):
         )
         for balance_proof in current_balance_proofs:
             update_monitoring_service_from_balance_proof(self, balance_proof)
+        phase_start = _end_startup_phase(startup_timings, 'queues_initialization', phase_start)
 
         # The transport must not ever be started before the alarm task's
         # `first_run()` has been, because it's this method which synchronizes the
@@ -436,7 +527,12 @@ class RaidenService(Runnable):
         if self.config['transport_type'] == 'udp':
             endpoint_registration_greenlet.get()  # re-raise if exception occurred
 
-        log.debug('Raiden Service started', node=pex(self.address))
+        _end_startup_phase(startup_timings, 'services_start', phase_start)
+        log.info(
+            'Raiden Service started',
+            node=pex(self.address),
+            startup_timings=startup_timings,
+        )
         super().start()
 
     def _run(self, *args, **kwargs):  # pylint: disable=method-hidden
@@ -475,8 +571,47 @@ class RaidenService(Runnable):
 
         self.blockchain_events.uninstall_all_event_listeners()
 
+        # Commit the state changes which are still pending in a group commit
+        self.wal.flush()
+
+        executor = self.wal.storage.executor
+        log.info(
+            'Storage hub blocking',
+            node=pex(self.address),
+            operations=executor.operations,
+            hub_blocked_duration=executor.hub_blocked_duration,
+            hub_blocked_max_duration=executor.hub_blocked_max_duration,
+        )
+
+        # Only a state which is the result of the logged state changes can be
+        # used on the next start
+        write_state_cache = (
+            self.config['storage']['state_cache'] and
+            self.state_cache_path is not None and
+            not self.wal.state_diverged and
+            self.wal.state_manager.current_state is not None
+        )
+        if write_state_cache:
+            try:
+                state_cache.write_state_cache(
+                    self.state_cache_path,
+                    self.wal.storage,
+                    self.wal.state_manager.current_state,
+                )
+            except Exception:  # pylint: disable=broad-except
+                # The state is restored from the database instead
+                log.warning('Failed to write the state cache', exc_info=True)
+
+        if self.config['profile_state_transitions']:
+            if self.state_transitions_profile_path is not None:
+                try:
+                    profiling.dump_stats(self.state_transitions_profile_path)
+                except OSError:
+                    log.warning('Failed to write the state transitions profile', exc_info=True)
+            profiling.disable()
+
         # Close storage DB to release internal DB lock
-        self.wal.storage.conn.close()
+        self.wal.storage.close()
 
         if self.db_lock is not None:
             self.db_lock.release()
@@ -517,31 +652,120 @@ class RaidenService(Runnable):
 
         When the method is used the exceptions are tracked and re-raised in the
         raiden service thread.
+
+        Within `batch_state_changes` the state change is collected and
+        dispatched with the rest of the batch instead.
         """
-        for greenlet in self.handle_state_change(state_change):
+        batch = self.state_changes_batches.get(gevent.getcurrent())
+
+        if batch is not None:
+            batch.append(state_change)
+        else:
+            self.handle_and_track_state_changes([state_change])
+
+    def handle_and_track_state_changes(self, state_changes: List[StateChange]):
+        """ Dispatch the state changes in order and does not handle the
+        exceptions, see `handle_and_track_state_change`.
+        """
+        for greenlet in self.handle_state_changes(state_changes):
             self.add_pending_greenlet(greenlet)
 
+    @contextmanager
+    def batch_state_changes(self):
+        """ Collect the state changes tracked by the current greenlet and
+        dispatch them together once the block exits, with a single copy of the
+        state and a single database transaction.
+
+        The collected state changes are not applied until then, so code within
+        the block which reads the state must call `flush_state_changes` first.
+        A nested batch is part of the outer one.
+        """
+        current = gevent.getcurrent()
+
+        if current in self.state_changes_batches:
+            yield
+            return
+
+        self.state_changes_batches[current] = list()
+        try:
+            yield
+        finally:
+            try:
+                self.flush_state_changes()
+            finally:
+                del self.state_changes_batches[current]
+
+    def flush_state_changes(self):
+        """ Dispatch the state changes collected by the batch of the current
+        greenlet, if any.
+        """
+        batch = self.state_changes_batches.get(gevent.getcurrent())
+
+        if batch:
+            state_changes = list(batch)
+            batch.clear()
+            self.handle_and_track_state_changes(state_changes)
+
     def handle_state_change(self, state_change: StateChange) -> List[Greenlet]:
         """ Dispatch the state change and return the processing threads.
 
         Use this for error reporting, failures in the returned greenlets,
         should be re-raised using `gevent.joinall` with `raise_error=True`.
         """
+        return self.handle_state_changes([state_change])
+
+    def handle_state_changes(self, state_changes: List[StateChange]) -> List[Greenlet]:
+        """ Dispatch the state changes in order and return the processing
+        threads of all their events, see `handle_state_change`.
+
+        Several state changes are logged in a single database transaction and
+        applied to a single copy of the state, see
+        `WriteAheadLog.log_and_dispatch_many`.
+        """
         assert self.wal
-        log.debug(
-            'State change',
-            node=pex(self.address),
-            state_change=_redact_secret(serialize.JSONSerializer.serialize(state_change)),
-        )
+        if not state_changes:
+            return list()
+
+        for state_change in state_changes:
+            log.debug(
+                'State change',
+                node=pex(self.address),
+                state_change=_redact_secret(serialize.JSONSerializer.serialize(state_change)),
+            )
 
         old_state = views.state_from_raiden(self)
 
-        raiden_event_list = self.wal.log_and_dispatch(state_change)
+        dispatch_start = time.monotonic()
+        if len(state_changes) == 1:
+            events_per_state_change = [self.wal.log_and_dispatch(state_changes[0])]
+        else:
+            events_per_state_change = self.wal.log_and_dispatch_many(state_changes)
+
+        if self.snapshot_scheduler is not None:
+            # The replay cost of each state change is estimated as an equal
+            # share of the batch
+            dispatch_duration = (time.monotonic() - dispatch_start) / len(state_changes)
+            for _ in state_changes:
+                self.snapshot_scheduler.state_change_dispatched(dispatch_duration)
 
         current_state = views.state_from_raiden(self)
-        for balance_proof in views.detect_balance_proof_change(old_state, current_state):
+        if len(state_changes) == 1:
+            updated_balance_proofs = current_state.updated_balance_proofs
+        else:
+            updated_balance_proofs = node.get_updated_balance_proofs(
+                old_state,
+                current_state,
+                state_changes,
+            )
+
+        for balance_proof in updated_balance_proofs:
             update_monitoring_service_from_balance_proof(self, balance_proof)
 
+        raiden_event_list = [
+            raiden_event
+            for events in events_per_state_change
+            for raiden_event in events
+        ]
         log.debug(
             'Raiden events',
             node=pex(self.address),
@@ -558,17 +782,54 @@ class RaidenService(Runnable):
                     self.handle_event(raiden_event=raiden_event),
                 )
 
-            state_changes_count = self.wal.storage.count_state_changes()
-            new_snapshot_group = (
-                state_changes_count // SNAPSHOT_STATE_CHANGES_COUNT
-            )
-            if new_snapshot_group > self.snapshot_group:
-                log.debug('Storing snapshot', snapshot_id=new_snapshot_group)
-                self.wal.snapshot()
-                self.snapshot_group = new_snapshot_group
+            if self.snapshot_scheduler is not None and self.snapshot_scheduler.should_snapshot():
+                self._snapshot()
 
         return greenlets
 
+    def _snapshot(self):
+        scheduler = self.snapshot_scheduler
+        pending_state_changes = scheduler.pending_state_changes
+        pending_replay_cost = scheduler.pending_replay_cost
+
+        snapshot_start = time.monotonic()
+        self.wal.snapshot()
+        duration = time.monotonic() - snapshot_start
+
+        scheduler.snapshot_done(duration)
+        log.debug(
+            'Stored snapshot',
+            node=pex(self.address),
+            state_change_id=self.wal.state_change_id,
+            state_changes=pending_state_changes,
+            estimated_replay_cost=pending_replay_cost,
+            duration=duration,
+        )
+
+        self._compact_storage()
+
+    def _compact_storage(self, vacuum: bool = False):
+        """ Archive the history which is no longer needed to restore the
+        node, if enabled, and optionally rebuild the database file to shrink it.
+        """
+        retained_snapshots = self.config['storage']['compaction_retained_snapshots']
+        if retained_snapshots is None:
+            return
+
+        compaction_start = time.monotonic()
+        archived = self.wal.storage.archive_history(retained_snapshots)
+        vacuumed = vacuum and self.wal.storage.vacuum()
+
+        log.debug(
+            'Compacted storage',
+            node=pex(self.address),
+            archived_state_changes=archived.state_changes,
+            archived_events=archived.events,
+            archived_snapshots=archived.snapshots,
+            vacuumed=vacuumed,
+            duration=time.monotonic() - compaction_start,
+        )
+
     def handle_event(self, raiden_event: RaidenEvent) -> Greenlet:
         """Spawn a new thread to handle a Raiden event.
 
@@ -648,31 +909,37 @@ class RaidenService(Runnable):
             # handle testing private chains
             confirmed_block_number = max(GENESIS_BLOCK_NUMBER, confirmed_block_number)
 
-            for event in self.blockchain_events.poll_blockchain_events(confirmed_block_number):
-                # These state changes will be procesed with a block_number
-                # which is /larger/ than the ChainState's block_number.
-                on_blockchain_event(self, event)
-
-            # On restart the Raiden node will re-create the filters with the
-            # ethereum node. These filters will have the from_block set to the
-            # value of the latest Block state change. To avoid missing events
-            # the Block state change is dispatched only after all of the events
-            # have been processed.
-            #
-            # This means on some corner cases a few events may be applied
-            # twice, this will happen if the node crashed and some events have
-            # been processed but the Block state change has not been
-            # dispatched.
-            state_change = Block(
-                block_number=confirmed_block_number,
-                gas_limit=confirmed_block['gasLimit'],
-                block_hash=BlockHash(bytes(confirmed_block['hash'])),
-            )
+            # The state changes of the events and the Block are dispatched
+            # together, the handlers which read the state flush the batch
+            # first.
+            with self.batch_state_changes():
+                for event in self.blockchain_events.poll_blockchain_events(
+                        confirmed_block_number,
+                ):
+                    # These state changes will be procesed with a block_number
+                    # which is /larger/ than the ChainState's block_number.
+                    on_blockchain_event(self, event)
+
+                # On restart the Raiden node will re-create the filters with the
+                # ethereum node. These filters will have the from_block set to the
+                # value of the latest Block state change. To avoid missing events
+                # the Block state change is dispatched only after all of the events
+                # have been processed.
+                #
+                # This means on some corner cases a few events may be applied
+                # twice, this will happen if the node crashed and some events have
+                # been processed but the Block state change has not been
+                # dispatched.
+                state_change = Block(
+                    block_number=confirmed_block_number,
+                    gas_limit=confirmed_block['gasLimit'],
+                    block_hash=BlockHash(bytes(confirmed_block['hash'])),
+                )
 
-            # Note: It's important to /not/ block here, because this function
-            # can be called from the alarm task greenlet, which should not
-            # starve.
-            self.handle_and_track_state_change(state_change)
+                # Note: It's important to /not/ block here, because this function
+                # can be called from the alarm task greenlet, which should not
+                # starve.
+                self.handle_and_track_state_change(state_change)
 
     def _initialize_transactions_queues(self, chain_state: ChainState):
         pending_transactions = views.get_pending_transactions(chain_state)
@@ -42,6 +42,11 @@ DEFAULT_NAT_INVITATION_TIMEOUT = 15
 
 DEFAULT_SHUTDOWN_TIMEOUT = 2
 
+DEFAULT_STORAGE_GROUP_COMMIT_WINDOW = 0.005  # seconds
+DEFAULT_STORAGE_GROUP_COMMIT_MAX_SIZE = 64
+# Number of snapshots between two full snapshots, the others are deltas
+DEFAULT_STORAGE_SNAPSHOT_FULL_INTERVAL = 10
+
 ORACLE_BLOCKNUMBER_DRIFT_TOLERANCE = 3
 ETHERSCAN_API = 'https://{network}.etherscan.io/api?module=proxy&action={action}'
 
@@ -0,0 +1,131 @@
+from gevent.queue import Queue
+
+from raiden.transfer.architecture import Event
+from raiden.transfer.events import (
+    EventPaymentReceivedSuccess,
+    EventPaymentSentFailed,
+    EventPaymentSentSuccess,
+)
+from raiden.utils import typing
+
+# The payment events name the payment identifier `identifier`
+PAYMENT_EVENTS = (
+    EventPaymentSentSuccess,
+    EventPaymentSentFailed,
+    EventPaymentReceivedSuccess,
+)
+
+
+def event_token_network_identifier(event: Event) -> typing.Optional[typing.TokenNetworkID]:
+    token_network_identifier = getattr(event, 'token_network_identifier', None)
+
+    if token_network_identifier is None:
+        balance_proof = getattr(event, 'balance_proof', None)
+        if balance_proof is not None:
+            token_network_identifier = balance_proof.token_network_identifier
+
+    return token_network_identifier
+
+
+def event_payment_identifier(event: Event) -> typing.Optional[typing.PaymentID]:
+    if isinstance(event, PAYMENT_EVENTS):
+        return event.identifier
+
+    return getattr(event, 'payment_identifier', None)
+
+
+class EventSubscription:
+    """ Events published to an `EventBus` which match the filters, in the
+    order they were published.
+
+    The events are queued until they are read, the subscription must be
+    closed once it is not used anymore, either with `unsubscribe` or by using
+    it as a context manager.
+    """
+
+    def __init__(
+            self,
+            bus: 'EventBus',
+            event_types: typing.Tuple[type, ...] = None,
+            token_network_identifier: typing.TokenNetworkID = None,
+            payment_identifier: typing.PaymentID = None,
+    ):
+        self.bus = bus
+        self.event_types = event_types
+        self.token_network_identifier = token_network_identifier
+        self.payment_identifier = payment_identifier
+        self.events: Queue = Queue()
+
+    def matches(self, event: Event) -> bool:
+        if self.event_types is not None and not isinstance(event, self.event_types):
+            return False
+
+        if self.token_network_identifier is not None:
+            if event_token_network_identifier(event) != self.token_network_identifier:
+                return False
+
+        if self.payment_identifier is not None:
+            if event_payment_identifier(event) != self.payment_identifier:
+                return False
+
+        return True
+
+    def get(self, block: bool = True, timeout: float = None) -> Event:
+        """ Return the next event, raises `gevent.queue.Empty` on timeout. """
+        return self.events.get(block, timeout)
+
+    def unsubscribe(self):
+        """ Stop receiving events, the iteration ends after the queued
+        events.
+        """
+        if self.bus.remove(self):
+            self.events.put(StopIteration)
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.unsubscribe()
+
+
+class EventBus:
+    """ Publishes the events of the state changes once these are durable. """
+
+    def __init__(self):
+        self.subscriptions: typing.List[EventSubscription] = list()
+
+    def subscribe(
+            self,
+            event_types: typing.Tuple[type, ...] = None,
+            token_network_identifier: typing.TokenNetworkID = None,
+            payment_identifier: typing.PaymentID = None,
+    ) -> EventSubscription:
+        """ Subscribe to the events published from now on, filtered by the
+        given arguments. The payment identifier of the payment events is
+        their `identifier`.
+        """
+        subscription = EventSubscription(
+            bus=self,
+            event_types=event_types,
+            token_network_identifier=token_network_identifier,
+            payment_identifier=payment_identifier,
+        )
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def remove(self, subscription: EventSubscription) -> bool:
+        """ Remove the subscription, returns False if it was already removed. """
+        if subscription not in self.subscriptions:
+            return False
+
+        self.subscriptions.remove(subscription)
+        return True
+
+    def publish(self, events: typing.List[Event]):
+        for subscription in self.subscriptions:
+            for event in events:
+                if subscription.matches(event):
+                    subscription.events.put(event)
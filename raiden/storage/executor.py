@@ -0,0 +1,95 @@
+""" Execution of the storage operations outside of the gevent hub.
+
+The sqlite3 module releases the GIL while SQLite works, but the greenlets only
+run once the call returns to the hub. Running the operations on a native
+thread lets the transport and the alarm task run while the database is
+written or queried.
+"""
+import functools
+import time
+
+import gevent
+import structlog
+from gevent.threadpool import ThreadPool
+
+from raiden.utils.typing import Any, Callable
+
+log = structlog.get_logger(__name__)  # pylint: disable=invalid-name
+
+# A single operation blocking the hub for longer than this is logged
+HUB_BLOCKED_WARNING_THRESHOLD = 0.1
+
+
+class StorageExecutor:
+    """ Run the operations of a storage.
+
+    If `dedicated_thread` is set the operations on the connection used for the
+    writes are run in order on a dedicated thread, and the reads of the
+    read-only connections on the threadpool of the hub, so they run
+    concurrently. Otherwise the operations run on the hub, the time they block
+    it is accounted in `hub_blocked_duration`.
+    """
+
+    def __init__(self, dedicated_thread: bool = False):
+        self.thread_pool = ThreadPool(1) if dedicated_thread else None
+
+        self.hub_blocked_duration = 0.0
+        self.hub_blocked_max_duration = 0.0
+        self.operations = 0
+
+        # Operations called by another operation are only measured once
+        self._depth = 0
+
+    def run(self, func: Callable, *args, **kwargs) -> Any:
+        """ Run `func` on the thread used for the writes. """
+        if self.thread_pool is not None:
+            # Operations called from the thread itself run immediately
+            return self.thread_pool.apply(func, args, kwargs)
+
+        return self._run_on_hub(func, *args, **kwargs)
+
+    def run_concurrently(self, func: Callable, *args, **kwargs) -> Any:
+        """ Run `func` on any thread, for the operations of the connections
+        which are not used by the writer.
+        """
+        if self.thread_pool is not None:
+            return gevent.get_hub().threadpool.apply(func, args, kwargs)
+
+        return self._run_on_hub(func, *args, **kwargs)
+
+    def _run_on_hub(self, func: Callable, *args, **kwargs) -> Any:
+        if self._depth > 0:
+            return func(*args, **kwargs)
+
+        self._depth += 1
+        start = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time.monotonic() - start
+            self._depth -= 1
+
+            self.operations += 1
+            self.hub_blocked_duration += duration
+            self.hub_blocked_max_duration = max(self.hub_blocked_max_duration, duration)
+
+            if duration > HUB_BLOCKED_WARNING_THRESHOLD:
+                log.warning(
+                    'Storage operation blocked the hub',
+                    operation=func.__qualname__,
+                    duration=duration,
+                )
+
+    def close(self):
+        if self.thread_pool is not None:
+            self.thread_pool.kill()
+
+
+def storage_operation(method: Callable) -> Callable:
+    """ Run the storage method with the storage's `executor`. """
+
+    @functools.wraps(method)
+    def run_method(self, *args, **kwargs):
+        return self.executor.run(method, self, *args, **kwargs)
+
+    return run_method
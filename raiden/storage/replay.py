@@ -0,0 +1,143 @@
+""" Decoding of the serialized state changes in worker processes.
+
+The workers are started with `python -m raiden.storage.replay <serializer>`
+and communicate through their standard input and output. Every message is a
+pickled list, prefixed with its length: the parent sends batches of state
+changes as stored in the database, the worker replies with the decoded
+objects of each batch, in the same order.
+"""
+import os
+import pickle
+import struct
+import sys
+from typing import IO
+
+import gevent
+from gevent import subprocess
+from gevent.lock import Semaphore
+from gevent.queue import Queue
+
+from raiden.storage.serialize import SERIALIZERS
+from raiden.storage.sqlite import deserialize_data
+from raiden.utils import is_frozen
+from raiden.utils.typing import Any, Iterator, List, Optional
+
+FRAME_HEADER = struct.Struct('>I')
+
+
+def write_frame(stream: IO[bytes], obj: Any):
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(FRAME_HEADER.pack(len(payload)))
+    stream.write(payload)
+    stream.flush()
+
+
+def read_frame(stream: IO[bytes]) -> Optional[Any]:
+    """ Read the next message, returns None if the stream was closed. """
+    header = stream.read(FRAME_HEADER.size)
+    if not header:
+        return None
+
+    if len(header) != FRAME_HEADER.size:
+        raise EOFError('Incomplete message header')
+
+    length, = FRAME_HEADER.unpack(header)
+    payload = stream.read(length)
+    if len(payload) != length:
+        raise EOFError('Incomplete message')
+
+    return pickle.loads(payload)
+
+
+def can_decode_in_workers() -> bool:
+    # The bundled binary can not run a module with -m, and with a single CPU
+    # the workers only add the cost of transferring the decoded objects
+    return not is_frozen() and (os.cpu_count() or 1) > 1
+
+
+class ParallelDecoder:
+    """ Decode batches of serialized state changes in `workers` processes.
+
+    The batches are sent to the workers round robin and the results are read
+    back in the same order, so the decoded state changes are returned in the
+    order of `batches`. While the caller processes a batch, the workers decode
+    the next ones, at most `max_pending_batches` are in flight to bound the
+    memory usage.
+    """
+
+    def __init__(self, serializer_name: str, workers: int, max_pending_batches: int = None):
+        if workers < 1:
+            raise ValueError('workers must be at least one')
+
+        self.serializer_name = serializer_name
+        self.workers = workers
+        self.max_pending_batches = max_pending_batches or 2 * workers
+
+    def decode(self, batches: Iterator[List[Any]]) -> Iterator[Any]:
+        processes = [
+            subprocess.Popen(
+                [sys.executable, '-m', __name__, self.serializer_name],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            for _ in range(self.workers)
+        ]
+        pending_batches = Semaphore(self.max_pending_batches)
+        # The worker of each batch sent, in order
+        order: Queue = Queue()
+
+        def feed():
+            try:
+                for position, batch in enumerate(batches):
+                    pending_batches.acquire()
+                    process = processes[position % len(processes)]
+                    write_frame(process.stdin, batch)
+                    order.put(process)
+            finally:
+                for process in processes:
+                    process.stdin.close()
+                order.put(StopIteration)
+
+        feeder = gevent.spawn(feed)
+        try:
+            for process in order:
+                decoded = read_frame(process.stdout)
+                if decoded is None:
+                    raise RuntimeError(
+                        f'State change decoding worker exited with {process.wait()}',
+                    )
+                pending_batches.release()
+
+                yield from decoded
+
+            # Re-raise if reading the batches failed
+            feeder.get()
+        finally:
+            feeder.kill()
+            for process in processes:
+                if process.poll() is None:
+                    process.kill()
+                process.wait()
+                process.stdout.close()
+
+
+def worker_main(serializer_name: str):
+    serializer = SERIALIZERS[serializer_name]
+
+    # Anything written to the standard output, e.g. by a logger, would corrupt
+    # the messages, so it is redirected to the standard error.
+    output = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    while True:
+        batch = read_frame(sys.stdin.buffer)
+        if batch is None:
+            break
+
+        write_frame(output, [deserialize_data(serializer, data) for data in batch])
+
+    output.close()
+
+
+if __name__ == '__main__':
+    worker_main(sys.argv[1])
@@ -1,7 +1,10 @@
 import importlib
 import json
+import re
 
-from raiden.utils.typing import Any
+import msgpack
+
+from raiden.utils.typing import Any, Dict, Union
 
 
 def _import_type(type_name):
@@ -38,6 +41,12 @@ def object_hook(data):
 
 class SerializationBase:
     """ Base interface for serialization / deserialization. """
+    name: str = ''
+
+    # Whether the serialized data is bytes, stored in the database as a BLOB,
+    # instead of a string
+    binary: bool = False
+
     @staticmethod
     def serialize(obj: Any):
         raise NotImplementedError
@@ -46,6 +55,14 @@ class SerializationBase:
     def deserialize(data: str):
         raise NotImplementedError
 
+    @staticmethod
+    def serialize_dict(serialized_items: Dict[str, Any]):
+        """ Serialize a dictionary with string keys whose values are already
+        serialized, the result is the same as serializing the dictionary of
+        the original values.
+        """
+        raise NotImplementedError
+
 
 class RaidenJSONEncoder(json.JSONEncoder):
     """ A custom JSON encoder to provide convenience
@@ -74,10 +91,268 @@ class RaidenJSONDecoder(json.JSONDecoder):
 
 
 class JSONSerializer(SerializationBase):
+    name = 'json'
+
     @staticmethod
     def serialize(obj):
         return json.dumps(obj, cls=RaidenJSONEncoder)
 
+    @staticmethod
+    def serialize_dict(serialized_items):
+        items = ', '.join(
+            f'{json.dumps(key)}: {data}'
+            for key, data in serialized_items.items()
+        )
+        return f'{{{items}}}'
+
     @staticmethod
     def deserialize(data):
+        # Data written with the BinarySerializer, the database may contain both
+        if isinstance(data, bytes):
+            return BinarySerializer.deserialize(data)
         return json.loads(data, cls=RaidenJSONDecoder)
+
+
+# Classes which can be encoded by the BinarySerializer with a numeric
+# identifier, the position in this tuple, instead of the full class path. The
+# identifiers are written to the database, so new classes must be appended and
+# classes must not be removed nor reordered. Classes which are not listed here
+# are encoded with their path, as done by the JSONSerializer.
+BINARY_TYPE_REGISTRY = (
+    'raiden.transfer.state.BalanceProofSignedState',
+    'raiden.transfer.state.BalanceProofUnsignedState',
+    'raiden.transfer.state.ChainState',
+    'raiden.transfer.state.HashTimeLockState',
+    'raiden.transfer.state.InitiatorTask',
+    'raiden.transfer.state.MediatorTask',
+    'raiden.transfer.state.MerkleTreeState',
+    'raiden.transfer.state.NettingChannelEndState',
+    'raiden.transfer.state.NettingChannelState',
+    'raiden.transfer.state.PaymentMappingState',
+    'raiden.transfer.state.PaymentNetworkState',
+    'raiden.transfer.state.RouteState',
+    'raiden.transfer.state.TargetTask',
+    'raiden.transfer.state.TokenNetworkGraphState',
+    'raiden.transfer.state.TokenNetworkState',
+    'raiden.transfer.state.TransactionChannelNewBalance',
+    'raiden.transfer.state.TransactionExecutionStatus',
+    'raiden.transfer.state.TransactionOrder',
+    'raiden.transfer.state.UnlockPartialProofState',
+    'raiden.transfer.state.UnlockProofState',
+    'raiden.transfer.state_change.ActionCancelPayment',
+    'raiden.transfer.state_change.ActionCancelTransfer',
+    'raiden.transfer.state_change.ActionChangeNodeNetworkState',
+    'raiden.transfer.state_change.ActionChannelClose',
+    'raiden.transfer.state_change.ActionInitChain',
+    'raiden.transfer.state_change.ActionLeaveAllNetworks',
+    'raiden.transfer.state_change.ActionNewTokenNetwork',
+    'raiden.transfer.state_change.ActionUpdateTransportAuthData',
+    'raiden.transfer.state_change.Block',
+    'raiden.transfer.state_change.ContractReceiveChannelBatchUnlock',
+    'raiden.transfer.state_change.ContractReceiveChannelClosed',
+    'raiden.transfer.state_change.ContractReceiveChannelNew',
+    'raiden.transfer.state_change.ContractReceiveChannelNewBalance',
+    'raiden.transfer.state_change.ContractReceiveChannelSettled',
+    'raiden.transfer.state_change.ContractReceiveNewPaymentNetwork',
+    'raiden.transfer.state_change.ContractReceiveNewTokenNetwork',
+    'raiden.transfer.state_change.ContractReceiveRouteClosed',
+    'raiden.transfer.state_change.ContractReceiveRouteNew',
+    'raiden.transfer.state_change.ContractReceiveSecretReveal',
+    'raiden.transfer.state_change.ContractReceiveUpdateTransfer',
+    'raiden.transfer.state_change.ReceiveDelivered',
+    'raiden.transfer.state_change.ReceiveProcessed',
+    'raiden.transfer.state_change.ReceiveUnlock',
+    'raiden.transfer.events.ContractSendChannelBatchUnlock',
+    'raiden.transfer.events.ContractSendChannelClose',
+    'raiden.transfer.events.ContractSendChannelSettle',
+    'raiden.transfer.events.ContractSendChannelUpdateTransfer',
+    'raiden.transfer.events.ContractSendSecretReveal',
+    'raiden.transfer.events.EventInvalidReceivedLockExpired',
+    'raiden.transfer.events.EventInvalidReceivedLockedTransfer',
+    'raiden.transfer.events.EventInvalidReceivedTransferRefund',
+    'raiden.transfer.events.EventInvalidReceivedUnlock',
+    'raiden.transfer.events.EventPaymentReceivedSuccess',
+    'raiden.transfer.events.EventPaymentSentFailed',
+    'raiden.transfer.events.EventPaymentSentSuccess',
+    'raiden.transfer.events.SendProcessed',
+    'raiden.transfer.mediated_transfer.state.InitiatorPaymentState',
+    'raiden.transfer.mediated_transfer.state.InitiatorTransferState',
+    'raiden.transfer.mediated_transfer.state.LockedTransferSignedState',
+    'raiden.transfer.mediated_transfer.state.LockedTransferUnsignedState',
+    'raiden.transfer.mediated_transfer.state.MediationPairState',
+    'raiden.transfer.mediated_transfer.state.MediatorTransferState',
+    'raiden.transfer.mediated_transfer.state.TargetTransferState',
+    'raiden.transfer.mediated_transfer.state.TransferDescriptionWithSecretState',
+    'raiden.transfer.mediated_transfer.state.WaitingTransferState',
+    'raiden.transfer.mediated_transfer.state_change.ActionInitInitiator',
+    'raiden.transfer.mediated_transfer.state_change.ActionInitMediator',
+    'raiden.transfer.mediated_transfer.state_change.ActionInitTarget',
+    'raiden.transfer.mediated_transfer.state_change.ReceiveLockExpired',
+    'raiden.transfer.mediated_transfer.state_change.ReceiveSecretRequest',
+    'raiden.transfer.mediated_transfer.state_change.ReceiveSecretReveal',
+    'raiden.transfer.mediated_transfer.state_change.ReceiveTransferRefund',
+    'raiden.transfer.mediated_transfer.state_change.ReceiveTransferRefundCancelRoute',
+    'raiden.transfer.mediated_transfer.events.EventUnexpectedSecretReveal',
+    'raiden.transfer.mediated_transfer.events.EventUnlockClaimFailed',
+    'raiden.transfer.mediated_transfer.events.EventUnlockClaimSuccess',
+    'raiden.transfer.mediated_transfer.events.EventUnlockFailed',
+    'raiden.transfer.mediated_transfer.events.EventUnlockSuccess',
+    'raiden.transfer.mediated_transfer.events.SendBalanceProof',
+    'raiden.transfer.mediated_transfer.events.SendLockExpired',
+    'raiden.transfer.mediated_transfer.events.SendLockedTransfer',
+    'raiden.transfer.mediated_transfer.events.SendRefundTransfer',
+    'raiden.transfer.mediated_transfer.events.SendSecretRequest',
+    'raiden.transfer.mediated_transfer.events.SendSecretReveal',
+    'raiden.transfer.queue_identifier.QueueIdentifier',
+)
+BINARY_TYPE_IDS = {
+    type_name: type_id
+    for type_id, type_name in enumerate(BINARY_TYPE_REGISTRY)
+}
+
+# The key can not clash with the keys of `to_dict`, which are strings
+BINARY_TYPE_KEY = b'_'
+
+EXT_HEX = 1
+EXT_BIG_INT = 2
+
+HEX_RE = re.compile('0x(?:[0-9a-f]{2})*')
+MSGPACK_MIN_INT = -2**63
+MSGPACK_MAX_INT = 2**64 - 1
+
+# Caches to avoid the import of the classes on every decoded object
+_binary_type_refs: Dict[type, Union[int, str]] = dict()
+_binary_classes: Dict[Union[int, str], type] = dict()
+
+
+def _binary_type_ref(klass: type) -> Union[int, str]:
+    type_ref = _binary_type_refs.get(klass)
+
+    if type_ref is None:
+        type_name = f'{klass.__module__}.{klass.__name__}'
+        type_ref = BINARY_TYPE_IDS.get(type_name, type_name)
+        _binary_type_refs[klass] = type_ref
+
+    return type_ref
+
+
+def _binary_class(type_ref: Union[int, str]) -> type:
+    klass = _binary_classes.get(type_ref)
+
+    if klass is None:
+        if isinstance(type_ref, int):
+            klass = _import_type(BINARY_TYPE_REGISTRY[type_ref])
+        else:
+            klass = _import_type(type_ref)
+        _binary_classes[type_ref] = klass
+
+    return klass
+
+
+def _binary_encode_value(value):
+    """ Encode the plain values which msgpack can not represent natively or
+    which have a compact binary representation.
+
+    - Lower case hex strings are stored as bytes, these are the hashes,
+      signatures, and secrets serialized by `serialize_bytes`.
+    - Integers which do not fit in 64 bits.
+    - Non string dictionary keys are converted to strings, as done by `json`.
+    """
+    value_type = type(value)
+
+    if value_type is str:
+        if value.startswith('0x') and HEX_RE.fullmatch(value):
+            return msgpack.ExtType(EXT_HEX, bytes.fromhex(value[2:]))
+    elif value_type is int:
+        if not MSGPACK_MIN_INT <= value <= MSGPACK_MAX_INT:
+            length = (value.bit_length() + 8) // 8
+            return msgpack.ExtType(EXT_BIG_INT, value.to_bytes(length, 'big', signed=True))
+    elif value_type is list or value_type is tuple:
+        return [_binary_encode_value(item) for item in value]
+    elif value_type is dict:
+        return {
+            (key if type(key) is str else json.dumps(key)): _binary_encode_value(item)
+            for key, item in value.items()
+        }
+
+    return value
+
+
+def _binary_default(obj):
+    if hasattr(obj, 'to_dict'):
+        result = obj.to_dict()
+        for key, value in result.items():
+            result[key] = _binary_encode_value(value)
+        result[BINARY_TYPE_KEY] = _binary_type_ref(type(obj))
+        return result
+
+    raise TypeError(f'Object of type {type(obj).__name__} is not serializable')
+
+
+def _binary_object_hook(data):
+    type_ref = data.pop(BINARY_TYPE_KEY, None)
+
+    if type_ref is not None:
+        klass = _binary_class(type_ref)
+        if hasattr(klass, 'from_dict'):
+            return klass.from_dict(data)
+        return None
+
+    return data
+
+
+def _binary_ext_hook(code, data):
+    if code == EXT_HEX:
+        return '0x' + data.hex()
+    if code == EXT_BIG_INT:
+        return int.from_bytes(data, 'big', signed=True)
+    return msgpack.ExtType(code, data)
+
+
+class BinarySerializer(SerializationBase):
+    """ Compact binary serializer, based on msgpack.
+
+    Objects are encoded like with the JSONSerializer, as the dictionary
+    returned by `to_dict` plus a type reference, which is the position of the
+    class in `BINARY_TYPE_REGISTRY`. Hex encoded bytes are stored as binary.
+    """
+    name = 'binary'
+    binary = True
+
+    @staticmethod
+    def serialize(obj):
+        return msgpack.packb(
+            _binary_encode_value(obj),
+            default=_binary_default,
+            use_bin_type=True,
+        )
+
+    @staticmethod
+    def serialize_dict(serialized_items):
+        packer = msgpack.Packer(use_bin_type=True)
+        chunks = [packer.pack_map_header(len(serialized_items))]
+
+        for key, data in serialized_items.items():
+            chunks.append(packer.pack(key))
+            chunks.append(data)
+
+        return b''.join(chunks)
+
+    @staticmethod
+    def deserialize(data):
+        # Data written with the JSONSerializer, the database may contain both
+        if isinstance(data, str):
+            return JSONSerializer.deserialize(data)
+
+        return msgpack.unpackb(
+            data,
+            raw=False,
+            object_hook=_binary_object_hook,
+            ext_hook=_binary_ext_hook,
+        )
+
+
+SERIALIZERS = {
+    serializer.name: serializer
+    for serializer in (JSONSerializer, BinarySerializer)
+}
@@ -0,0 +1,268 @@
+import copy
+import hashlib
+import time
+
+from raiden.storage.sqlite import SerializedSQLiteStorage
+from raiden.transfer.architecture import State
+from raiden.transfer.state import ChainState
+from raiden.utils.typing import Any, Callable, Dict, List, Optional
+
+CHAIN_STATE_PART = 'chain'
+TOKEN_NETWORK_PART = 'token_network'
+CHANNEL_PART = 'channel'
+
+SnapshotParts = Dict[str, State]
+
+
+class SnapshotScheduler:
+    """ Decides when the application state must be snapshotted.
+
+    The counters are kept in memory, the only database query is done on
+    startup to seed `pending_state_changes`, the number of state changes
+    logged after the latest snapshot.
+
+    A snapshot is due once any of the configured thresholds is reached:
+
+    - `state_changes_count`: number of state changes since the last snapshot.
+    - `interval`: seconds since the last snapshot, checked only if there is a
+      new state change.
+    - `replay_cost`: estimated seconds it would take to replay the state
+      changes since the last snapshot on a restart. The estimate is the sum of
+      the time it took to log and dispatch these state changes.
+    """
+
+    def __init__(
+            self,
+            state_changes_count: int,
+            interval: Optional[float] = None,
+            replay_cost: Optional[float] = None,
+            pending_state_changes: int = 0,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        if state_changes_count < 1:
+            raise ValueError('state_changes_count must be at least one')
+
+        self.state_changes_count = state_changes_count
+        self.interval = interval
+        self.replay_cost = replay_cost
+        self.clock = clock
+
+        self.pending_state_changes = pending_state_changes
+        self.pending_replay_cost = 0.0
+        self.last_snapshot_time = clock()
+        self.last_snapshot_duration: Optional[float] = None
+
+    def state_change_dispatched(self, duration: float):
+        """ Account for a new state change, which took `duration` seconds to
+        be logged and dispatched.
+        """
+        self.pending_state_changes += 1
+        self.pending_replay_cost += duration
+
+    def should_snapshot(self) -> bool:
+        if self.pending_state_changes == 0:
+            return False
+
+        if self.pending_state_changes >= self.state_changes_count:
+            return True
+
+        interval_elapsed = (
+            self.interval is not None and
+            self.clock() - self.last_snapshot_time >= self.interval
+        )
+        if interval_elapsed:
+            return True
+
+        replay_too_expensive = (
+            self.replay_cost is not None and
+            self.pending_replay_cost >= self.replay_cost
+        )
+        return replay_too_expensive
+
+    def snapshot_done(self, duration: float):
+        """ Reset the counters after a snapshot which took `duration` seconds. """
+        self.pending_state_changes = 0
+        self.pending_replay_cost = 0.0
+        self.last_snapshot_time = self.clock()
+        self.last_snapshot_duration = duration
+
+
+def split_chain_state(chain_state: ChainState) -> SnapshotParts:
+    """ Split the `chain_state` in parts which can be snapshotted
+    independently, one part per token network, one per channel, and the
+    remaining chain state.
+
+    The parts are shallow copies, `chain_state` is not modified.
+    """
+    root = copy.copy(chain_state)
+    root.identifiers_to_paymentnetworks = dict()
+    parts: SnapshotParts = {CHAIN_STATE_PART: root}
+
+    payment_networks = chain_state.identifiers_to_paymentnetworks
+    for payment_network_address, payment_network in payment_networks.items():
+        payment_network_part = copy.copy(payment_network)
+        payment_network_part.tokenidentifiers_to_tokennetworks = dict()
+        payment_network_part.tokenaddresses_to_tokenidentifiers = dict()
+        root.identifiers_to_paymentnetworks[payment_network_address] = payment_network_part
+
+        token_networks = payment_network.tokenidentifiers_to_tokennetworks
+        for token_network_address, token_network in token_networks.items():
+            token_network_part = copy.copy(token_network)
+            token_network_part.channelidentifiers_to_channels = dict()
+
+            key = '/'.join((
+                TOKEN_NETWORK_PART,
+                payment_network_address.hex(),
+                token_network_address.hex(),
+            ))
+            parts[key] = token_network_part
+
+            channels = token_network.channelidentifiers_to_channels
+            for channel_identifier, channel in channels.items():
+                key = '/'.join((
+                    CHANNEL_PART,
+                    token_network_address.hex(),
+                    str(channel_identifier),
+                ))
+                parts[key] = channel
+
+    return parts
+
+
+def join_chain_state(parts: SnapshotParts) -> ChainState:
+    """ Inverse of `split_chain_state`.
+
+    The containers of the parts are modified in place, so `parts` must not be
+    used afterwards.
+    """
+    chain_state = parts[CHAIN_STATE_PART]
+    token_networks = dict()
+
+    for key, part in parts.items():
+        kind, _, identifiers = key.partition('/')
+        if kind == TOKEN_NETWORK_PART:
+            payment_network_address, _, _ = identifiers.partition('/')
+            payment_network = chain_state.identifiers_to_paymentnetworks[
+                bytes.fromhex(payment_network_address)
+            ]
+            payment_network.tokenidentifiers_to_tokennetworks[part.address] = part
+            payment_network.tokenaddresses_to_tokenidentifiers[part.token_address] = part.address
+            token_networks[part.address] = part
+
+    for key, part in parts.items():
+        kind, _, identifiers = key.partition('/')
+        if kind == CHANNEL_PART:
+            token_network_address, _, channel_identifier = identifiers.partition('/')
+            token_network = token_networks[bytes.fromhex(token_network_address)]
+            token_network.channelidentifiers_to_channels[int(channel_identifier)] = part
+
+    return chain_state
+
+
+def apply_snapshot_deltas(chain_state: ChainState, deltas: List[Dict[str, Any]]) -> ChainState:
+    """ Rebuild the chain state from a base snapshot and the deltas written
+    after it. A delta maps the key of each changed part to its new value, or
+    to None if the part was removed.
+    """
+    parts = split_chain_state(chain_state)
+
+    for delta in deltas:
+        for key, part in delta.items():
+            if part is None:
+                parts.pop(key, None)
+            else:
+                parts[key] = part
+
+    return join_chain_state(parts)
+
+
+class SnapshotWriter:
+    """ Writes the state snapshots, either in full or as deltas.
+
+    A full snapshot is written every `full_snapshot_interval` snapshots, the
+    ones in between only contain the parts of the chain state (token networks,
+    channels and the remaining chain state) which changed since the previous
+    snapshot.
+
+    The changed parts are found by comparing the digests of their
+    serialization with the ones of the previous snapshot. A channel which is
+    the same object as in the previous snapshot, e.g. because it was shared by
+    the copy-on-write state manager, is not serialized again. The
+    serializations computed for the digests are written as the delta.
+
+    The first snapshot written by a new instance is always a full snapshot.
+    """
+
+    def __init__(self, storage: SerializedSQLiteStorage, full_snapshot_interval: int = 1):
+        if full_snapshot_interval < 1:
+            raise ValueError('full_snapshot_interval must be at least one')
+
+        self.storage = storage
+        self.full_snapshot_interval = full_snapshot_interval
+
+        self.base_snapshot_id: Optional[int] = None
+        self.deltas_since_base_snapshot = 0
+        self.parts_digests: Dict[str, bytes] = dict()
+        # The channels of the previous snapshot. The token networks and the
+        # chain state are copied by `split_chain_state`, they are never the
+        # same object.
+        self.channels: SnapshotParts = dict()
+
+    def write(self, state_change_id: int, state: State):
+        deltas_disabled = (
+            self.full_snapshot_interval == 1 or
+            not isinstance(state, ChainState)
+        )
+        if deltas_disabled:
+            self.storage.write_state_snapshot(state_change_id, state)
+            return
+
+        serializer = self.storage.serializer
+        parts = split_chain_state(state)
+        parts_digests: Dict[str, bytes] = dict()
+        serialized_parts: Dict[str, Any] = dict()
+        channels: SnapshotParts = dict()
+
+        for key, part in parts.items():
+            if key.startswith(f'{CHANNEL_PART}/'):
+                channels[key] = part
+
+            if part is self.channels.get(key):
+                parts_digests[key] = self.parts_digests[key]
+            else:
+                data = serializer.serialize(part)
+                serialized_parts[key] = data
+                parts_digests[key] = self._digest(data)
+
+        full_snapshot_due = (
+            self.base_snapshot_id is None or
+            self.deltas_since_base_snapshot + 1 >= self.full_snapshot_interval
+        )
+        if full_snapshot_due:
+            self.base_snapshot_id = self.storage.write_state_snapshot(state_change_id, state)
+            self.deltas_since_base_snapshot = 0
+        else:
+            serialized_delta = {
+                key: data
+                for key, data in serialized_parts.items()
+                if self.parts_digests.get(key) != parts_digests[key]
+            }
+            removed_parts = self.parts_digests.keys() - parts_digests.keys()
+            if removed_parts:
+                serialized_removed_part = serializer.serialize(None)
+                serialized_delta.update({key: serialized_removed_part for key in removed_parts})
+            self.storage.write_serialized_state_snapshot_delta(
+                state_change_id,
+                self.base_snapshot_id,
+                serialized_delta,
+            )
+            self.deltas_since_base_snapshot += 1
+
+        self.parts_digests = parts_digests
+        self.channels = channels
+
+    @staticmethod
+    def _digest(data) -> bytes:
+        if isinstance(data, str):
+            data = data.encode()
+        return hashlib.sha256(data).digest()
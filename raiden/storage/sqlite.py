@@ -1,17 +1,62 @@
+import hashlib
+import itertools
+import queue
 import sqlite3
 import threading
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from eth_utils import to_checksum_address
 
 from raiden.constants import SQLITE_MIN_REQUIRED_VERSION
 from raiden.exceptions import InvalidDBData, InvalidNumberInput
-from raiden.storage.utils import DB_SCRIPT_CREATE_TABLES, TimestampedEvent
+from raiden.storage.utils import (
+    DB_SCRIPT_CREATE_ARCHIVE_TABLES,
+    DB_SCRIPT_CREATE_ARCHIVE_VIEWS,
+    DB_SCRIPT_CREATE_TABLES,
+    TimestampedEvent,
+)
 from raiden.utils import get_system_spec
-from raiden.utils.typing import Any, Dict, NamedTuple, Optional, Tuple
+from raiden.utils.typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
-from .serialize import SerializationBase
+from .compression import CODECS as COMPRESSION_CODECS, compress, decompress
+from .executor import StorageExecutor, storage_operation
+from .serialize import JSONSerializer, SerializationBase
 
 # The latest DB version
-RAIDEN_DB_VERSION = 18
+RAIDEN_DB_VERSION = 20
+
+# Number of rows read per query by the `iterate_*` methods
+ITERATION_BATCH_SIZE = 1000
+
+# Tables with a `data` column written by the serializer
+SERIALIZED_DATA_TABLES = (
+    'state_changes',
+    'state_events',
+    'state_snapshot',
+    'state_snapshot_delta',
+)
+
+# Balance proof fields copied to the indexed lookup tables. The values are
+# stored with the same representation used by the serialized data, so the
+# filters of the `get_latest_*_by_data_field` queries can be used as is.
+BALANCE_PROOF_LOOKUP_FIELDS = (
+    'chain_id',
+    'token_network_identifier',
+    'channel_identifier',
+    'balance_hash',
+    'locksroot',
+    'sender',
+)
+
+# The payment events indexed by the payment_history table, with the attribute
+# holding the partner of the payment. The classes are referenced by name, the
+# transfer module depends on the storage.
+PAYMENT_HISTORY_EVENTS = {
+    'EventPaymentSentSuccess': 'target',
+    'EventPaymentSentFailed': 'target',
+    'EventPaymentReceivedSuccess': 'initiator',
+}
 
 
 class EventRecord(NamedTuple):
@@ -31,30 +76,156 @@ class SnapshotRecord(NamedTuple):
     data: Any
 
 
+class PaymentHistoryRecord(NamedTuple):
+    event_identifier: int
+    data: Any
+    log_time: str
+
+
+class ArchivedRows(NamedTuple):
+    state_changes: int
+    events: int
+    snapshots: int
+
+
+def _fetch_all(conn: sqlite3.Connection, sql: str, params: Tuple) -> List[Tuple]:
+    return conn.execute(sql, params).fetchall()
+
+
 def assert_sqlite_version() -> bool:
     if sqlite3.sqlite_version_info < SQLITE_MIN_REQUIRED_VERSION:
         return False
     return True
 
 
+def balance_proof_lookup_filters(filters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """ Map the `filters` to the columns of the balance proof lookup tables.
+
+    Returns None if any of the filters is not on an indexed balance proof
+    field, in which case the lookup tables can not be used.
+    """
+    columns = dict()
+    for field, value in filters.items():
+        prefix, _, name = field.partition('.')
+        if prefix != 'balance_proof' or name not in BALANCE_PROOF_LOOKUP_FIELDS:
+            return None
+        columns[name] = value
+
+    return columns or None
+
+
+class ReadConnectionPool:
+    """ Read-only connections to a database in the WAL journal mode, these
+    read the database while it is written by another connection.
+
+    A connection is used by a single reader at a time, in a read transaction,
+    so all the queries of the reader see the database as of the last commit
+    before its first query, and the commits done in the meantime are not
+    visible.
+    """
+
+    def __init__(self, database_path: str, size: int):
+        self.uri = Path(database_path).absolute().as_uri()
+        self.connections = [self._connect(self.uri) for _ in range(size)]
+        self.idle_connections: queue.Queue = queue.Queue()
+
+        for conn in self.connections:
+            self.idle_connections.put(conn)
+
+    @staticmethod
+    def _connect(uri: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f'{uri}?mode=ro',
+            uri=True,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # The transactions are explicit, see `connection`
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.text_factory = str
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """ Wait for an idle connection and open a read transaction. """
+        conn = self.idle_connections.get()
+        try:
+            conn.execute('BEGIN')
+            try:
+                yield conn
+            finally:
+                conn.execute('COMMIT')
+        finally:
+            self.idle_connections.put(conn)
+
+    def attach_archive(self, archive_uri: str):
+        # Wait for all the readers to finish
+        connections = [self.idle_connections.get() for _ in self.connections]
+
+        try:
+            for conn in connections:
+                conn.execute('ATTACH DATABASE ? AS archive', (f'{archive_uri}?mode=ro', ))
+                conn.executescript(DB_SCRIPT_CREATE_ARCHIVE_VIEWS)
+        finally:
+            for conn in connections:
+                self.idle_connections.put(conn)
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+
+
 class SQLiteStorage(SerializationBase):
-    def __init__(self, database_path):
-        conn = sqlite3.connect(database_path, detect_types=sqlite3.PARSE_DECLTYPES)
+    """ Storage of the serialized data.
+
+    If `read_connections` is greater than zero, the history queries of the API
+    use a `ReadConnectionPool` of that size instead of the connection used for
+    the writes, and the database is switched to the WAL journal mode. This is
+    ignored for in-memory databases.
+
+    The queries run with `executor`, which by default runs them on the hub.
+    """
+
+    def __init__(
+            self,
+            database_path,
+            read_connections: int = 0,
+            executor: StorageExecutor = None,
+    ):
+        conn = sqlite3.connect(
+            database_path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # The executor may use another thread, it runs one query at a time
+            check_same_thread=False,
+        )
         conn.text_factory = str
         conn.execute('PRAGMA foreign_keys=ON')
 
-        # Skip the acquire/release cycle for the exclusive write lock.
-        # References:
-        # https://sqlite.org/atomiccommit.html#_exclusive_access_mode
-        # https://sqlite.org/pragma.html#pragma_locking_mode
-        conn.execute('PRAGMA locking_mode=EXCLUSIVE')
+        # An in-memory database is private to its connection
+        use_read_pool = read_connections > 0 and database_path != ':memory:'
+
+        if use_read_pool:
+            # The readers don't block the writer and see the database as of
+            # the start of their transaction.
+            # References:
+            # https://sqlite.org/wal.html
+            journal_mode = 'WAL'
+        else:
+            # Skip the acquire/release cycle for the exclusive write lock,
+            # this also prevents any other connection from reading.
+            # References:
+            # https://sqlite.org/atomiccommit.html#_exclusive_access_mode
+            # https://sqlite.org/pragma.html#pragma_locking_mode
+            conn.execute('PRAGMA locking_mode=EXCLUSIVE')
+
+            # Keep the journal around and skip inode updates.
+            # References:
+            # https://sqlite.org/atomiccommit.html#_persistent_rollback_journals
+            # https://sqlite.org/pragma.html#pragma_journal_mode
+            journal_mode = 'PERSIST'
 
-        # Keep the journal around and skip inode updates.
-        # References:
-        # https://sqlite.org/atomiccommit.html#_persistent_rollback_journals
-        # https://sqlite.org/pragma.html#pragma_journal_mode
         try:
-            conn.execute('PRAGMA journal_mode=PERSIST')
+            conn.execute(f'PRAGMA journal_mode={journal_mode}')
         except sqlite3.DatabaseError:
             raise InvalidDBData(
                 f'Existing DB {database_path} was found to be corrupt at Raiden startup. '
@@ -77,10 +248,18 @@ class SQLiteStorage(SerializationBase):
         # Improve on this and find a better way to protect against this potential race
         # condition.
         self.conn = conn
+        self.executor = executor or StorageExecutor()
         self.write_lock = threading.Lock()
         self.in_transaction = False
+        self.archive_attached = False
         self.update_version()
 
+        # Opened once the tables exist
+        self.read_pool: Optional[ReadConnectionPool] = None
+        if use_read_pool:
+            self.read_pool = ReadConnectionPool(database_path, read_connections)
+
+    @storage_operation
     def update_version(self):
         cursor = self.conn.cursor()
         cursor.execute(
@@ -89,6 +268,7 @@ class SQLiteStorage(SerializationBase):
         )
         self.maybe_commit()
 
+    @storage_operation
     def log_run(self):
         """ Log timestamp and raiden version to help with debugging """
         version = get_system_spec()['raiden']
@@ -96,6 +276,7 @@ class SQLiteStorage(SerializationBase):
         cursor.execute('INSERT INTO runs(raiden_version) VALUES (?)', [version])
         self.maybe_commit()
 
+    @storage_operation
     def get_version(self) -> int:
         cursor = self.conn.cursor()
         query = cursor.execute(
@@ -108,6 +289,30 @@ class SQLiteStorage(SerializationBase):
 
         return int(query[0][0])
 
+    @storage_operation
+    def get_serialization_format(self) -> str:
+        """ Return the name of the serializer used to write the data, only
+        JSON was supported before this setting was introduced.
+        """
+        cursor = self.conn.execute(
+            'SELECT value FROM settings WHERE name=?;', ('serialization_format',),
+        )
+        row = cursor.fetchone()
+
+        if row is None:
+            return JSONSerializer.name
+
+        return row[0]
+
+    @storage_operation
+    def set_serialization_format(self, serialization_format: str):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO settings(name, value) VALUES(?, ?)',
+            ('serialization_format', serialization_format),
+        )
+        self.maybe_commit()
+
+    @storage_operation
     def count_state_changes(self) -> int:
         cursor = self.conn.cursor()
         query = cursor.execute('SELECT COUNT(1) FROM state_changes')
@@ -118,18 +323,87 @@ class SQLiteStorage(SerializationBase):
 
         return int(query[0][0])
 
-    def write_state_change(self, state_change, log_time):
-        with self.write_lock, self.conn:
+    @storage_operation
+    def count_state_changes_in_range(self, from_identifier: int, to_identifier) -> int:
+        """ Return the number of state changes returned by
+        `get_statechanges_by_identifier` for the same range.
+        """
+        to_identifier = self._resolve_state_change_identifier(to_identifier)
+        cursor = self.conn.execute(
+            'SELECT COUNT(1) FROM state_changes WHERE identifier BETWEEN ? AND ?',
+            (from_identifier, to_identifier),
+        )
+        return int(cursor.fetchone()[0])
+
+    @storage_operation
+    def count_state_changes_since_latest_snapshot(self) -> int:
+        """ Return the number of state changes which would be replayed on
+        top of the latest snapshot.
+        """
+        cursor = self.conn.execute(
+            'SELECT COUNT(1) FROM state_changes WHERE identifier > ('
+            '    SELECT COALESCE(MAX(statechange_id), 0) FROM ('
+            '        SELECT statechange_id FROM state_snapshot UNION ALL'
+            '        SELECT statechange_id FROM state_snapshot_delta'
+            '    )'
+            ')',
+        )
+        return int(cursor.fetchone()[0])
+
+    @storage_operation
+    def get_state_changes_fingerprint(self) -> Tuple[int, bytes]:
+        """ Return the identifier of the latest state change and the digest of
+        its data, a state restored from the state changes is outdated once
+        these change.
+        """
+        cursor = self.conn.execute(
+            'SELECT identifier, data FROM state_changes ORDER BY identifier DESC LIMIT 1',
+        )
+        row = cursor.fetchone()
+
+        if row is None:
+            return 0, b''
+
+        identifier, data = row
+        if isinstance(data, str):
+            data = data.encode()
+
+        return identifier, hashlib.sha256(data).digest()
+
+    @storage_operation
+    def write_state_change(
+            self,
+            state_change,
+            log_time,
+            balance_proof: Optional[Dict[str, Any]] = None,
+    ):
+        """ Save a state change.
+
+        Args:
+            state_change: The serialized state change.
+            balance_proof: The `BALANCE_PROOF_LOOKUP_FIELDS` of the balance
+                proof contained in the state change, if any.
+        """
+        with self._write_transaction():
             cursor = self.conn.execute(
                 'INSERT INTO state_changes(identifier, data, log_time) VALUES(null, ?, ?)',
                 (state_change, log_time),
             )
             last_id = cursor.lastrowid
 
+            if balance_proof is not None:
+                self._write_balance_proof(
+                    'state_changes_balance_proofs',
+                    'state_change_identifier',
+                    last_id,
+                    balance_proof,
+                )
+
         return last_id
 
+    @storage_operation
     def write_state_snapshot(self, statechange_id, snapshot):
-        with self.write_lock, self.conn:
+        with self._write_transaction():
             cursor = self.conn.execute(
                 'INSERT INTO state_snapshot(statechange_id, data) VALUES(?, ?)',
                 (statechange_id, snapshot),
@@ -138,21 +412,92 @@ class SQLiteStorage(SerializationBase):
 
         return last_id
 
-    def write_events(self, state_change_identifier, events, log_time):
+    @storage_operation
+    def write_state_snapshot_delta(self, statechange_id, base_snapshot_id, delta):
+        with self._write_transaction():
+            cursor = self.conn.execute(
+                'INSERT INTO state_snapshot_delta(statechange_id, base_snapshot_id, data) '
+                'VALUES(?, ?, ?)',
+                (statechange_id, base_snapshot_id, delta),
+            )
+            last_id = cursor.lastrowid
+
+        return last_id
+
+    @storage_operation
+    def write_events(
+            self,
+            state_change_identifier,
+            events,
+            log_time,
+            balance_proofs=None,
+            payments=None,
+    ):
         """ Save events.
 
         Args:
             state_change_identifier: Id of the state change that generate these events.
             events: List of Event objects.
+            balance_proofs: Optional list with the `BALANCE_PROOF_LOOKUP_FIELDS`
+                of the balance proof contained in the event at the same
+                position, or None if the event has no balance proof.
+            payments: Optional list with the `payment_history` columns of the
+                event at the same position, or None if it is not a payment.
         """
-        with self.write_lock, self.conn:
-            self.conn.executemany(
-                'INSERT INTO state_events('
-                '   identifier, source_statechange_id, log_time, data'
-                ') VALUES(?, ?, ?, ?)',
-                events,
-            )
+        sql = (
+            'INSERT INTO state_events('
+            '   identifier, source_statechange_id, log_time, data'
+            ') VALUES(?, ?, ?, ?)'
+        )
+        with self._write_transaction():
+            if balance_proofs is None and payments is None:
+                self.conn.executemany(sql, events)
+            else:
+                # The event identifiers are necessary for the lookup tables
+                rows = zip(
+                    events,
+                    balance_proofs or itertools.repeat(None),
+                    payments or itertools.repeat(None),
+                )
+                for event, balance_proof, payment in rows:
+                    cursor = self.conn.execute(sql, event)
+
+                    if balance_proof is not None:
+                        self._write_balance_proof(
+                            'state_events_balance_proofs',
+                            'event_identifier',
+                            cursor.lastrowid,
+                            balance_proof,
+                        )
+
+                    if payment is not None:
+                        self._write_payment(cursor.lastrowid, log_time, payment)
+
+    def _write_balance_proof(self, table, identifier_column, identifier, balance_proof):
+        columns = ', '.join(BALANCE_PROOF_LOOKUP_FIELDS)
+        placeholders = ', '.join('?' for _ in BALANCE_PROOF_LOOKUP_FIELDS)
+        values = [balance_proof.get(field) for field in BALANCE_PROOF_LOOKUP_FIELDS]
+
+        self.conn.execute(
+            f'INSERT INTO {table}({identifier_column}, {columns}) VALUES(?, {placeholders})',
+            [identifier] + values,
+        )
+
+    def _write_payment(self, event_identifier, log_time, payment):
+        self.conn.execute(
+            'INSERT INTO payment_history('
+            '    event_identifier, event_type, token_network_identifier, partner, log_time'
+            ') VALUES(?, ?, ?, ?, ?)',
+            (
+                event_identifier,
+                payment['event_type'],
+                payment['token_network_identifier'],
+                payment['partner'],
+                log_time,
+            ),
+        )
 
+    @storage_operation
     def get_latest_state_snapshot(self) -> Optional[Tuple[int, Any]]:
         """ Return the tuple of (last_applied_state_change_id, snapshot) or None"""
         cursor = self.conn.execute(
@@ -168,26 +513,16 @@ class SQLiteStorage(SerializationBase):
 
         return None
 
+    @storage_operation
     def get_snapshot_closest_to_state_change(
             self,
             state_change_identifier: int,
     ) -> Tuple[int, Any]:
         """ Get snapshots earlier than state_change with provided ID. """
 
-        if not (state_change_identifier == 'latest' or isinstance(state_change_identifier, int)):
-            raise ValueError("from_identifier must be an integer or 'latest'")
-
-        cursor = self.conn.cursor()
-        if state_change_identifier == 'latest':
-            cursor.execute(
-                'SELECT identifier FROM state_changes ORDER BY identifier DESC LIMIT 1',
-            )
-            result = cursor.fetchone()
-
-            if result:
-                state_change_identifier = result[0]
-            else:
-                state_change_identifier = 0
+        state_change_identifier = self._resolve_state_change_identifier(
+            state_change_identifier,
+        )
 
         cursor = self.conn.execute(
             'SELECT statechange_id, data FROM state_snapshot '
@@ -207,6 +542,49 @@ class SQLiteStorage(SerializationBase):
 
         return result
 
+    @storage_operation
+    def get_snapshot_deltas_closest_to_state_change(
+            self,
+            state_change_identifier: int,
+    ) -> List[Tuple[int, Any]]:
+        """ Get the deltas to be applied on top of the snapshot returned by
+        `get_snapshot_closest_to_state_change`, in the order they were written.
+
+        Returns a list of (last_applied_state_change_id, delta) tuples.
+        """
+        state_change_identifier = self._resolve_state_change_identifier(
+            state_change_identifier,
+        )
+
+        cursor = self.conn.execute(
+            'SELECT statechange_id, data FROM state_snapshot_delta '
+            'WHERE base_snapshot_id = ('
+            '    SELECT identifier FROM state_snapshot WHERE statechange_id <= ? '
+            '    ORDER BY identifier DESC LIMIT 1'
+            ') AND statechange_id <= ? '
+            'ORDER BY identifier ASC',
+            (state_change_identifier, state_change_identifier),
+        )
+        return cursor.fetchall()
+
+    def _resolve_state_change_identifier(self, state_change_identifier) -> int:
+        if not (state_change_identifier == 'latest' or isinstance(state_change_identifier, int)):
+            raise ValueError("from_identifier must be an integer or 'latest'")
+
+        if state_change_identifier == 'latest':
+            cursor = self.conn.execute(
+                'SELECT identifier FROM state_changes ORDER BY identifier DESC LIMIT 1',
+            )
+            result = cursor.fetchone()
+
+            if result:
+                state_change_identifier = result[0]
+            else:
+                state_change_identifier = 0
+
+        return state_change_identifier
+
+    @storage_operation
     def get_latest_event_by_data_field(
             self,
             filters: Dict[str, Any],
@@ -214,19 +592,31 @@ class SQLiteStorage(SerializationBase):
         """ Return all state changes filtered by a named field and value."""
         cursor = self.conn.cursor()
 
-        where_clauses = []
-        args = []
-        for field, value in filters.items():
-            where_clauses.append('json_extract(data, ?)=?')
-            args.append(f'$.{field}')
-            args.append(value)
+        lookup_filters = balance_proof_lookup_filters(filters)
+        if lookup_filters is not None:
+            where = ' AND '.join(f'bp.{column}=?' for column in lookup_filters)
+            cursor.execute(
+                'SELECT e.identifier, e.source_statechange_id, e.data '
+                'FROM state_events_balance_proofs AS bp '
+                'JOIN state_events AS e ON e.identifier = bp.event_identifier '
+                f'WHERE {where} '
+                'ORDER BY bp.event_identifier DESC LIMIT 1',
+                list(lookup_filters.values()),
+            )
+        else:
+            where_clauses = []
+            args = []
+            for field, value in filters.items():
+                where_clauses.append('json_extract(data, ?)=?')
+                args.append(f'$.{field}')
+                args.append(value)
 
-        cursor.execute(
-            "SELECT identifier, source_statechange_id, data FROM state_events WHERE "
-            f"{' AND '.join(where_clauses)}"
-            "ORDER BY identifier DESC LIMIT 1",
-            args,
-        )
+            cursor.execute(
+                "SELECT identifier, source_statechange_id, data FROM state_events WHERE "
+                f"{' AND '.join(where_clauses)}"
+                "ORDER BY identifier DESC LIMIT 1",
+                args,
+            )
 
         result = EventRecord(
             event_identifier=0,
@@ -251,6 +641,7 @@ class SQLiteStorage(SerializationBase):
 
         return result
 
+    @storage_operation
     def get_latest_state_change_by_data_field(
             self,
             filters: Dict[str, str],
@@ -258,21 +649,34 @@ class SQLiteStorage(SerializationBase):
         """ Return all state changes filtered by a named field and value."""
         cursor = self.conn.cursor()
 
-        where_clauses = []
-        args = []
-        for field, value in filters.items():
-            where_clauses.append('json_extract(data, ?)=?')
-            args.append(f'$.{field}')
-            args.append(value)
-
-        where = ' AND '.join(where_clauses)
-        sql = (
-            f'SELECT identifier, data '
-            f'FROM state_changes '
-            f'WHERE {where} '
-            f'ORDER BY identifier '
-            f'DESC LIMIT 1'
-        )
+        lookup_filters = balance_proof_lookup_filters(filters)
+        if lookup_filters is not None:
+            where = ' AND '.join(f'bp.{column}=?' for column in lookup_filters)
+            sql = (
+                f'SELECT sc.identifier, sc.data '
+                f'FROM state_changes_balance_proofs AS bp '
+                f'JOIN state_changes AS sc ON sc.identifier = bp.state_change_identifier '
+                f'WHERE {where} '
+                f'ORDER BY bp.state_change_identifier '
+                f'DESC LIMIT 1'
+            )
+            args = list(lookup_filters.values())
+        else:
+            where_clauses = []
+            args = []
+            for field, value in filters.items():
+                where_clauses.append('json_extract(data, ?)=?')
+                args.append(f'$.{field}')
+                args.append(value)
+
+            where = ' AND '.join(where_clauses)
+            sql = (
+                f'SELECT identifier, data '
+                f'FROM state_changes '
+                f'WHERE {where} '
+                f'ORDER BY identifier '
+                f'DESC LIMIT 1'
+            )
         cursor.execute(sql, args)
 
         result = StateChangeRecord(state_change_identifier=0, data=None)
@@ -293,75 +697,266 @@ class SQLiteStorage(SerializationBase):
         return result
 
     def get_statechanges_by_identifier(self, from_identifier, to_identifier):
+        return list(self.iterate_statechanges_by_identifier(from_identifier, to_identifier))
+
+    def iterate_statechanges_by_identifier(
+            self,
+            from_identifier,
+            to_identifier,
+            batch_size: int = ITERATION_BATCH_SIZE,
+    ) -> Iterator[Any]:
+        """ Iterate over the state changes in the given range, both ends are
+        inclusive.
+
+        The rows are read in batches of `batch_size`, each with its own query,
+        so only one batch is held in memory at a time.
+        """
+        batches = self.iterate_statechanges_batches_by_identifier(
+            from_identifier,
+            to_identifier,
+            batch_size,
+        )
+        return itertools.chain.from_iterable(batches)
+
+    def iterate_statechanges_batches_by_identifier(
+            self,
+            from_identifier,
+            to_identifier,
+            batch_size: int = ITERATION_BATCH_SIZE,
+    ) -> Iterator[List[Any]]:
+        """ Same as `iterate_statechanges_by_identifier`, but the state
+        changes are returned in lists of up to `batch_size` elements, as they
+        are stored in the database. The data is not deserialized, even by
+        `SerializedSQLiteStorage`.
+        """
         if not (from_identifier == 'latest' or isinstance(from_identifier, int)):
             raise ValueError("from_identifier must be an integer or 'latest'")
 
         if not (to_identifier == 'latest' or isinstance(to_identifier, int)):
             raise ValueError("to_identifier must be an integer or 'latest'")
 
-        cursor = self.conn.cursor()
-
         if from_identifier == 'latest':
             assert to_identifier is None
-
-            cursor.execute(
-                'SELECT identifier FROM state_changes ORDER BY identifier DESC LIMIT 1',
-            )
-            from_identifier = cursor.fetchone()
+            from_identifier = self._resolve_state_change_identifier(from_identifier)
 
         if to_identifier == 'latest':
-            cursor.execute(
-                'SELECT data FROM state_changes WHERE identifier >= ? ORDER BY identifier ASC',
-                (from_identifier,),
+            sql = (
+                'SELECT identifier, data FROM state_changes '
+                'WHERE identifier > ? ORDER BY identifier ASC LIMIT ? OFFSET ?'
             )
+            args: Tuple = ()
         else:
-            cursor.execute(
-                'SELECT data FROM state_changes WHERE identifier '
-                'BETWEEN ? AND ? ORDER BY identifier ASC', (from_identifier, to_identifier),
+            sql = (
+                'SELECT identifier, data FROM state_changes '
+                'WHERE identifier > ? AND identifier <= ? '
+                'ORDER BY identifier ASC LIMIT ? OFFSET ?'
             )
+            args = (to_identifier, )
 
-        try:
-            result = [entry[0] for entry in cursor.fetchall()]
-        except AttributeError:
-            raise InvalidDBData(
-                'Your local database is corrupt. Bailing ...',
-            )
+        batches = self._iterate_batches(sql, from_identifier - 1, args, batch_size)
+        return ([row[0] for row in batch] for batch in batches)
 
-        return result
+    def _iterate_batches(
+            self,
+            sql: str,
+            last_identifier: int,
+            args: Tuple,
+            batch_size: int,
+            offset: int = 0,
+            history: bool = False,
+    ) -> Iterator[List[Tuple]]:
+        """ Run the keyset paginated query `sql` until there are no more rows.
+
+        The parameters of `sql` are the last identifier of the previous batch,
+        followed by `args`, the batch size, and the offset. The identifier
+        must be the first column of the result, only the remaining columns
+        are returned. `offset` is applied to the first batch only.
+
+        If `history` is set the query may run on a connection of the
+        `read_pool`, which is held until the iteration is done.
+        """
+        with self._history_connection() if history else nullcontext(self.conn) as conn:
+            if conn is self.conn:
+                run = self.executor.run
+            else:
+                run = self.executor.run_concurrently
+
+            while True:
+                params = (last_identifier, ) + args + (batch_size, offset)
+                rows = run(_fetch_all, conn, sql, params)
 
-    def _query_events(self, limit: int = None, offset: int = None):
+                if rows:
+                    yield [row[1:] for row in rows]
+
+                if not rows or len(rows) < batch_size:
+                    return
+
+                last_identifier = rows[-1][0]
+                offset = 0
+
+    @contextmanager
+    def _history_connection(self) -> Iterator[sqlite3.Connection]:
+        """ Connection for the queries which only read the committed
+        history. The writes of an explicit transaction are not visible until
+        it is committed, if the read pool is used.
+        """
+        if self.read_pool is None:
+            yield self.conn
+        else:
+            with self.read_pool.connection() as conn:
+                yield conn
+
+    def _iterate_page(
+            self,
+            sql: str,
+            last_identifier: int,
+            args: Tuple,
+            limit: Optional[int],
+            offset: Optional[int],
+            batch_size: int,
+    ) -> Iterator[Tuple]:
+        """ Return the rows of the keyset paginated query `sql` on the
+        history, see `_iterate_batches`, skipping the first `offset` rows and
+        stopping after `limit` rows.
+        """
         if limit is not None and (not isinstance(limit, int) or limit < 0):
             raise InvalidNumberInput('limit must be a positive integer')
 
         if offset is not None and (not isinstance(offset, int) or offset < 0):
             raise InvalidNumberInput('offset must be a positive integer')
 
-        limit = -1 if limit is None else limit
         offset = 0 if offset is None else offset
 
-        cursor = self.conn.cursor()
+        if limit is not None:
+            batch_size = min(batch_size, limit)
 
-        cursor.execute(
-            '''
-            SELECT data, log_time FROM state_events
-                ORDER BY identifier ASC LIMIT ? OFFSET ?
-            ''',
-            (limit, offset),
+        batches = self._iterate_batches(
+            sql,
+            last_identifier,
+            args,
+            batch_size,
+            offset,
+            history=True,
         )
+        rows = itertools.chain.from_iterable(batches)
 
-        return cursor.fetchall()
+        if limit is not None:
+            rows = itertools.islice(rows, limit)
+
+        return rows
+
+    def _query_events(
+            self,
+            limit: int = None,
+            offset: int = None,
+            batch_size: int = ITERATION_BATCH_SIZE,
+    ) -> Iterator[Tuple]:
+        # The archived events are part of the history
+        table = 'all_state_events' if self.archive_attached else 'state_events'
+        sql = (
+            f'SELECT identifier, data, log_time FROM {table} '
+            f'WHERE identifier > ? ORDER BY identifier ASC LIMIT ? OFFSET ?'
+        )
+        return self._iterate_page(sql, 0, (), limit, offset, batch_size)
 
     def get_events_with_timestamps(self, limit: int = None, offset: int = None):
-        entries = self._query_events(limit, offset)
-        return [
+        return list(self.iterate_events_with_timestamps(limit, offset))
+
+    def iterate_events_with_timestamps(
+            self,
+            limit: int = None,
+            offset: int = None,
+            batch_size: int = ITERATION_BATCH_SIZE,
+    ) -> Iterator[TimestampedEvent]:
+        """ Iterate over the events, reading them in batches of `batch_size`. """
+        entries = self._query_events(limit, offset, batch_size)
+        return (
             TimestampedEvent(entry[0], entry[1])
             for entry in entries
-        ]
+        )
 
     def get_events(self, limit: int = None, offset: int = None):
-        entries = self._query_events(limit, offset)
-        return [entry[0] for entry in entries]
+        return list(self.iterate_events(limit, offset))
+
+    def iterate_events(
+            self,
+            limit: int = None,
+            offset: int = None,
+            batch_size: int = ITERATION_BATCH_SIZE,
+    ) -> Iterator[Any]:
+        """ Iterate over the events, reading them in batches of `batch_size`. """
+        entries = self._query_events(limit, offset, batch_size)
+        return (entry[0] for entry in entries)
+
+    def iterate_payment_history(
+            self,
+            token_network_identifier: str = None,
+            partner: str = None,
+            event_types: List[str] = None,
+            from_time: str = None,
+            to_time: str = None,
+            after_event_identifier: int = 0,
+            limit: int = None,
+            offset: int = None,
+            batch_size: int = ITERATION_BATCH_SIZE,
+    ) -> Iterator[PaymentHistoryRecord]:
+        """ Iterate over the payment events, in the order they were written.
 
+        Args:
+            token_network_identifier: Only the payments in this token network,
+                as a checksummed address.
+            partner: Only the payments sent to or received from this node, as
+                a checksummed address.
+            event_types: Only these events, by class name, see
+                `PAYMENT_HISTORY_EVENTS`.
+            from_time: Only the payments logged at or after this time.
+            to_time: Only the payments logged at or before this time.
+            after_event_identifier: Only the payments after this event, the
+                `event_identifier` of the last record of the previous page.
+        """
+        where_clauses = []
+        args: List[Any] = []
+
+        if token_network_identifier is not None:
+            where_clauses.append('p.token_network_identifier = ?')
+            args.append(token_network_identifier)
+
+        if partner is not None:
+            where_clauses.append('p.partner = ?')
+            args.append(partner)
+
+        if event_types is not None:
+            placeholders = ', '.join('?' for _ in event_types)
+            where_clauses.append(f'p.event_type IN ({placeholders})')
+            args.extend(event_types)
+
+        if from_time is not None:
+            where_clauses.append('p.log_time >= ?')
+            args.append(from_time)
+
+        if to_time is not None:
+            where_clauses.append('p.log_time <= ?')
+            args.append(to_time)
+
+        where = ''.join(f'AND {clause} ' for clause in where_clauses)
+        sql = (
+            f'SELECT p.event_identifier, p.event_identifier, e.data, p.log_time '
+            f'FROM payment_history AS p '
+            f'JOIN state_events AS e ON e.identifier = p.event_identifier '
+            f'WHERE p.event_identifier > ? {where}'
+            f'ORDER BY p.event_identifier ASC LIMIT ? OFFSET ?'
+        )
+        rows = self._iterate_page(
+            sql,
+            after_event_identifier,
+            tuple(args),
+            limit,
+            offset,
+            batch_size,
+        )
+        return (PaymentHistoryRecord(*row) for row in rows)
+
+    @storage_operation
     def get_snapshots(self):
         cursor = self.conn.cursor()
         cursor.execute('SELECT identifier, statechange_id, data FROM state_snapshot')
@@ -372,6 +967,7 @@ class SQLiteStorage(SerializationBase):
             for snapshot in snapshots
         ]
 
+    @storage_operation
     def update_snapshot(self, identifier, new_snapshot):
         cursor = self.conn.cursor()
         cursor.execute(
@@ -380,42 +976,364 @@ class SQLiteStorage(SerializationBase):
         )
         self.maybe_commit()
 
+    def attach_archive(self, archive_path: str):
+        """ Attach the database to which `archive_history` moves the rows.
+
+        Once attached the events returned by `get_events` and
+        `get_events_with_timestamps` include the archived events.
+
+        This is not a storage operation, the read pool is used from the hub.
+        """
+        self.conn.execute('ATTACH DATABASE ? AS archive', (archive_path, ))
+        with self.conn:
+            self.conn.executescript(DB_SCRIPT_CREATE_ARCHIVE_TABLES)
+            self.conn.executescript(DB_SCRIPT_CREATE_ARCHIVE_VIEWS)
+
+        if self.read_pool is not None:
+            self.read_pool.attach_archive(Path(archive_path).absolute().as_uri())
+
+        self.archive_attached = True
+
+    @storage_operation
+    def archive_history(self, retained_snapshots: int) -> ArchivedRows:
+        """ Move the rows older than the `retained_snapshots`-th latest
+        snapshot to the archive, these are not used to restore the node.
+
+        The state changes and events with a balance proof are kept, together
+        with the state changes of these events, because they are looked up to
+        settle and unlock the channels. The payment events are kept for the
+        payment history.
+        """
+        if retained_snapshots < 1:
+            raise ValueError('retained_snapshots must be at least one')
+
+        if not self.archive_attached:
+            raise RuntimeError('The archive database is not attached')
+
+        cursor = self.conn.execute(
+            'SELECT identifier, statechange_id FROM state_snapshot '
+            'ORDER BY identifier DESC LIMIT 1 OFFSET ?',
+            (retained_snapshots - 1, ),
+        )
+        row = cursor.fetchone()
+
+        if row is None:
+            return ArchivedRows(state_changes=0, events=0, snapshots=0)
+
+        snapshot_identifier, state_change_identifier = row
+
+        # Order matters, the rows are moved before the rows they reference
+        with self._write_transaction():
+            snapshots = self._archive_rows(
+                'state_snapshot_delta',
+                'base_snapshot_id < ?',
+                (snapshot_identifier, ),
+            )
+            snapshots += self._archive_rows(
+                'state_snapshot',
+                'identifier < ?',
+                (snapshot_identifier, ),
+            )
+            events = self._archive_rows(
+                'state_events',
+                'source_statechange_id < ? AND identifier NOT IN ('
+                '    SELECT event_identifier FROM main.state_events_balance_proofs'
+                ') AND identifier NOT IN ('
+                '    SELECT event_identifier FROM main.payment_history'
+                ')',
+                (state_change_identifier, ),
+            )
+            # The snapshot's own state change is replayed on restore, only
+            # the older ones can be moved
+            state_changes = self._archive_rows(
+                'state_changes',
+                'identifier < ? AND identifier NOT IN ('
+                '    SELECT state_change_identifier FROM main.state_changes_balance_proofs'
+                ') AND identifier NOT IN ('
+                '    SELECT source_statechange_id FROM main.state_events'
+                ')',
+                (state_change_identifier, ),
+            )
+
+        return ArchivedRows(state_changes=state_changes, events=events, snapshots=snapshots)
+
+    def _archive_rows(self, table: str, where: str, args: Tuple) -> int:
+        # The archive tables have the same columns, in the same order
+        self.conn.execute(
+            f'INSERT INTO archive.{table} SELECT * FROM main.{table} WHERE {where}',
+            args,
+        )
+        cursor = self.conn.execute(f'DELETE FROM main.{table} WHERE {where}', args)
+        return cursor.rowcount
+
+    @storage_operation
+    def vacuum(self) -> bool:
+        """ Rebuild the main database file if it has unused pages, e.g. the
+        pages freed by `archive_history`.
+
+        Returns whether the database was rebuilt.
+        """
+        cursor = self.conn.execute('PRAGMA main.freelist_count')
+        if cursor.fetchone()[0] == 0:
+            return False
+
+        self.conn.execute('VACUUM')
+        return True
+
     def maybe_commit(self):
         if not self.in_transaction:
             self.conn.commit()
 
     @contextmanager
-    def transaction(self):
+    def _write_transaction(self):
+        """ Serialize the writers and commit the write on exit.
+
+        If an explicit transaction is open the write becomes part of it and is
+        only made durable by `commit`.
+        """
+        with self.write_lock:
+            if self.in_transaction:
+                yield
+            else:
+                with self.conn:
+                    yield
+
+    @storage_operation
+    def begin(self):
+        """ Open an explicit transaction, writes are not committed until
+        `commit` is called.
+        """
         cursor = self.conn.cursor()
+        cursor.execute('BEGIN')
         self.in_transaction = True
+
+    @storage_operation
+    def commit(self):
+        cursor = self.conn.cursor()
         try:
-            cursor.execute('BEGIN')
-            yield
             cursor.execute('COMMIT')
-        except Exception:
+        finally:
+            self.in_transaction = False
+
+    @storage_operation
+    def rollback(self):
+        cursor = self.conn.cursor()
+        try:
             cursor.execute('ROLLBACK')
-            raise
         finally:
             self.in_transaction = False
 
-    def __del__(self):
+    @storage_operation
+    def savepoint(self, name: str):
+        """ Mark the writes of the open transaction which can be undone with
+        `rollback_to_savepoint`, without rolling back the earlier ones.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f'SAVEPOINT {name}')
+
+    @storage_operation
+    def release_savepoint(self, name: str):
+        """ Keep the writes since the savepoint as part of the transaction. """
+        cursor = self.conn.cursor()
+        cursor.execute(f'RELEASE SAVEPOINT {name}')
+
+    @storage_operation
+    def rollback_to_savepoint(self, name: str):
+        """ Undo the writes since the savepoint, the transaction stays open. """
+        cursor = self.conn.cursor()
+        cursor.execute(f'ROLLBACK TO SAVEPOINT {name}')
+        cursor.execute(f'RELEASE SAVEPOINT {name}')
+
+    @contextmanager
+    def transaction(self):
+        self.begin()
+        try:
+            yield
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+
+    def close(self):
         self.conn.close()
 
+        if self.read_pool is not None:
+            self.read_pool.close()
+
+        self.executor.close()
+
+    def __del__(self):
+        self.close()
+
+
+def balance_proof_lookup_data(obj) -> Optional[Dict[str, Any]]:
+    """ Return the `BALANCE_PROOF_LOOKUP_FIELDS` of the balance proof
+    contained in the state change or event `obj`, if any.
+    """
+    balance_proof = getattr(obj, 'balance_proof', None)
+
+    if balance_proof is None:
+        return None
+
+    data = balance_proof.to_dict()
+    return {
+        field: data.get(field)
+        for field in BALANCE_PROOF_LOOKUP_FIELDS
+    }
+
+
+def payment_history_data(event) -> Optional[Dict[str, Any]]:
+    """ Return the `payment_history` columns for `event`, or None if it is
+    not a payment event.
+    """
+    event_type = type(event).__name__
+    partner_attribute = PAYMENT_HISTORY_EVENTS.get(event_type)
+
+    if partner_attribute is None:
+        return None
+
+    return {
+        'event_type': event_type,
+        'token_network_identifier': to_checksum_address(event.token_network_identifier),
+        'partner': to_checksum_address(getattr(event, partner_attribute)),
+    }
+
+
+def deserialize_data(serializer: SerializationBase, data) -> Any:
+    """ Deserialize `data` as stored by `SerializedSQLiteStorage`. """
+    return serializer.deserialize(decompress(data))
+
 
 class SerializedSQLiteStorage(SQLiteStorage):
-    def __init__(self, database_path, serializer: SerializationBase):
-        super().__init__(database_path)
+    """ Storage of the application objects.
+
+    If `compression` is given, the snapshots are compressed with that codec,
+    and so are the state changes and events if `compress_state_changes` is
+    set. The compression is recorded in every row, the rows are read
+    regardless of the current configuration.
+    """
+
+    def __init__(
+            self,
+            database_path,
+            serializer: SerializationBase,
+            compression: Optional[str] = None,
+            compress_state_changes: bool = False,
+            read_connections: int = 0,
+            executor: StorageExecutor = None,
+    ):
+        super().__init__(database_path, read_connections, executor)
 
         self.serializer = serializer
+        self.compression_codec = None
+        self.compressed_tables: Tuple[str, ...] = ()
+
+        if compression is not None:
+            self.compression_codec = COMPRESSION_CODECS[compression]
+            self.compressed_tables = ('state_snapshot', 'state_snapshot_delta')
+            if compress_state_changes:
+                self.compressed_tables += ('state_changes', 'state_events')
+
+    def _serialize(self, table: str, obj: Any):
+        return self._compress(table, self.serializer.serialize(obj))
+
+    def _compress(self, table: str, data):
+        if table in self.compressed_tables:
+            data = compress(data, self.compression_codec)
+
+        return data
+
+    def _deserialize(self, data):
+        return deserialize_data(self.serializer, data)
+
+    @storage_operation
+    def convert_serialization(self, batch_size: int = 1000):
+        """ Rewrite the data written by another serializer with `self.serializer`.
+
+        Rows written by either serializer can be read, so this is not required
+        for correctness, it is done so that the whole database benefits from
+        the selected format.
+
+        Every batch of `batch_size` rows is committed on its own, an
+        interrupted conversion continues on the next call.
+        """
+        if self.get_serialization_format() == self.serializer.name:
+            return
+
+        source_type = 'text' if self.serializer.binary else 'blob'
+        for table in SERIALIZED_DATA_TABLES:
+            last_identifier = 0
+
+            while True:
+                cursor = self.conn.execute(
+                    f'SELECT identifier, data FROM {table} '
+                    f'WHERE identifier > ? AND typeof(data) = ? '
+                    f'ORDER BY identifier ASC LIMIT ?',
+                    (last_identifier, source_type, batch_size),
+                )
+                rows = cursor.fetchall()
+
+                if not rows:
+                    break
 
+                converted_rows = [
+                    (self._serialize(table, self._deserialize(data)), identifier)
+                    for identifier, data in rows
+                ]
+                with self._write_transaction():
+                    self.conn.executemany(
+                        f'UPDATE {table} SET data=? WHERE identifier=?',
+                        converted_rows,
+                    )
+
+                last_identifier = rows[-1][0]
+
+        self.set_serialization_format(self.serializer.name)
+
+    @storage_operation
     def write_state_change(self, state_change, log_time):
-        serialized_data = self.serializer.serialize(state_change)
-        return super().write_state_change(serialized_data, log_time)
+        serialized_data = self._serialize('state_changes', state_change)
+        return super().write_state_change(
+            serialized_data,
+            log_time,
+            balance_proof_lookup_data(state_change),
+        )
 
+    @storage_operation
     def write_state_snapshot(self, statechange_id, snapshot):
-        serialized_data = self.serializer.serialize(snapshot)
+        serialized_data = self._serialize('state_snapshot', snapshot)
         return super().write_state_snapshot(statechange_id, serialized_data)
 
+    @storage_operation
+    def write_state_snapshot_delta(self, statechange_id, base_snapshot_id, delta):
+        serialized_data = self._serialize('state_snapshot_delta', delta)
+        return super().write_state_snapshot_delta(
+            statechange_id,
+            base_snapshot_id,
+            serialized_data,
+        )
+
+    @storage_operation
+    def write_serialized_state_snapshot_delta(
+            self,
+            statechange_id,
+            base_snapshot_id,
+            serialized_delta: Dict[str, Any],
+    ):
+        """ Same as `write_state_snapshot_delta` for a delta whose parts are
+        already serialized with `self.serializer`.
+        """
+        serialized_data = self._compress(
+            'state_snapshot_delta',
+            self.serializer.serialize_dict(serialized_delta),
+        )
+        return super().write_state_snapshot_delta(
+            statechange_id,
+            base_snapshot_id,
+            serialized_data,
+        )
+
+    @storage_operation
     def write_events(self, state_change_identifier, events, log_time):
         """ Save events.
 
@@ -424,22 +1342,32 @@ class SerializedSQLiteStorage(SQLiteStorage):
             events: List of Event objects.
         """
         events_data = [
-            (None, state_change_identifier, log_time, self.serializer.serialize(event))
+            (None, state_change_identifier, log_time, self._serialize('state_events', event))
             for event in events
         ]
-        return super().write_events(state_change_identifier, events_data, log_time)
+        balance_proofs = [balance_proof_lookup_data(event) for event in events]
+        payments = [payment_history_data(event) for event in events]
+        return super().write_events(
+            state_change_identifier,
+            events_data,
+            log_time,
+            balance_proofs,
+            payments,
+        )
 
+    @storage_operation
     def get_latest_state_snapshot(self) -> Optional[Tuple[int, Any]]:
         """ Return the tuple of (last_applied_state_change_id, snapshot) or None"""
         row = super().get_latest_state_snapshot()
 
         if row:
             last_applied_state_change_id = row[0]
-            snapshot_state = self.serializer.deserialize(row[1])
+            snapshot_state = self._deserialize(row[1])
             return (last_applied_state_change_id, snapshot_state)
 
         return None
 
+    @storage_operation
     def get_snapshot_closest_to_state_change(
             self,
             state_change_identifier: int,
@@ -450,62 +1378,145 @@ class SerializedSQLiteStorage(SQLiteStorage):
 
         if row[1]:
             last_applied_state_change_id = row[0]
-            snapshot_state = self.serializer.deserialize(row[1])
+            snapshot_state = self._deserialize(row[1])
             result = (last_applied_state_change_id, snapshot_state)
         else:
             result = (0, None)
 
         return result
 
+    @storage_operation
+    def get_snapshot_deltas_closest_to_state_change(
+            self,
+            state_change_identifier: int,
+    ) -> List[Tuple[int, Any]]:
+        rows = super().get_snapshot_deltas_closest_to_state_change(state_change_identifier)
+        return [
+            (last_applied_state_change_id, self._deserialize(delta))
+            for last_applied_state_change_id, delta in rows
+        ]
+
+    @storage_operation
     def get_latest_event_by_data_field(
             self,
             filters: Dict[str, Any],
     ) -> EventRecord:
         """ Return all state changes filtered by a named field and value."""
+        self._check_data_field_filters('state_events', filters)
         event = super().get_latest_event_by_data_field(filters)
 
         if event.event_identifier > 0:
             event = EventRecord(
                 event_identifier=event.event_identifier,
                 state_change_identifier=event.state_change_identifier,
-                data=self.serializer.deserialize(event.data),
+                data=self._deserialize(event.data),
             )
 
         return event
 
+    @storage_operation
     def get_latest_state_change_by_data_field(
             self,
             filters: Dict[str, str],
     ) -> StateChangeRecord:
         """ Return all state changes filtered by a named field and value."""
-
+        self._check_data_field_filters('state_changes', filters)
         state_change = super().get_latest_state_change_by_data_field(filters)
 
         if state_change.state_change_identifier > 0:
             state_change = StateChangeRecord(
                 state_change_identifier=state_change.state_change_identifier,
-                data=self.serializer.deserialize(state_change.data),
+                data=self._deserialize(state_change.data),
             )
 
         return state_change
 
-    def get_statechanges_by_identifier(self, from_identifier, to_identifier):
-        state_changes = super().get_statechanges_by_identifier(from_identifier, to_identifier)
-        return [
-            self.serializer.deserialize(state_change)
+    def _check_data_field_filters(self, table: str, filters: Dict[str, Any]):
+        # Only the balance proof fields are indexed, the other filters rely on
+        # the SQLite JSON functions
+        if balance_proof_lookup_filters(filters) is not None:
+            return
+
+        if self.serializer.binary:
+            raise ValueError(
+                f'The {self.serializer.name} serialization can only be queried by the '
+                f'indexed balance proof fields, got {list(filters)}',
+            )
+
+        if table in self.compressed_tables:
+            raise ValueError(
+                f'Compressed data can only be queried by the indexed balance proof '
+                f'fields, got {list(filters)}',
+            )
+
+    def iterate_statechanges_by_identifier(
+            self,
+            from_identifier,
+            to_identifier,
+            batch_size: int = ITERATION_BATCH_SIZE,
+    ) -> Iterator[Any]:
+        state_changes = super().iterate_statechanges_by_identifier(
+            from_identifier,
+            to_identifier,
+            batch_size,
+        )
+        return (
+            self._deserialize(state_change)
             for state_change in state_changes
-        ]
+        )
 
-    def get_events_with_timestamps(self, limit: int = None, offset: int = None):
-        events = super().get_events_with_timestamps(limit, offset)
-        return [
+    def iterate_events_with_timestamps(
+            self,
+            limit: int = None,
+            offset: int = None,
+            batch_size: int = ITERATION_BATCH_SIZE,
+    ) -> Iterator[TimestampedEvent]:
+        events = super().iterate_events_with_timestamps(limit, offset, batch_size)
+        return (
             TimestampedEvent(
-                self.serializer.deserialize(event.wrapped_event),
+                self._deserialize(event.wrapped_event),
                 event.log_time,
             )
             for event in events
-        ]
+        )
 
-    def get_events(self, limit: int = None, offset: int = None):
-        events = super().get_events(limit, offset)
-        return [self.serializer.deserialize(event) for event in events]
+    def iterate_events(
+            self,
+            limit: int = None,
+            offset: int = None,
+            batch_size: int = ITERATION_BATCH_SIZE,
+    ) -> Iterator[Any]:
+        events = super().iterate_events(limit, offset, batch_size)
+        return (self._deserialize(event) for event in events)
+
+    def iterate_payment_history(
+            self,
+            token_network_identifier: str = None,
+            partner: str = None,
+            event_types: List[str] = None,
+            from_time: str = None,
+            to_time: str = None,
+            after_event_identifier: int = 0,
+            limit: int = None,
+            offset: int = None,
+            batch_size: int = ITERATION_BATCH_SIZE,
+    ) -> Iterator[PaymentHistoryRecord]:
+        records = super().iterate_payment_history(
+            token_network_identifier=token_network_identifier,
+            partner=partner,
+            event_types=event_types,
+            from_time=from_time,
+            to_time=to_time,
+            after_event_identifier=after_event_identifier,
+            limit=limit,
+            offset=offset,
+            batch_size=batch_size,
+        )
+        return (
+            PaymentHistoryRecord(
+                event_identifier=record.event_identifier,
+                data=self._deserialize(record.data),
+                log_time=record.log_time,
+            )
+            for record in records
+        )
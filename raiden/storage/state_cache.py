@@ -0,0 +1,91 @@
+""" Cache of the node state, to skip the restore from the database on the next
+start.
+
+The state is written on a graceful shutdown with pickle, which is much faster
+to load than the snapshot and the state changes replayed on top of it. The
+cache is tagged with the state changes it was derived from, and only used if
+these are still the latest ones in the database. Like the database, the cache
+is trusted, it must not be writable by anyone else.
+"""
+import os
+import pickle
+from contextlib import suppress
+
+import structlog
+
+from raiden.transfer.architecture import State
+from raiden.utils import get_system_spec
+from raiden.utils.typing import NamedTuple, Optional
+
+from .sqlite import RAIDEN_DB_VERSION, SQLiteStorage
+
+log = structlog.get_logger(__name__)  # pylint: disable=invalid-name
+
+
+class StateCacheTag(NamedTuple):
+    raiden_version: str
+    db_version: int
+    state_change_identifier: int
+    state_change_digest: bytes
+
+
+def state_cache_tag(storage: SQLiteStorage) -> StateCacheTag:
+    """ Tag of the state restored from `storage`.
+
+    The state classes may change between releases, so the version is part of
+    the tag.
+    """
+    state_change_identifier, state_change_digest = storage.get_state_changes_fingerprint()
+    return StateCacheTag(
+        raiden_version=get_system_spec()['raiden'],
+        db_version=RAIDEN_DB_VERSION,
+        state_change_identifier=state_change_identifier,
+        state_change_digest=state_change_digest,
+    )
+
+
+def write_state_cache(cache_path: str, storage: SQLiteStorage, state: State):
+    """ Write `state`, which must be the result of all the state changes in
+    `storage`, to the cache at `cache_path`.
+    """
+    tag = state_cache_tag(storage)
+
+    # A partially written cache would only fail to load, the rename keeps an
+    # interrupted write from leaving it behind.
+    temporary_path = f'{cache_path}.tmp'
+    with open(temporary_path, 'wb') as cache_file:
+        pickle.dump(tag, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(state, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(temporary_path, cache_path)
+
+
+def read_state_cache(cache_path: str, storage: SQLiteStorage) -> Optional[State]:
+    """ Return the state of the cache at `cache_path`, or None if there is no
+    cache or if it is outdated.
+
+    The cache is removed, it is outdated as soon as a new state change is
+    written.
+    """
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            tag = pickle.load(cache_file)
+            expected_tag = state_cache_tag(storage)
+
+            if tag != expected_tag:
+                log.info(
+                    'Discarding outdated state cache',
+                    cache_state_change_identifier=getattr(tag, 'state_change_identifier', None),
+                    state_change_identifier=expected_tag.state_change_identifier,
+                )
+                return None
+
+            return pickle.load(cache_file)
+    except FileNotFoundError:
+        return None
+    except Exception:  # pylint: disable=broad-except
+        log.warning('Failed to read the state cache', exc_info=True)
+        return None
+    finally:
+        with suppress(FileNotFoundError):
+            os.remove(cache_path)
@@ -6,6 +6,17 @@ class TimestampedEvent(namedtuple('TimestampedEvent', 'wrapped_event log_time'))
         return getattr(self.wrapped_event, item)
 
 
+class PaymentHistoryEvent(
+        namedtuple('PaymentHistoryEvent', 'wrapped_event log_time event_identifier'),
+):
+    """ A payment event of the history, its `event_identifier` is the cursor of
+    the next page.
+    """
+
+    def __getattr__(self, item):
+        return getattr(self.wrapped_event, item)
+
+
 DB_CREATE_SETTINGS = '''
 CREATE TABLE IF NOT EXISTS settings (
     name VARCHAR[24] NOT NULL PRIMARY KEY,
@@ -30,6 +41,19 @@ CREATE TABLE IF NOT EXISTS state_snapshot (
 );
 '''
 
+DB_CREATE_SNAPSHOT_DELTA = '''
+CREATE TABLE IF NOT EXISTS state_snapshot_delta (
+    identifier INTEGER PRIMARY KEY,
+    statechange_id INTEGER,
+    base_snapshot_id INTEGER NOT NULL,
+    data JSON,
+    FOREIGN KEY(statechange_id) REFERENCES state_changes(identifier),
+    FOREIGN KEY(base_snapshot_id) REFERENCES state_snapshot(identifier)
+);
+CREATE INDEX IF NOT EXISTS state_snapshot_delta_base_snapshot_id
+    ON state_snapshot_delta(base_snapshot_id);
+'''
+
 DB_CREATE_STATE_EVENTS = '''
 CREATE TABLE IF NOT EXISTS state_events (
     identifier INTEGER PRIMARY KEY,
@@ -40,6 +64,57 @@ CREATE TABLE IF NOT EXISTS state_events (
 );
 '''
 
+DB_CREATE_STATE_CHANGES_BALANCE_PROOFS = '''
+CREATE TABLE IF NOT EXISTS state_changes_balance_proofs (
+    state_change_identifier INTEGER PRIMARY KEY,
+    chain_id INTEGER,
+    token_network_identifier TEXT,
+    channel_identifier TEXT,
+    balance_hash TEXT,
+    locksroot TEXT,
+    sender TEXT,
+    FOREIGN KEY(state_change_identifier) REFERENCES state_changes(identifier)
+);
+CREATE INDEX IF NOT EXISTS state_changes_balance_proofs_balance_hash
+    ON state_changes_balance_proofs(balance_hash);
+CREATE INDEX IF NOT EXISTS state_changes_balance_proofs_locksroot
+    ON state_changes_balance_proofs(locksroot);
+'''
+
+DB_CREATE_STATE_EVENTS_BALANCE_PROOFS = '''
+CREATE TABLE IF NOT EXISTS state_events_balance_proofs (
+    event_identifier INTEGER PRIMARY KEY,
+    chain_id INTEGER,
+    token_network_identifier TEXT,
+    channel_identifier TEXT,
+    balance_hash TEXT,
+    locksroot TEXT,
+    sender TEXT,
+    FOREIGN KEY(event_identifier) REFERENCES state_events(identifier)
+);
+CREATE INDEX IF NOT EXISTS state_events_balance_proofs_balance_hash
+    ON state_events_balance_proofs(balance_hash);
+CREATE INDEX IF NOT EXISTS state_events_balance_proofs_locksroot
+    ON state_events_balance_proofs(locksroot);
+'''
+
+DB_CREATE_PAYMENT_HISTORY = '''
+CREATE TABLE IF NOT EXISTS payment_history (
+    event_identifier INTEGER PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    token_network_identifier TEXT,
+    partner TEXT,
+    log_time TEXT,
+    FOREIGN KEY(event_identifier) REFERENCES state_events(identifier)
+);
+CREATE INDEX IF NOT EXISTS payment_history_token_network_identifier
+    ON payment_history(token_network_identifier);
+CREATE INDEX IF NOT EXISTS payment_history_partner
+    ON payment_history(partner);
+CREATE INDEX IF NOT EXISTS payment_history_log_time
+    ON payment_history(log_time);
+'''
+
 DB_CREATE_RUNS = '''
 CREATE TABLE IF NOT EXISTS runs (
     started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP PRIMARY KEY,
@@ -50,13 +125,54 @@ CREATE TABLE IF NOT EXISTS runs (
 DB_SCRIPT_CREATE_TABLES = """
 PRAGMA foreign_keys=off;
 BEGIN TRANSACTION;
-{}{}{}{}{}
+{}{}{}{}{}{}{}{}{}
 COMMIT;
 PRAGMA foreign_keys=on;
 """.format(
     DB_CREATE_SETTINGS,
     DB_CREATE_STATE_CHANGES,
     DB_CREATE_SNAPSHOT,
+    DB_CREATE_SNAPSHOT_DELTA,
     DB_CREATE_STATE_EVENTS,
+    DB_CREATE_STATE_CHANGES_BALANCE_PROOFS,
+    DB_CREATE_STATE_EVENTS_BALANCE_PROOFS,
+    DB_CREATE_PAYMENT_HISTORY,
     DB_CREATE_RUNS,
 )
+
+# The archive has the same columns as the tables in the main database, but no
+# foreign keys, the rows referenced by an archived row may still be in the
+# main database.
+DB_SCRIPT_CREATE_ARCHIVE_TABLES = '''
+CREATE TABLE IF NOT EXISTS archive.state_changes (
+    identifier INTEGER PRIMARY KEY,
+    data JSON,
+    log_time TEXT
+);
+CREATE TABLE IF NOT EXISTS archive.state_snapshot (
+    identifier INTEGER PRIMARY KEY,
+    statechange_id INTEGER,
+    data JSON
+);
+CREATE TABLE IF NOT EXISTS archive.state_snapshot_delta (
+    identifier INTEGER PRIMARY KEY,
+    statechange_id INTEGER,
+    base_snapshot_id INTEGER NOT NULL,
+    data JSON
+);
+CREATE TABLE IF NOT EXISTS archive.state_events (
+    identifier INTEGER PRIMARY KEY,
+    source_statechange_id INTEGER NOT NULL,
+    log_time TEXT,
+    data JSON
+);
+'''
+
+# The views are temporary, they are created on every connection which attaches
+# the archive
+DB_SCRIPT_CREATE_ARCHIVE_VIEWS = '''
+CREATE TEMP VIEW IF NOT EXISTS all_state_events AS
+    SELECT identifier, source_statechange_id, log_time, data FROM archive.state_events
+    UNION ALL
+    SELECT identifier, source_statechange_id, log_time, data FROM main.state_events;
+'''
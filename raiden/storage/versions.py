@@ -30,3 +30,27 @@ def older_db_file(database_base_path: str) -> typing.Optional[str]:
             return old_db_filename
 
     return None
+
+
+def archive_db_file(database_path: str) -> str:
+    """ Returns the path to the database holding the history archived from
+    the database at `database_path`.
+    """
+    database_base_path, database_extension = os.path.splitext(database_path)
+    return f'{database_base_path}_archive{database_extension}'
+
+
+def state_cache_file(database_path: str) -> str:
+    """ Returns the path to the state cache of the database at
+    `database_path`.
+    """
+    database_base_path, _ = os.path.splitext(database_path)
+    return f'{database_base_path}_state.cache'
+
+
+def state_transitions_profile_file(database_path: str) -> str:
+    """ Returns the path to the profile of the state transitions of the node
+    using the database at `database_path`.
+    """
+    database_base_path, _ = os.path.splitext(database_path)
+    return f'{database_base_path}_state_transitions.json'
@@ -1,59 +1,149 @@
+import time
 from datetime import datetime
 
+import gevent
 import gevent.lock
 import structlog
+from gevent.event import AsyncResult
 
-from raiden.storage.sqlite import SQLiteStorage
-from raiden.transfer.architecture import StateManager
+from raiden.storage.event_bus import EventBus
+from raiden.storage.replay import ParallelDecoder, can_decode_in_workers
+from raiden.storage.snapshots import SnapshotWriter, apply_snapshot_deltas
+from raiden.storage.sqlite import SerializedSQLiteStorage
+from raiden.transfer.architecture import Event, StateChange, StateManager
+from raiden.transfer.copy_on_write import CopyOnWriteStateManager
 from raiden.utils import typing
 
 log = structlog.get_logger(__name__)  # pylint: disable=invalid-name
 
+# Below this number of state changes the start of the decoding workers takes
+# longer than the decoding itself
+PARALLEL_DECODE_MIN_STATE_CHANGES = 10_000
+PARALLEL_DECODE_BATCH_SIZE = 250
+
 
 def restore_to_state_change(
         transition_function: typing.Callable,
-        storage: SQLiteStorage,
+        storage: SerializedSQLiteStorage,
         state_change_identifier: int,
+        full_snapshot_interval: int = 1,
+        decode_workers: int = 0,
+        copy_on_write: bool = False,
 ) -> 'WriteAheadLog':
+    """ Restore the state from the closest snapshot and replay the state
+    changes logged after it.
+
+    If `decode_workers` is set, and there are enough state changes to make up
+    for the start of the processes, the state changes are decoded in that
+    many worker processes while the previous ones are dispatched.
+
+    If `copy_on_write` is set the state manager applies the state changes to
+    copies of the parts of the state which they modify, see
+    `raiden.transfer.copy_on_write`.
+    """
     msg = "state change identifier 'latest' or an integer greater than zero"
     assert state_change_identifier == 'latest' or state_change_identifier > 0, msg
 
+    snapshot_start = time.monotonic()
     from_state_change_id, chain_state = storage.get_snapshot_closest_to_state_change(
         state_change_identifier=state_change_identifier,
     )
 
+    num_deltas = 0
     if chain_state is not None:
+        deltas = storage.get_snapshot_deltas_closest_to_state_change(
+            state_change_identifier=state_change_identifier,
+        )
+        num_deltas = len(deltas)
+        if deltas:
+            from_state_change_id = deltas[-1][0]
+            chain_state = apply_snapshot_deltas(chain_state, [delta for _, delta in deltas])
+
         log.debug(
             'Restoring from snapshot',
             from_state_change_id=from_state_change_id,
             to_state_change_id=state_change_identifier,
+            num_deltas=num_deltas,
         )
     else:
         log.debug(
             'No snapshot found, replaying all state changes',
             to_state_change_id=state_change_identifier,
         )
+    snapshot_duration = time.monotonic() - snapshot_start
 
-    unapplied_state_changes = storage.get_statechanges_by_identifier(
-        from_identifier=from_state_change_id,
-        to_identifier=state_change_identifier,
+    use_decode_workers = (
+        decode_workers > 0 and
+        can_decode_in_workers() and
+        storage.count_state_changes_in_range(
+            from_state_change_id,
+            state_change_identifier,
+        ) >= PARALLEL_DECODE_MIN_STATE_CHANGES
     )
+    if use_decode_workers:
+        decoder = ParallelDecoder(storage.serializer.name, decode_workers)
+        unapplied_state_changes = decoder.decode(
+            storage.iterate_statechanges_batches_by_identifier(
+                from_identifier=from_state_change_id,
+                to_identifier=state_change_identifier,
+                batch_size=PARALLEL_DECODE_BATCH_SIZE,
+            ),
+        )
+    else:
+        decode_workers = 0
+        unapplied_state_changes = storage.iterate_statechanges_by_identifier(
+            from_identifier=from_state_change_id,
+            to_identifier=state_change_identifier,
+        )
+
+    state_manager_class = CopyOnWriteStateManager if copy_on_write else StateManager
+    state_manager = state_manager_class(transition_function, chain_state)
+    wal = WriteAheadLog(state_manager, storage, full_snapshot_interval)
+
+    # The decoding time is the time spent waiting for the next state change,
+    # with workers it overlaps with the dispatching.
+    num_state_changes = 0
+    decode_duration = 0.0
+    dispatch_duration = 0.0
+    while True:
+        decode_start = time.monotonic()
+        state_change = next(unapplied_state_changes, None)
+        dispatch_start = time.monotonic()
+        decode_duration += dispatch_start - decode_start
 
-    state_manager = StateManager(transition_function, chain_state)
-    wal = WriteAheadLog(state_manager, storage)
+        if state_change is None:
+            break
 
-    log.debug('Replaying state changes', num_state_changes=len(unapplied_state_changes))
-    for state_change in unapplied_state_changes:
         wal.state_manager.dispatch(state_change)
+        dispatch_duration += time.monotonic() - dispatch_start
+        num_state_changes += 1
+
+    log.info(
+        'Restored state',
+        num_deltas=num_deltas,
+        num_state_changes=num_state_changes,
+        decode_workers=decode_workers,
+        snapshot_duration=snapshot_duration,
+        decode_duration=decode_duration,
+        dispatch_duration=dispatch_duration,
+    )
 
     return wal
 
 
 class WriteAheadLog:
-    def __init__(self, state_manager, storage):
+    def __init__(self, state_manager, storage, full_snapshot_interval: int = 1):
         self.state_manager = state_manager
         self.state_change_id = None
         self.storage = storage
+        self.snapshot_writer = SnapshotWriter(storage, full_snapshot_interval)
+
+        # The events of the logged state changes, published once committed
+        self.event_bus = EventBus()
+
+        # Set if the in-memory state may not be the result of the logged state
+        # changes anymore, i.e. a logged state change failed to be dispatched
+        self.state_diverged = False
 
         # The state changes must be applied in the same order as they are saved
         # to the WAL. Because writing to the database context switches, and the
@@ -68,7 +158,8 @@ class WriteAheadLog:
         in case of a node crash the state change can be recovered and replayed
         to restore the node state.
 
-        Events produced by applying state change are also saved.
+        Events produced by applying state change are also saved, and then
+        published to the `event_bus`.
         """
 
         with self._lock:
@@ -76,17 +167,85 @@ class WriteAheadLog:
             state_change_id = self.storage.write_state_change(state_change, timestamp)
             self.state_change_id = state_change_id
 
-            events = self.state_manager.dispatch(state_change)
+            events = self._dispatch(state_change)
 
             self.storage.write_events(state_change_id, events, timestamp)
+            self.event_bus.publish(events)
 
         return events
 
+    def log_and_dispatch_many(
+            self,
+            state_changes: typing.List[StateChange],
+    ) -> typing.List[typing.List[Event]]:
+        """ Log and apply the `state_changes` in order, returning the events of
+        each of them.
+
+        The state changes and their events are written in a single database
+        transaction, and the state changes are applied to a single copy of the
+        state, see `StateManager.dispatch_many`. If the state changes can not
+        be applied the transaction is rolled back, neither the log nor the
+        state include any of them.
+        """
+        if not state_changes:
+            return list()
+
+        with self._lock:
+            timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+
+            dispatched = False
+            self.storage.begin()
+            try:
+                state_change_ids = [
+                    self.storage.write_state_change(state_change, timestamp)
+                    for state_change in state_changes
+                ]
+
+                events_per_state_change = self.state_manager.dispatch_many(state_changes)
+                dispatched = True
+
+                for state_change_id, events in zip(state_change_ids, events_per_state_change):
+                    self.storage.write_events(state_change_id, events, timestamp)
+
+                self.storage.commit()
+            except Exception:
+                # Depending on the error sqlite may have already rolled back
+                if self.storage.conn.in_transaction:
+                    self.storage.rollback()
+                if dispatched:
+                    self.state_diverged = True
+                raise
+
+            self.state_change_id = state_change_ids[-1]
+            self.event_bus.publish([
+                event
+                for events in events_per_state_change
+                for event in events
+            ])
+
+        return events_per_state_change
+
+    def _dispatch(self, state_change):
+        try:
+            return self.state_manager.dispatch(state_change)
+        except Exception:
+            self.state_diverged = True
+            raise
+
+    def flush(self):
+        """ Make every logged state change durable.
+
+        Every state change is committed by `log_and_dispatch`, so there is
+        nothing to do.
+        """
+
     def snapshot(self):
         """ Snapshot the application state.
 
         Snapshots are used to restore the application state, either after a
-        restart or a crash.
+        restart or a crash. Depending on `full_snapshot_interval` only the
+        parts of the state which changed since the previous snapshot may be
+        written.
         """
         with self._lock:
             current_state = self.state_manager.current_state
@@ -94,8 +253,177 @@ class WriteAheadLog:
 
             # otherwise no state change was dispatched
             if state_change_id:
-                self.storage.write_state_snapshot(state_change_id, current_state)
+                self.snapshot_writer.write(state_change_id, current_state)
 
     @property
     def version(self):
         return self.storage.get_version()
+
+
+class GroupCommitWriteAheadLog(WriteAheadLog):
+    """ Write-ahead-log which coalesces the writes of concurrent callers into
+    a single database transaction.
+
+    The state changes and events logged within `commit_window` seconds, up to
+    `max_batch_size` state changes, are committed together. The state changes
+    are still written and dispatched in order, under the lock, the commit is
+    the only step that is delayed. `log_and_dispatch` returns only after the
+    batch containing its state change is committed, so callers which act upon
+    the result keep the same durability guarantees as with the plain
+    `WriteAheadLog`. E.g. the transports only send the Delivered of a message
+    once its state change was handled, which includes waiting for the commit.
+
+    The events of the batch are published to the `event_bus` once it is
+    committed.
+
+    If the commit fails every caller waiting on the batch gets the error. The
+    in-memory state already includes the batch's state changes at that point,
+    so the error must be treated as unrecoverable.
+    """
+
+    def __init__(
+            self,
+            state_manager,
+            storage,
+            commit_window: float,
+            max_batch_size: int,
+            full_snapshot_interval: int = 1,
+    ):
+        super().__init__(state_manager, storage, full_snapshot_interval)
+
+        if commit_window <= 0:
+            raise ValueError('commit_window must be positive')
+
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least one')
+
+        self.commit_window = commit_window
+        self.max_batch_size = max_batch_size
+
+        self._batch_result: typing.Optional[AsyncResult] = None
+        self._batch_size = 0
+        self._batch_events: typing.List[Event] = list()
+
+    def log_and_dispatch(self, state_change):
+        """ Log and apply a state change, waiting for the commit of the batch
+        it belongs to.
+
+        If the state change can not be applied its writes are rolled back, see
+        `log_and_dispatch_many`.
+        """
+        return self.log_and_dispatch_many([state_change])[0]
+
+    def log_and_dispatch_many(
+            self,
+            state_changes: typing.List[StateChange],
+    ) -> typing.List[typing.List[Event]]:
+        """ Log and apply the `state_changes` in order as part of the open
+        batch, waiting for its commit.
+
+        The state changes are applied to a single copy of the state, see
+        `StateManager.dispatch_many`. If they can not be applied their writes
+        are rolled back to a savepoint, the batch keeps the writes of the
+        other callers and neither the log nor the state include any of them.
+
+        The batch is committed once it reaches `max_batch_size` state changes,
+        so it may exceed that size by the state changes of a single call.
+        """
+        if not state_changes:
+            return list()
+
+        with self._lock:
+            if self._batch_result is None:
+                self._open_batch()
+
+            batch_result = self._batch_result
+
+            timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+
+            dispatched = False
+            self.storage.savepoint('log_and_dispatch_many')
+            try:
+                state_change_ids = [
+                    self.storage.write_state_change(state_change, timestamp)
+                    for state_change in state_changes
+                ]
+
+                events_per_state_change = self.state_manager.dispatch_many(state_changes)
+                dispatched = True
+
+                for state_change_id, events in zip(state_change_ids, events_per_state_change):
+                    self.storage.write_events(state_change_id, events, timestamp)
+
+                self.storage.release_savepoint('log_and_dispatch_many')
+            except Exception:
+                # Depending on the error sqlite may have already rolled back
+                # the whole batch, which then fails to commit
+                if self.storage.conn.in_transaction:
+                    self.storage.rollback_to_savepoint('log_and_dispatch_many')
+                if dispatched:
+                    self.state_diverged = True
+                raise
+
+            self.state_change_id = state_change_ids[-1]
+            for events in events_per_state_change:
+                self._batch_events.extend(events)
+
+            self._batch_size += len(state_changes)
+            if self._batch_size >= self.max_batch_size:
+                self._commit_batch()
+
+        # Re-raises if the commit failed, the state changes must not be acted
+        # upon in that case.
+        batch_result.get()
+
+        return events_per_state_change
+
+    def flush(self):
+        """ Commit the open batch, if any. """
+        with self._lock:
+            self._commit_batch()
+
+    def snapshot(self):
+        """ Snapshot the application state.
+
+        The open batch is committed first, so the snapshot does not delay the
+        callers waiting for it.
+        """
+        self.flush()
+        super().snapshot()
+
+    def _open_batch(self):
+        self.storage.begin()
+        self._batch_result = AsyncResult()
+        self._batch_size = 0
+        self._batch_events = list()
+
+        gevent.spawn_later(self.commit_window, self._commit_on_timeout, self._batch_result)
+
+    def _commit_on_timeout(self, batch_result: AsyncResult):
+        with self._lock:
+            # The batch may have already been committed because it was full
+            if self._batch_result is batch_result:
+                self._commit_batch()
+
+    def _commit_batch(self):
+        batch_result = self._batch_result
+
+        if batch_result is None:
+            return
+
+        self._batch_result = None
+
+        log.debug('Committing state changes batch', batch_size=self._batch_size)
+        try:
+            self.storage.commit()
+        except Exception as e:  # pylint: disable=broad-except
+            # Depending on the error sqlite may have already rolled back
+            if self.storage.conn.in_transaction:
+                self.storage.rollback()
+            self.state_diverged = True
+            batch_result.set_exception(e)
+        else:
+            self.event_bus.publish(self._batch_events)
+            batch_result.set(None)
+        finally:
+            self._batch_events = list()
@@ -0,0 +1,193 @@
+""" Compares the serializers and compression used by the storage.
+
+For every configuration the state changes, events, and a snapshot are written
+to a new database, which is then read back the same way it is done on a
+restart.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from raiden.constants import EMPTY_MERKLE_ROOT
+from raiden.storage.compression import CODECS as COMPRESSION_CODECS
+from raiden.storage.serialize import SERIALIZERS
+from raiden.storage.sqlite import SerializedSQLiteStorage
+from raiden.tests.utils import factories
+from raiden.transfer import channel
+from raiden.transfer.mediated_transfer.events import SendBalanceProof
+from raiden.transfer.state import (
+    BalanceProofUnsignedState,
+    ChainState,
+    HashTimeLockState,
+    PaymentNetworkState,
+    TokenNetworkState,
+)
+from raiden.transfer.state_change import ReceiveUnlock
+from raiden.utils import CanonicalIdentifier, sha3
+
+
+def make_chain_state(number_of_channels):
+    """ Chain state with a single token network, every channel has a balance
+    proof and a pending lock from the partner.
+    """
+    chain_state = ChainState(
+        pseudo_random_generator=random.Random(),
+        block_number=1,
+        block_hash=factories.make_block_hash(),
+        our_address=factories.make_address(),
+        chain_id=factories.UNIT_CHAIN_ID,
+    )
+    payment_network = PaymentNetworkState(factories.make_address(), [])
+    token_network = TokenNetworkState(factories.make_address(), factories.make_address())
+    payment_network.tokenidentifiers_to_tokennetworks[token_network.address] = token_network
+    payment_network.tokenaddresses_to_tokenidentifiers[token_network.token_address] = (
+        token_network.address
+    )
+    chain_state.identifiers_to_paymentnetworks[payment_network.address] = payment_network
+
+    for channel_identifier in range(1, number_of_channels + 1):
+        channel_state = factories.make_channel(
+            our_balance=100,
+            partner_balance=100,
+            our_address=chain_state.our_address,
+            token_address=token_network.token_address,
+            payment_network_identifier=payment_network.address,
+            token_network_identifier=token_network.address,
+            channel_identifier=channel_identifier,
+        )
+        partner_state = channel_state.partner_state
+        partner_state.balance_proof = factories.make_signed_balance_proof(
+            nonce=1,
+            transferred_amount=0,
+            locked_amount=10,
+            token_network_address=token_network.address,
+            channel_identifier=channel_identifier,
+            sender_address=partner_state.address,
+        )
+        lock = HashTimeLockState(
+            amount=10,
+            expiration=100,
+            secrethash=sha3(factories.make_secret(channel_identifier)),
+        )
+        channel.register_lock(partner_state, lock)
+
+        token_network.channelidentifiers_to_channels[channel_identifier] = channel_state
+        token_network.partneraddresses_to_channelidentifiers[partner_state.address].append(
+            channel_identifier,
+        )
+
+    return chain_state
+
+
+def make_state_changes(number_of_state_changes):
+    return [
+        ReceiveUnlock(
+            message_identifier=identifier,
+            secret=factories.make_secret(identifier),
+            balance_proof=factories.make_signed_balance_proof(nonce=identifier),
+        )
+        for identifier in range(1, number_of_state_changes + 1)
+    ]
+
+
+def make_events(number_of_events):
+    return [
+        SendBalanceProof(
+            recipient=factories.make_address(),
+            channel_identifier=identifier,
+            message_identifier=identifier,
+            payment_identifier=identifier,
+            token_address=factories.make_address(),
+            secret=factories.make_secret(identifier),
+            balance_proof=BalanceProofUnsignedState(
+                nonce=identifier,
+                transferred_amount=identifier,
+                locked_amount=0,
+                locksroot=EMPTY_MERKLE_ROOT,
+                canonical_identifier=CanonicalIdentifier(
+                    chain_identifier=factories.UNIT_CHAIN_ID,
+                    token_network_address=factories.make_address(),
+                    channel_identifier=identifier,
+                ),
+            ),
+        )
+        for identifier in range(1, number_of_events + 1)
+    ]
+
+
+def run(name, storage_kwargs, database_path, chain_state, state_changes, events):
+    storage = SerializedSQLiteStorage(database_path, **storage_kwargs)
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+
+    start = time.perf_counter()
+    for state_change, event in zip(state_changes, events):
+        state_change_id = storage.write_state_change(state_change, timestamp)
+        storage.write_events(state_change_id, [event], timestamp)
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    storage.write_state_snapshot(state_change_id, chain_state)
+    snapshot_write_time = time.perf_counter() - start
+    storage.conn.close()
+
+    storage = SerializedSQLiteStorage(database_path, **storage_kwargs)
+    start = time.perf_counter()
+    _, restored_chain_state = storage.get_snapshot_closest_to_state_change('latest')
+    snapshot_read_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    restored_state_changes = storage.get_statechanges_by_identifier(1, 'latest')
+    restored_events = storage.get_events()
+    read_time = time.perf_counter() - start
+    storage.conn.close()
+
+    assert restored_chain_state == chain_state
+    assert restored_state_changes == state_changes
+    assert restored_events == events
+
+    print(
+        f'{name:<20} '
+        f'{write_time:>10.3f} {read_time:>10.3f} '
+        f'{snapshot_write_time:>10.3f} {snapshot_read_time:>10.3f} '
+        f'{os.path.getsize(database_path) / 2**20:>10.2f}',
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--channels', type=int, default=1000)
+    parser.add_argument('--state-changes', type=int, default=2000)
+    args = parser.parse_args()
+
+    chain_state = make_chain_state(args.channels)
+    state_changes = make_state_changes(args.state_changes)
+    events = make_events(args.state_changes)
+
+    print(
+        f'{"format":<20} {"write":>10} {"read":>10} '
+        f'{"snap write":>10} {"snap read":>10} {"size (MB)":>10}',
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for serializer_name, serializer in SERIALIZERS.items():
+            configurations = [(serializer_name, dict())]
+            for codec_name in COMPRESSION_CODECS:
+                configurations.append((
+                    f'{serializer_name}+{codec_name}',
+                    dict(compression=codec_name),
+                ))
+                configurations.append((
+                    f'{serializer_name}+{codec_name} (all)',
+                    dict(compression=codec_name, compress_state_changes=True),
+                ))
+
+            for name, storage_kwargs in configurations:
+                storage_kwargs['serializer'] = serializer
+                database_path = os.path.join(directory, f'{name}.db')
+                run(name, storage_kwargs, database_path, chain_state, state_changes, events)
+
+
+if __name__ == '__main__':
+    main()
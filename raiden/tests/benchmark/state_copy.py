@@ -0,0 +1,79 @@
+""" Compares the deep copy and the copy-on-write transitions of the state
+manager.
+
+For every number of channels a new block, which is dispatched to every
+channel, and the close of a single channel are applied by both state managers,
+and the resulting states are checked to be equal.
+"""
+import argparse
+import time
+from copy import deepcopy
+
+from raiden.tests.benchmark.serialization import make_chain_state
+from raiden.tests.utils import factories
+from raiden.transfer import node
+from raiden.transfer.architecture import StateManager
+from raiden.transfer.copy_on_write import CopyOnWriteStateManager
+from raiden.transfer.state_change import ActionChannelClose, Block
+
+
+def run(state_manager, state_changes):
+    """ Return the average time to dispatch each state change. """
+    start = time.perf_counter()
+    for state_change in state_changes:
+        state_manager.dispatch(state_change)
+    return (time.perf_counter() - start) / len(state_changes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--channels', type=int, nargs='+', default=[10, 100, 1000, 4000])
+    parser.add_argument('--state-changes', type=int, default=10)
+    args = parser.parse_args()
+
+    print(
+        f'{"channels":>10} {"state change":<15} '
+        f'{"deepcopy":>10} {"cow":>10} {"speedup":>10}',
+    )
+    for number_of_channels in args.channels:
+        chain_state = make_chain_state(number_of_channels)
+        payment_network = list(chain_state.identifiers_to_paymentnetworks.values())[0]
+        token_network = list(payment_network.tokenidentifiers_to_tokennetworks.values())[0]
+
+        blocks = [
+            Block(
+                block_number=chain_state.block_number + offset,
+                gas_limit=1,
+                block_hash=factories.make_block_hash(),
+            )
+            for offset in range(1, args.state_changes + 1)
+        ]
+        closes = [
+            ActionChannelClose(
+                token_network_identifier=token_network.address,
+                channel_identifier=channel_identifier,
+            )
+            for channel_identifier in range(
+                1,
+                min(args.state_changes, number_of_channels) + 1,
+            )
+        ]
+
+        deepcopy_manager = StateManager(node.state_transition, deepcopy(chain_state))
+        copy_on_write_manager = CopyOnWriteStateManager(node.state_transition, chain_state)
+
+        for name, state_changes in (('Block', blocks), ('ChannelClose', closes)):
+            deepcopy_duration = run(deepcopy_manager, state_changes)
+            copy_on_write_duration = run(copy_on_write_manager, state_changes)
+
+            print(
+                f'{number_of_channels:>10} {name:<15} '
+                f'{deepcopy_duration:>10.5f} {copy_on_write_duration:>10.5f} '
+                f'{deepcopy_duration / copy_on_write_duration:>10.1f}',
+            )
+
+        assert copy_on_write_manager.current_state == deepcopy_manager.current_state
+
+
+if __name__ == '__main__':
+    main()
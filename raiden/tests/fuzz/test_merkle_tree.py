@@ -0,0 +1,79 @@
+from hypothesis import given
+from hypothesis.strategies import binary, booleans, data, lists, sampled_from
+
+from raiden.transfer.merkle_tree import (
+    LEAVES,
+    compute_layers,
+    compute_layers_with,
+    compute_layers_without,
+    compute_merkleproof_for,
+    merkleroot,
+    validate_proof,
+)
+from raiden.transfer.state import MerkleTreeState, make_empty_merkle_tree
+
+hashes = binary(min_size=32, max_size=32)
+
+
+def layers_of(leaves):
+    if not leaves:
+        return make_empty_merkle_tree().layers
+    return compute_layers(leaves)
+
+
+@given(lists(hashes, unique=True), hashes)
+def test_compute_layers_with(leaves, element):
+    layers = layers_of(leaves)
+    result = compute_layers_with(layers, element)
+
+    if element in leaves:
+        assert result is None
+    else:
+        assert result == compute_layers(leaves + [element])
+
+    assert layers == layers_of(leaves), 'the previous layers must not be modified'
+
+
+@given(lists(hashes, min_size=1, unique=True), data())
+def test_compute_layers_without(leaves, data_):
+    element = data_.draw(sampled_from(leaves) | hashes)
+    layers = compute_layers(leaves)
+    result = compute_layers_without(layers, element)
+
+    if element not in leaves:
+        assert result is None
+    else:
+        remaining = [leaf for leaf in leaves if leaf != element]
+        assert result == (compute_layers(remaining) if remaining else [[]])
+
+    assert layers == compute_layers(leaves), 'the previous layers must not be modified'
+
+
+@given(lists(hashes, min_size=1, unique=True), lists(booleans()))
+def test_incremental_updates(leaves, removals):
+    """ A sequence of additions and removals must result in the same roots and
+    proofs as the layers computed from all the leaves.
+    """
+    layers = make_empty_merkle_tree().layers
+    current_leaves = list()
+
+    for position, leaf in enumerate(leaves):
+        layers = compute_layers_with(layers, leaf)
+        current_leaves.append(leaf)
+
+        remove = position < len(removals) and removals[position]
+        if remove and len(current_leaves) > 1:
+            removed = current_leaves.pop(len(current_leaves) // 2)
+            layers = compute_layers_without(layers, removed)
+
+        expected = compute_layers(current_leaves)
+        assert layers == expected
+
+        tree = MerkleTreeState(layers)
+        root = merkleroot(tree)
+        assert root == merkleroot(MerkleTreeState(expected))
+
+        for current_leaf in tree.layers[LEAVES]:
+            proof = compute_merkleproof_for(tree, current_leaf)
+            assert proof == compute_merkleproof_for(MerkleTreeState(expected), current_leaf)
+            assert validate_proof(proof, root, current_leaf)
@@ -17,6 +17,7 @@ from hypothesis.strategies import builds, composite, integers, random_module, ra
 from raiden.constants import GENESIS_BLOCK_NUMBER
 from raiden.settings import DEFAULT_WAIT_BEFORE_LOCK_REMOVAL
 from raiden.tests.utils import factories
+from raiden.tests.utils.transfer import assert_amount_locked
 from raiden.transfer import channel, node
 from raiden.transfer.events import EventPaymentSentFailed
 from raiden.transfer.mediated_transfer.events import SendLockedTransfer, SendSecretReveal
@@ -211,6 +212,9 @@ class ChainStateStateMachine(RuleBasedStateMachine):
             partner_deposit = netting_channel.partner_total_deposit
             total_deposit = our_deposit + partner_deposit
 
+            assert_amount_locked(our_state)
+            assert_amount_locked(partner_state)
+
             our_amount_locked = channel.get_amount_locked(our_state)
             our_balance = channel.get_balance(our_state, partner_state)
             partner_amount_locked = channel.get_amount_locked(partner_state)
@@ -1,5 +1,6 @@
 import json
 import random
+from contextlib import contextmanager
 from unittest.mock import MagicMock, Mock
 
 import gevent
@@ -13,7 +14,7 @@ from raiden.constants import (
     UINT64_MAX,
 )
 from raiden.exceptions import InsufficientFunds
-from raiden.messages import Processed, SecretRequest
+from raiden.messages import Delivered, Processed, SecretRequest
 from raiden.network.transport.matrix import MatrixTransport, UserPresence, _RetryQueue
 from raiden.network.transport.matrix.client import Room
 from raiden.network.transport.matrix.utils import make_room_alias
@@ -79,7 +80,7 @@ def mock_matrix(
     def mock_set_room_id_for_address(self, address: Address, room_id: Optional[str]):
         pass
 
-    def mock_receive_message(klass, message):
+    def mock_receive_message(klass, message, pending_delivered=None):
         # We are just unit testing the matrix transport receive so do nothing
         assert message
 
@@ -230,6 +231,82 @@ def test_processing_invalid_message_cmdid_hex(mock_matrix, skip_userid_validatio
     assert not m._handle_message(room, event)
 
 
+def test_delivered_is_sent_after_the_message_is_committed(
+        monkeypatch,
+        local_matrix_servers,
+        private_rooms,
+        retry_interval,
+        retries_before_backoff,
+):
+    transport = MatrixTransport({
+        'global_rooms': ['discovery'],
+        'retries_before_backoff': retries_before_backoff,
+        'retry_interval': retry_interval,
+        'server': local_matrix_servers[0],
+        'server_name': local_matrix_servers[0].netloc,
+        'available_servers': [],
+        'private_rooms': private_rooms,
+    })
+    transport._raiden_service = MockRaidenService()
+
+    retrier = Mock()
+    monkeypatch.setattr(transport, '_get_retrier', lambda receiver: retrier)
+
+    committed = list()
+
+    def on_message(message):
+        # Yields to the hub like a write-ahead-log waiting for a group commit
+        gevent.sleep(0.1)
+        assert not retrier.enqueue_global.called
+        committed.append(message)
+
+    transport._raiden_service.on_message = on_message
+
+    message = Processed(message_identifier=42)
+    message.sign(LocalSigner(HOP1_KEY))
+    transport._receive_message(message)
+
+    assert committed == [message]
+    retrier.enqueue_global.assert_called_once()
+    delivered = retrier.enqueue_global.call_args[0][0]
+    assert isinstance(delivered, Delivered)
+    assert delivered.delivered_message_identifier == 42
+
+
+def test_delivered_of_a_batch_is_sent_after_the_batch_is_committed(
+        mock_matrix,
+        monkeypatch,
+        skip_userid_validation,
+):
+    retrier = Mock()
+    monkeypatch.setattr(mock_matrix, '_get_retrier', lambda receiver: retrier)
+
+    def receive_message(message, pending_delivered=None):
+        delivered = Delivered(delivered_message_identifier=message.message_identifier)
+        pending_delivered.append((message.sender, delivered))
+
+    monkeypatch.setattr(mock_matrix, '_receive_message', receive_message)
+
+    committed = list()
+
+    @contextmanager
+    def batch_state_changes():
+        yield
+        # The batch is dispatched and committed once the block exits
+        gevent.sleep(0.1)
+        assert not retrier.enqueue_global.called
+        committed.append(True)
+
+    mock_matrix._raiden_service.batch_state_changes = batch_state_changes
+
+    room, event = make_message(convert_to_hex=False)
+    assert mock_matrix._handle_message(room, event)
+
+    assert committed == [True]
+    retrier.enqueue_global.assert_called_once()
+    assert isinstance(retrier.enqueue_global.call_args[0][0], Delivered)
+
+
 def test_matrix_message_sync(
         local_matrix_servers,
         private_rooms,
@@ -1,10 +1,17 @@
+from datetime import datetime, timedelta, timezone
+
 import pytest
+from marshmallow import ValidationError
 
-from raiden.api.python import event_filter_for_payments
-from raiden.api.v1.encoding import EventPaymentSentFailedSchema
+from raiden.api.python import event_filter_for_payments, log_time_from_datetime
+from raiden.api.v1.encoding import (
+    EventPaymentSentFailedSchema,
+    EventPaymentSentSuccessSchema,
+    PaymentHistoryRequestSchema,
+)
 from raiden.blockchain.events import get_contract_events
 from raiden.exceptions import InvalidBlockNumberInput
-from raiden.storage.utils import TimestampedEvent
+from raiden.storage.utils import PaymentHistoryEvent, TimestampedEvent
 from raiden.tests.utils import factories
 from raiden.tests.utils.factories import ADDR
 from raiden.transfer.events import (
@@ -51,6 +58,51 @@ def test_v1_event_payment_sent_failed_schema():
     assert all(dumped.data.get(key) == value for key, value in expected.items())
 
 
+def test_v1_payment_history_schemas():
+    schema = PaymentHistoryRequestSchema()
+
+    loaded = schema.load({
+        'from_time': '2018-10-30T07:03:52.193',
+        'status': 'failed',
+        'after_event_identifier': '7',
+    }).data
+    assert loaded['from_time'] == datetime(2018, 10, 30, 7, 3, 52, 193000)
+    assert loaded['to_time'] is None
+    assert loaded['status'] == 'failed'
+    assert loaded['after_event_identifier'] == 7
+
+    assert schema.load({}).data['after_event_identifier'] == 0
+
+    with pytest.raises(ValidationError):
+        schema.load({'from_time': '30/10/2018'})
+
+    with pytest.raises(ValidationError):
+        schema.load({'status': 'pending'})
+
+    with pytest.raises(ValidationError):
+        schema.load({'after_event_identifier': '-1'})
+
+    event = EventPaymentSentSuccess(
+        payment_network_identifier=factories.make_payment_network_identifier(),
+        token_network_identifier=factories.make_address(),
+        identifier=1,
+        amount=5,
+        target=factories.make_address(),
+    )
+    dumped = EventPaymentSentSuccessSchema().dump(
+        PaymentHistoryEvent(event, '2018-09-07T20:02:35.000', 12),
+    )
+    assert dumped.data['event_identifier'] == 12
+
+
+def test_log_time_from_datetime():
+    assert log_time_from_datetime(None) is None
+    assert log_time_from_datetime(datetime(2018, 9, 7, 20, 2, 35)) == '2018-09-07T20:02:35.000'
+
+    local_time = datetime(2018, 9, 7, 22, 2, 35, 120000, tzinfo=timezone(timedelta(hours=2)))
+    assert log_time_from_datetime(local_time) == '2018-09-07T20:02:35.120'
+
+
 def test_event_filter_for_payments():
     token_network_identifier = factories.make_address()
     payment_network_identifier = factories.make_payment_network_identifier()
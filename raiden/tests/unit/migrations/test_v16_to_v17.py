@@ -1,13 +1,17 @@
+import json
 import random
+from contextlib import ExitStack
 from datetime import datetime
 from pathlib import Path
 from unittest.mock import patch
 
 from raiden.storage.serialize import JSONSerializer
-from raiden.storage.sqlite import SerializedSQLiteStorage, SQLiteStorage
+from raiden.storage.sqlite import RAIDEN_DB_VERSION, SerializedSQLiteStorage, SQLiteStorage
 from raiden.tests.utils import factories
 from raiden.transfer.state_change import ActionInitChain
-from raiden.utils.upgrades import UpgradeManager
+from raiden.utils.migrations import v16_to_v17
+from raiden.utils.migrations.v16_to_v17 import _transform_snapshot as transform_snapshot
+from raiden.utils.upgrades import UpgradeManager, get_db_version, get_upgrade_version
 
 
 def setup_storage(db_path):
@@ -55,3 +59,69 @@ def test_upgrade_v16_to_v17(tmp_path):
     storage = SQLiteStorage(str(db_path))
     snapshot = storage.get_latest_state_snapshot()
     assert snapshot is not None
+
+
+def test_upgrade_v16_to_v17_resumes_after_interruption(tmp_path):
+    db_path = tmp_path / Path('test.db')
+
+    old_db_filename = tmp_path / Path('v16_log.db')
+    storage = setup_storage(str(old_db_filename))
+    cursor = storage.conn.cursor()
+    cursor.execute(
+        'INSERT INTO state_snapshot(identifier, statechange_id, data) '
+        'SELECT identifier + 1, statechange_id, data FROM state_snapshot',
+    )
+    cursor.execute(
+        'INSERT INTO state_snapshot(identifier, statechange_id, data) '
+        'SELECT identifier + 2, statechange_id, data FROM state_snapshot',
+    )
+    storage.conn.commit()
+    with patch('raiden.storage.sqlite.RAIDEN_DB_VERSION', new=16):
+        storage.update_version()
+    storage.conn.close()
+
+    transformed_snapshots = list()
+
+    def interrupted_transform(raw_snapshot):
+        if len(transformed_snapshots) == 3:
+            raise KeyboardInterrupt()
+        transformed_snapshots.append(raw_snapshot)
+        return transform_snapshot(raw_snapshot)
+
+    with ExitStack() as stack:
+        older_db_file = stack.enter_context(patch('raiden.utils.upgrades.older_db_file'))
+        older_db_file.return_value = str(old_db_filename)
+        stack.enter_context(patch.object(v16_to_v17, 'SNAPSHOT_MIGRATION_BATCH_SIZE', new=2))
+        stack.enter_context(patch.object(
+            v16_to_v17,
+            '_transform_snapshot',
+            new=interrupted_transform,
+        ))
+
+        try:
+            UpgradeManager(db_filename=str(db_path)).run()
+        except KeyboardInterrupt:
+            pass
+
+    assert get_upgrade_version(db_path) == 16
+    assert old_db_filename.exists()
+
+    with patch('raiden.utils.upgrades.older_db_file') as older_db_file:
+        older_db_file.return_value = str(old_db_filename)
+        with patch.object(v16_to_v17, '_transform_snapshot') as resumed_transform:
+            resumed_transform.side_effect = transform_snapshot
+            UpgradeManager(db_filename=str(db_path)).run()
+
+    # The first batch was committed before the interruption
+    assert resumed_transform.call_count == 2
+    assert get_upgrade_version(db_path) is None
+    assert get_db_version(db_path) == RAIDEN_DB_VERSION
+    assert not old_db_filename.exists()
+
+    storage = SQLiteStorage(str(db_path))
+    for snapshot in storage.get_snapshots():
+        secrethashes_to_task = json.loads(snapshot.data)['payment_mapping']['secrethashes_to_task']
+        for task in secrethashes_to_task.values():
+            if task['_type'] == 'raiden.transfer.state.InitiatorTask':
+                assert 'initiator' not in task['manager_state']
+                assert task['manager_state']['initiator_transfers']
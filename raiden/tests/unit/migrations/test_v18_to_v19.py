@@ -0,0 +1,69 @@
+import itertools
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from raiden.storage.serialize import JSONSerializer
+from raiden.storage.sqlite import SerializedSQLiteStorage
+from raiden.tests.unit.test_sqlite import make_signed_balance_proof_from_counter
+from raiden.tests.utils import factories
+from raiden.transfer.state_change import ReceiveUnlock
+from raiden.transfer.utils import get_state_change_with_balance_proof_by_locksroot
+from raiden.utils import sha3
+from raiden.utils.upgrades import UpgradeManager
+
+
+def setup_storage(db_path, state_changes):
+    storage = SerializedSQLiteStorage(str(db_path), JSONSerializer())
+
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+    for state_change in state_changes:
+        storage.write_state_change(state_change, timestamp)
+
+    # Version 18 databases don't have the lookup tables populated
+    cursor = storage.conn.cursor()
+    cursor.execute('DELETE FROM state_changes_balance_proofs')
+    storage.conn.commit()
+
+    return storage
+
+
+def test_upgrade_v18_to_v19(tmp_path):
+    counter = itertools.count()
+    unlocks = [
+        ReceiveUnlock(
+            message_identifier=next(counter),
+            secret=sha3(factories.make_secret(next(counter))),
+            balance_proof=make_signed_balance_proof_from_counter(counter),
+        )
+        for _ in range(3)
+    ]
+
+    db_path = tmp_path / Path('v19_log.db')
+    old_db_filename = tmp_path / Path('v18_log.db')
+    with patch('raiden.utils.upgrades.older_db_file') as older_db_file:
+        older_db_file.return_value = str(old_db_filename)
+        storage = setup_storage(old_db_filename, unlocks)
+        with patch('raiden.storage.sqlite.RAIDEN_DB_VERSION', new=18):
+            storage.update_version()
+        storage.conn.close()
+
+        UpgradeManager(db_filename=str(db_path)).run()
+
+    storage = SerializedSQLiteStorage(str(db_path), JSONSerializer())
+
+    cursor = storage.conn.cursor()
+    cursor.execute('SELECT COUNT(1) FROM state_changes_balance_proofs')
+    assert cursor.fetchone()[0] == len(unlocks)
+
+    for unlock in unlocks:
+        balance_proof = unlock.balance_proof
+        state_change_record = get_state_change_with_balance_proof_by_locksroot(
+            storage=storage,
+            chain_id=balance_proof.chain_id,
+            token_network_identifier=balance_proof.token_network_identifier,
+            channel_identifier=balance_proof.channel_identifier,
+            locksroot=balance_proof.locksroot,
+            sender=balance_proof.sender,
+        )
+        assert state_change_record.data == unlock
@@ -0,0 +1,71 @@
+import itertools
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from raiden.storage.serialize import BinarySerializer, JSONSerializer
+from raiden.storage.sqlite import SerializedSQLiteStorage
+from raiden.tests.unit.test_sqlite import make_payment_events
+from raiden.tests.utils import factories
+from raiden.transfer.events import EventPaymentSentSuccess
+from raiden.utils import optional_address_to_string
+from raiden.utils.upgrades import UpgradeManager
+
+
+def setup_storage(db_path, serializer, events):
+    storage = SerializedSQLiteStorage(
+        str(db_path),
+        serializer,
+        compression='zlib',
+        compress_state_changes=True,
+    )
+
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+    state_change_identifier = storage.write_state_change('', timestamp)
+    storage.write_events(state_change_identifier, events, timestamp)
+
+    # Version 19 databases don't have the payment history
+    cursor = storage.conn.cursor()
+    cursor.execute('DELETE FROM payment_history')
+    storage.conn.commit()
+
+    return storage
+
+
+@pytest.mark.parametrize('serializer', [JSONSerializer, BinarySerializer])
+def test_upgrade_v19_to_v20(tmp_path, serializer):
+    counter = itertools.count()
+    partner = factories.make_address()
+    events = (
+        make_payment_events(factories.make_address(), partner, counter) +
+        make_payment_events(factories.make_address(), factories.make_address(), counter)
+    )
+
+    db_path = tmp_path / Path('v20_log.db')
+    old_db_filename = tmp_path / Path('v19_log.db')
+    old_archive_filename = tmp_path / Path('v19_log_archive.db')
+    with patch('raiden.utils.upgrades.older_db_file') as older_db_file:
+        older_db_file.return_value = str(old_db_filename)
+        storage = setup_storage(old_db_filename, serializer, events)
+        storage.attach_archive(str(old_archive_filename))
+        with patch('raiden.storage.sqlite.RAIDEN_DB_VERSION', new=19):
+            storage.update_version()
+        storage.conn.close()
+
+        UpgradeManager(db_filename=str(db_path)).run()
+
+    assert not old_archive_filename.exists()
+    assert (tmp_path / Path('v20_log_archive.db')).exists()
+
+    storage = SerializedSQLiteStorage(str(db_path), serializer)
+
+    records = storage.iterate_payment_history()
+    assert [record.data for record in records] == events
+
+    records = storage.iterate_payment_history(
+        partner=optional_address_to_string(partner),
+        event_types=[EventPaymentSentSuccess.__name__],
+    )
+    assert [record.data for record in records] == events[:1]
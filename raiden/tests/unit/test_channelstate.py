@@ -24,7 +24,11 @@ from raiden.tests.utils.factories import (
     create,
     make_secret,
 )
-from raiden.tests.utils.transfer import make_receive_expired_lock, make_receive_transfer_mediated
+from raiden.tests.utils.transfer import (
+    assert_amount_locked,
+    make_receive_expired_lock,
+    make_receive_transfer_mediated,
+)
 from raiden.transfer import channel
 from raiden.transfer.events import (
     ContractSendChannelBatchUnlock,
@@ -80,6 +84,7 @@ def assert_partner_state(end_state, partner_state, model):
     """Checks that the stored data for both ends correspond to the model."""
     assert end_state.address == model.participant_address
     assert channel.get_amount_locked(end_state) == model.amount_locked
+    assert_amount_locked(end_state)
     assert channel.get_balance(end_state, partner_state) == model.balance
     assert channel.get_distributable(end_state, partner_state) == model.distributable
     assert channel.get_next_nonce(end_state) == model.next_nonce
@@ -1730,12 +1735,12 @@ def test_get_amount_locked():
 
     assert channel.get_amount_locked(state) == 0
 
-    secrethash = sha3(factories.make_secret(1))
-    state.secrethashes_to_lockedlocks[secrethash] = HashTimeLockState(
+    secrethash = sha3(factories.make_secret(0))
+    channel.register_lock(state, HashTimeLockState(
         amount=23,
         expiration=100,
         secrethash=secrethash,
-    )
+    ))
     assert channel.get_amount_locked(state) == 23
 
     secret = factories.make_secret(1)
@@ -1745,11 +1750,10 @@ def test_get_amount_locked():
         expiration=100,
         secrethash=secrethash,
     )
-    state.secrethashes_to_unlockedlocks[secrethash] = UnlockPartialProofState(
-        lock=lock,
-        secret=secret,
-    )
+    channel.register_lock(state, lock)
+    channel.register_secret_endstate(state, secret, secrethash)
     assert channel.get_amount_locked(state) == 44
+    assert secrethash in state.secrethashes_to_unlockedlocks
 
     secret = factories.make_secret(2)
     secrethash = sha3(secret)
@@ -1758,12 +1762,34 @@ def test_get_amount_locked():
         expiration=100,
         secrethash=secrethash,
     )
-    state.secrethashes_to_onchain_unlockedlocks[secrethash] = UnlockPartialProofState(
-        lock=lock,
+    channel.register_lock(state, lock)
+    channel.register_onchain_secret_endstate(
+        end_state=state,
+        secret=secret,
+        secrethash=secrethash,
+        secret_reveal_block_number=10,
+    )
+    assert channel.get_amount_locked(state) == 63
+    assert secrethash in state.secrethashes_to_onchain_unlockedlocks
+    assert_amount_locked(state)
+
+    # Registering the same lock again must not count it twice
+    channel.register_lock(state, lock)
+    channel.register_onchain_secret_endstate(
+        end_state=state,
         secret=secret,
+        secrethash=secrethash,
+        secret_reveal_block_number=10,
     )
     assert channel.get_amount_locked(state) == 63
 
+    channel._del_lock(state, secrethash)  # pylint: disable=protected-access
+    assert channel.get_amount_locked(state) == 44
+    assert_amount_locked(state)
+
+    restored = NettingChannelEndState.from_dict(state.to_dict())
+    assert restored.amount_locked == 44
+
 
 def test_valid_lock_expired_for_unlocked_lock():
     """ This tests that locked and unlocked locks hehave the same when
@@ -5,6 +5,7 @@ from raiden.exceptions import HashLengthNot32
 from raiden.transfer.merkle_tree import (
     MERKLEROOT,
     compute_layers,
+    compute_layers_with,
     compute_merkleproof_for,
     merkleroot,
     validate_proof,
@@ -42,6 +43,13 @@ def test_compute_layers_duplicated():
         compute_layers([hash_0, hash_1, hash_0])
 
 
+def test_compute_layers_with_invalid_length():
+    layers = compute_layers([sha3(b'x')])
+
+    with pytest.raises(HashLengthNot32):
+        compute_layers_with(layers, b'not32bytes')
+
+
 def test_compute_layers_single_entry():
     hash_0 = sha3(b'x')
     layers = compute_layers([hash_0])
@@ -1,9 +1,12 @@
 import random
 
+import pytest
+
 from raiden.constants import EMPTY_HASH
 from raiden.tests.utils import factories
 from raiden.tests.utils.messages import make_mediated_transfer
 from raiden.transfer import node, state, state_change
+from raiden.transfer.architecture import TransitionResult
 from raiden.transfer.mediated_transfer import events
 from raiden.transfer.queue_identifier import QueueIdentifier
 
@@ -45,7 +48,10 @@ def test_delivered_message_must_clean_unordered_messages(chain_id):
         secret,
     )
 
-    chain_state.queueids_to_queues[queue_identifier] = [first_message, second_message]
+    chain_state.queueids_to_queues[queue_identifier] = state.MessageQueue([
+        first_message,
+        second_message,
+    ])
 
     delivered_message = state_change.ReceiveDelivered(recipient, message_identifier)
 
@@ -55,7 +61,7 @@ def test_delivered_message_must_clean_unordered_messages(chain_id):
     assert first_message not in new_queue
 
 
-def test_delivered_processed_message_cleanup():
+def test_delivered_processed_message_cleanup(chain_state):
     recipient = factories.make_address()
     channel_identifier = 1
     secret = factories.random_secret()
@@ -72,27 +78,32 @@ def test_delivered_processed_message_cleanup():
         random.randint(0, 2 ** 16),
         secret,
     )
-    message_queue = [first_message, second_message]
+    queue_identifier = first_message.queue_identifier
+    message_queue = state.MessageQueue([first_message, second_message])
+    chain_state.queueids_to_queues[queue_identifier] = message_queue
 
     fake_message_identifier = random.randint(0, 2 ** 16)
-    node.inplace_delete_message(
-        message_queue,
+    node.inplace_delete_message_queue(
+        chain_state,
         state_change.ReceiveDelivered(recipient, fake_message_identifier),
+        queue_identifier,
     )
     assert first_message in message_queue, 'invalid message id must be ignored'
     assert second_message in message_queue, 'invalid message id must be ignored'
 
     invalid_sender_address = factories.make_address()
-    node.inplace_delete_message(
-        message_queue,
+    node.inplace_delete_message_queue(
+        chain_state,
         state_change.ReceiveDelivered(invalid_sender_address, first_message.message_identifier),
+        queue_identifier,
     )
     assert first_message in message_queue, 'invalid sender id must be ignored'
     assert second_message in message_queue, 'invalid sender id must be ignored'
 
-    node.inplace_delete_message(
-        message_queue,
+    node.inplace_delete_message_queue(
+        chain_state,
         state_change.ReceiveProcessed(recipient, first_message.message_identifier),
+        queue_identifier,
     )
     msg = 'message must be cleared when a valid delivered is received'
     assert first_message not in message_queue, msg
@@ -127,7 +138,7 @@ def test_channel_closed_must_clear_ordered_messages(
         recipient=recipient,
     )
 
-    chain_state.queueids_to_queues[queue_identifier] = [message]
+    chain_state.queueids_to_queues[queue_identifier] = state.MessageQueue([message])
 
     closed = state_change.ContractReceiveChannelClosed(
         transaction_hash=EMPTY_HASH,
@@ -143,3 +154,72 @@ def test_channel_closed_must_clear_ordered_messages(
         closed,
     )
     assert queue_identifier not in iteration.new_state.queueids_to_queues
+
+
+def test_processed_message_cleanup_through_index(chain_state):
+    recipient = factories.make_address()
+    secret = factories.random_secret()
+    message_identifier = random.randint(0, 2 ** 16)
+
+    def make_secret_reveal(channel_identifier, message_identifier):
+        return events.SendSecretReveal(
+            recipient,
+            channel_identifier,
+            message_identifier,
+            secret,
+        )
+
+    first_message = make_secret_reveal(1, message_identifier)
+    second_message = make_secret_reveal(1, message_identifier + 1)
+    third_message = make_secret_reveal(2, message_identifier)
+
+    # Messages enqueued before and after the index is built
+    chain_state.queueids_to_queues[first_message.queue_identifier] = state.MessageQueue([
+        first_message,
+    ])
+    node.get_message_queues_index(chain_state)
+    node.update_queues(
+        TransitionResult(chain_state, [second_message, third_message, third_message]),
+        state_change.ReceiveDelivered(recipient, message_identifier),
+    )
+
+    processed = state_change.ReceiveProcessed(recipient, message_identifier)
+    iteration = node.handle_processed(chain_state, processed)
+
+    queueids_to_queues = iteration.new_state.queueids_to_queues
+    assert queueids_to_queues[first_message.queue_identifier] == [second_message]
+    assert third_message.queue_identifier not in queueids_to_queues
+    assert not iteration.new_state.message_queues_index.keys_to_messages.get(
+        (recipient, message_identifier),
+    )
+
+
+def test_message_queue_removal_keeps_order_and_serialization(chain_state):
+    recipient = factories.make_address()
+    secret = factories.random_secret()
+    messages = [
+        events.SendSecretReveal(recipient, 1, message_identifier, secret)
+        for message_identifier in range(10)
+    ]
+    queue = state.MessageQueue(messages)
+
+    for message in messages[3:7]:
+        queue.remove(message)
+    queue.remove(messages[0])
+
+    remaining = [messages[1], messages[2], messages[7], messages[8], messages[9]]
+    assert queue == remaining
+    assert len(queue) == 5
+    assert len(queue.entries) < len(messages), 'the tombstones must be compacted'
+
+    queue.append(messages[0])
+    assert list(queue) == remaining + [messages[0]]
+
+    with pytest.raises(ValueError):
+        queue.remove(messages[3])
+
+    chain_state.queueids_to_queues[messages[0].queue_identifier] = queue
+    restored = state.ChainState.from_dict(chain_state.to_dict())
+    restored_queue = restored.queueids_to_queues[messages[0].queue_identifier]
+    assert isinstance(restored_queue, state.MessageQueue)
+    assert restored_queue == queue
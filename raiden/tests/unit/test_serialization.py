@@ -4,9 +4,16 @@ import pytest
 from eth_utils import to_canonical_address
 from networkx import Graph
 
-from raiden.storage.serialize import JSONSerializer
+from raiden.storage.serialize import (
+    BINARY_TYPE_IDS,
+    BINARY_TYPE_REGISTRY,
+    BinarySerializer,
+    JSONSerializer,
+    _import_type,
+)
 from raiden.tests.utils import factories
 from raiden.transfer import state, state_change
+from raiden.transfer.mediated_transfer.state_change import ActionInitTarget
 from raiden.transfer.merkle_tree import compute_layers
 from raiden.transfer.state import make_empty_merkle_tree
 from raiden.utils import serialization
@@ -42,11 +49,12 @@ class MockObject(object):
         return True
 
 
-def test_object_custom_serialization():
+@pytest.mark.parametrize('serializer', [JSONSerializer, BinarySerializer])
+def test_object_custom_serialization(serializer):
     # Simple encode/decode
     original_obj = MockObject(attr1="Hello", attr2="World")
-    decoded_obj = JSONSerializer.deserialize(
-        JSONSerializer.serialize(original_obj),
+    decoded_obj = serializer.deserialize(
+        serializer.serialize(original_obj),
     )
 
     assert original_obj == decoded_obj
@@ -54,8 +62,8 @@ def test_object_custom_serialization():
     # Encode/Decode with embedded objects
     embedded_obj = MockObject(amount=1, identifier='123')
     original_obj = MockObject(embedded=embedded_obj)
-    decoded_obj = JSONSerializer.deserialize(
-        JSONSerializer.serialize(original_obj),
+    decoded_obj = serializer.deserialize(
+        serializer.serialize(original_obj),
     )
 
     assert original_obj == decoded_obj
@@ -134,7 +142,8 @@ def test_serialization_merkletree_layers_empty():
     assert tree.layers == restored
 
 
-def test_actioninitchain_restore():
+@pytest.mark.parametrize('serializer', [JSONSerializer, BinarySerializer])
+def test_actioninitchain_restore(serializer):
     """ ActionInitChain *must* restore the previous pseudo random generator
     state.
 
@@ -164,14 +173,15 @@ def test_actioninitchain_restore():
         chain_id=chain_id,
     )
 
-    decoded_obj = JSONSerializer.deserialize(
-        JSONSerializer.serialize(original_obj),
+    decoded_obj = serializer.deserialize(
+        serializer.serialize(original_obj),
     )
 
     assert original_obj == decoded_obj
 
 
-def test_chainstate_restore():
+@pytest.mark.parametrize('serializer', [JSONSerializer, BinarySerializer])
+def test_chainstate_restore(serializer):
     pseudo_random_generator = random.Random()
     block_number = 577
     our_address = factories.make_address()
@@ -185,8 +195,78 @@ def test_chainstate_restore():
         chain_id=chain_id,
     )
 
-    decoded_obj = JSONSerializer.deserialize(
-        JSONSerializer.serialize(original_obj),
+    decoded_obj = serializer.deserialize(
+        serializer.serialize(original_obj),
     )
 
     assert original_obj == decoded_obj
+
+
+def test_binary_serialization_of_signed_transfer():
+    transfer = factories.make_signed_transfer_state(
+        amount=10,
+        initiator=factories.make_address(),
+        target=factories.make_address(),
+        expiration=100,
+        secret=factories.make_secret(),
+    )
+    route = factories.make_route_from_channel(factories.make_channel())
+    original_obj = ActionInitTarget(route=route, transfer=transfer)
+
+    binary_data = BinarySerializer.serialize(original_obj)
+    assert original_obj == BinarySerializer.deserialize(binary_data)
+
+    # hashes and signatures are stored as bytes instead of hex strings
+    assert len(binary_data) < len(JSONSerializer.serialize(original_obj))
+
+
+def test_binary_serialization_of_plain_values():
+    original_obj = MockObject(
+        big_amount=2 ** 256 - 1,
+        negative_amount=-2 ** 70,
+        hex_values=['0x', '0xabcd', '0xABCD', '0xabc'],
+        int_keys={1: 'one'},
+    )
+    decoded_obj = BinarySerializer.deserialize(BinarySerializer.serialize(original_obj))
+
+    # Same as with json, dictionary keys are strings
+    assert decoded_obj.int_keys == {'1': 'one'}
+    delattr(original_obj, 'int_keys')
+    delattr(decoded_obj, 'int_keys')
+
+    assert original_obj == decoded_obj
+
+
+def test_serializers_read_each_other_data():
+    original_obj = MockObject(attr1='Hello', embedded=MockObject(amount=1))
+
+    binary_data = BinarySerializer.serialize(original_obj)
+    json_data = JSONSerializer.serialize(original_obj)
+
+    assert original_obj == JSONSerializer.deserialize(binary_data)
+    assert original_obj == BinarySerializer.deserialize(json_data)
+
+
+@pytest.mark.parametrize('serializer', [JSONSerializer, BinarySerializer])
+def test_serialize_dict_of_serialized_values(serializer):
+    values = {
+        'first': MockObject(attr1='Hello', embedded=MockObject(amount=1)),
+        'second': None,
+    }
+    serialized_values = {
+        key: serializer.serialize(value)
+        for key, value in values.items()
+    }
+
+    data = serializer.serialize_dict(serialized_values)
+    assert values == serializer.deserialize(data)
+    assert serializer.deserialize(serializer.serialize_dict(dict())) == dict()
+
+
+def test_binary_type_registry():
+    assert len(BINARY_TYPE_IDS) == len(BINARY_TYPE_REGISTRY), 'duplicated registry entries'
+
+    for type_name in BINARY_TYPE_REGISTRY:
+        klass = _import_type(type_name)
+        assert hasattr(klass, 'from_dict')
+        assert hasattr(klass, 'to_dict')
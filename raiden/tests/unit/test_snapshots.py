@@ -0,0 +1,226 @@
+from copy import deepcopy
+
+import pytest
+
+from raiden.storage.serialize import JSONSerializer
+from raiden.storage.snapshots import (
+    CHAIN_STATE_PART,
+    SnapshotScheduler,
+    SnapshotWriter,
+    join_chain_state,
+    split_chain_state,
+)
+from raiden.storage.sqlite import SerializedSQLiteStorage
+from raiden.storage.wal import WriteAheadLog, restore_to_state_change
+from raiden.tests.utils import factories
+from raiden.transfer.architecture import StateManager, TransitionResult
+from raiden.transfer.state_change import Block
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_scheduler_snapshots_on_state_changes_count():
+    scheduler = SnapshotScheduler(state_changes_count=3)
+
+    for _ in range(2):
+        scheduler.state_change_dispatched(0.001)
+        assert not scheduler.should_snapshot()
+
+    scheduler.state_change_dispatched(0.001)
+    assert scheduler.should_snapshot()
+
+    scheduler.snapshot_done(0.1)
+    assert not scheduler.should_snapshot()
+    assert scheduler.pending_state_changes == 0
+    assert scheduler.last_snapshot_duration == 0.1
+
+
+def test_scheduler_is_seeded_with_pending_state_changes():
+    scheduler = SnapshotScheduler(state_changes_count=3, pending_state_changes=2)
+    assert not scheduler.should_snapshot()
+
+    scheduler.state_change_dispatched(0.001)
+    assert scheduler.should_snapshot()
+
+
+def test_scheduler_snapshots_on_interval():
+    clock = FakeClock()
+    scheduler = SnapshotScheduler(state_changes_count=100, interval=10, clock=clock)
+
+    clock.now = 20
+    assert not scheduler.should_snapshot(), 'no snapshot without new state changes'
+
+    scheduler.state_change_dispatched(0.001)
+    assert scheduler.should_snapshot()
+
+    scheduler.snapshot_done(0.1)
+    scheduler.state_change_dispatched(0.001)
+    clock.now = 25
+    assert not scheduler.should_snapshot()
+
+    clock.now = 30
+    assert scheduler.should_snapshot()
+
+
+def test_scheduler_snapshots_on_replay_cost():
+    scheduler = SnapshotScheduler(state_changes_count=100, replay_cost=1.0)
+
+    scheduler.state_change_dispatched(0.6)
+    assert not scheduler.should_snapshot()
+
+    scheduler.state_change_dispatched(0.6)
+    assert scheduler.should_snapshot()
+
+    scheduler.snapshot_done(0.1)
+    assert scheduler.pending_replay_cost == 0
+
+
+def test_scheduler_rejects_invalid_count():
+    with pytest.raises(ValueError):
+        SnapshotScheduler(state_changes_count=0)
+
+
+def state_transition_block(chain_state, state_change):
+    chain_state.block_number = state_change.block_number
+    return TransitionResult(chain_state, list())
+
+
+def log_block(wal, block_number):
+    wal.log_and_dispatch(Block(
+        block_number=block_number,
+        gas_limit=1,
+        block_hash=factories.make_block_hash(),
+    ))
+
+
+def channel_part_key(channel_state):
+    return f'channel/{channel_state.token_network_identifier.hex()}/{channel_state.identifier}'
+
+
+def test_split_and_join_chain_state(chain_state, netting_channel_state):
+    parts = split_chain_state(chain_state)
+
+    assert len(parts) == 3
+    assert parts[channel_part_key(netting_channel_state)] == netting_channel_state
+
+    token_network_id = netting_channel_state.token_network_identifier
+    payment_network_id = netting_channel_state.payment_network_identifier
+    token_network_key = f'token_network/{payment_network_id.hex()}/{token_network_id.hex()}'
+    token_network_part = parts[token_network_key]
+    assert token_network_part.channelidentifiers_to_channels == dict()
+
+    chain_state_copy = deepcopy(chain_state)
+    assert join_chain_state(parts) == chain_state
+
+    # the state which was split must not be modified
+    assert chain_state == chain_state_copy
+
+
+def test_delta_snapshots_restore(chain_state, netting_channel_state):
+    storage = SerializedSQLiteStorage(':memory:', JSONSerializer)
+    state_manager = StateManager(state_transition_block, chain_state)
+    wal = WriteAheadLog(state_manager, storage, full_snapshot_interval=3)
+
+    log_block(wal, 2)
+    wal.snapshot()
+    assert storage.get_snapshot_deltas_closest_to_state_change('latest') == []
+
+    current_state = wal.state_manager.current_state
+    token_network = list(
+        list(current_state.identifiers_to_paymentnetworks.values())[0]
+        .tokenidentifiers_to_tokennetworks.values(),
+    )[0]
+    channel_state = token_network.channelidentifiers_to_channels[netting_channel_state.identifier]
+    channel_state.our_state.contract_balance += 10
+
+    log_block(wal, 3)
+    wal.snapshot()
+    state_after_first_delta = deepcopy(wal.state_manager.current_state)
+    state_change_id_after_first_delta = wal.state_change_id
+
+    _, delta = storage.get_snapshot_deltas_closest_to_state_change('latest')[-1]
+    assert delta.keys() == {CHAIN_STATE_PART, channel_part_key(channel_state)}
+
+    current_state = wal.state_manager.current_state
+    token_network = list(
+        list(current_state.identifiers_to_paymentnetworks.values())[0]
+        .tokenidentifiers_to_tokennetworks.values(),
+    )[0]
+    del token_network.channelidentifiers_to_channels[netting_channel_state.identifier]
+
+    log_block(wal, 4)
+    wal.snapshot()
+
+    _, delta = storage.get_snapshot_deltas_closest_to_state_change('latest')[-1]
+    assert delta[channel_part_key(channel_state)] is None
+
+    restored = restore_to_state_change(state_transition_block, storage, 'latest')
+    assert restored.state_manager.current_state == wal.state_manager.current_state
+
+    restored = restore_to_state_change(
+        state_transition_block,
+        storage,
+        state_change_id_after_first_delta,
+    )
+    assert restored.state_manager.current_state == state_after_first_delta
+
+    # the third snapshot after the base is a full snapshot again
+    log_block(wal, 5)
+    wal.snapshot()
+    assert storage.get_snapshot_deltas_closest_to_state_change('latest') == []
+    assert len(storage.get_snapshots()) == 2
+
+
+def test_delta_snapshots_reuse_the_serialization_of_the_parts(
+        chain_state,
+        netting_channel_state,
+):
+    serialized = list()
+
+    class RecordingSerializer(JSONSerializer):
+        @staticmethod
+        def serialize(obj):
+            serialized.append(obj)
+            return JSONSerializer.serialize(obj)
+
+    storage = SerializedSQLiteStorage(':memory:', RecordingSerializer)
+    writer = SnapshotWriter(storage, full_snapshot_interval=3)
+
+    def write_block(block_number):
+        block = Block(
+            block_number=block_number,
+            gas_limit=1,
+            block_hash=factories.make_block_hash(),
+        )
+        state_change_id = storage.write_state_change(block, '2019-01-01T00:00:00.000')
+        serialized.clear()
+        return state_change_id
+
+    # The full snapshot serializes every part for its digest, plus the state
+    state_change_id = write_block(chain_state.block_number)
+    writer.write(state_change_id, chain_state)
+    assert len(serialized) == 4
+    assert serialized[-1] is chain_state
+
+    # The channel is the same object, it is neither serialized nor written
+    chain_state.block_number += 1
+    state_change_id = write_block(chain_state.block_number)
+    writer.write(state_change_id, chain_state)
+    assert netting_channel_state not in serialized
+    assert len(serialized) == 2
+
+    [(_, delta)] = storage.get_snapshot_deltas_closest_to_state_change(state_change_id)
+    assert delta.keys() == {CHAIN_STATE_PART}
+    assert delta[CHAIN_STATE_PART].block_number == chain_state.block_number
+
+
+def test_full_snapshot_interval_must_be_positive():
+    storage = SerializedSQLiteStorage(':memory:', JSONSerializer)
+    with pytest.raises(ValueError):
+        WriteAheadLog(StateManager(state_transition_block, None), storage, 0)
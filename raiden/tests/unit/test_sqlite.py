@@ -1,11 +1,24 @@
 import itertools
+import time
 from datetime import datetime, timedelta
 from unittest.mock import patch
 
+import gevent
+import pytest
+
+from raiden.exceptions import InvalidNumberInput
 from raiden.messages import Lock
-from raiden.storage.serialize import JSONSerializer
-from raiden.storage.sqlite import SerializedSQLiteStorage
+from raiden.storage.compression import ZlibCodec, compress, decompress, is_compressed
+from raiden.storage.executor import StorageExecutor
+from raiden.storage.serialize import BinarySerializer, JSONSerializer
+from raiden.storage.sqlite import BALANCE_PROOF_LOOKUP_FIELDS, SerializedSQLiteStorage
 from raiden.tests.utils import factories
+from raiden.transfer import views
+from raiden.transfer.events import (
+    EventPaymentReceivedSuccess,
+    EventPaymentSentFailed,
+    EventPaymentSentSuccess,
+)
 from raiden.transfer.mediated_transfer.events import (
     SendBalanceProof,
     SendLockedTransfer,
@@ -23,9 +36,11 @@ from raiden.transfer.state import BalanceProofUnsignedState
 from raiden.transfer.state_change import ReceiveUnlock
 from raiden.transfer.utils import (
     get_event_with_balance_proof_by_balance_hash,
+    get_event_with_balance_proof_by_locksroot,
     get_state_change_with_balance_proof_by_balance_hash,
+    get_state_change_with_balance_proof_by_locksroot,
 )
-from raiden.utils import CanonicalIdentifier, sha3
+from raiden.utils import CanonicalIdentifier, optional_address_to_string, sha3
 
 
 def make_signed_balance_proof_from_counter(counter):
@@ -136,11 +151,11 @@ def make_from_route_from_counter(counter):
     return from_route, from_transfer
 
 
-def test_get_state_change_with_balance_proof():
+@pytest.mark.parametrize('serializer', [JSONSerializer, BinarySerializer])
+def test_get_state_change_with_balance_proof(serializer):
     """ All state changes which contain a balance proof must be found by when
     querying the database.
     """
-    serializer = JSONSerializer
     storage = SerializedSQLiteStorage(':memory:', serializer)
     counter = itertools.count()
 
@@ -214,12 +229,22 @@ def test_get_state_change_with_balance_proof():
         )
         assert state_change_record.data == state_change
 
+        state_change_record = get_state_change_with_balance_proof_by_locksroot(
+            storage=storage,
+            chain_id=balance_proof.chain_id,
+            token_network_identifier=balance_proof.token_network_identifier,
+            channel_identifier=balance_proof.channel_identifier,
+            sender=balance_proof.sender,
+            locksroot=balance_proof.locksroot,
+        )
+        assert state_change_record.data == state_change
+
 
-def test_get_event_with_balance_proof():
+@pytest.mark.parametrize('serializer', [JSONSerializer, BinarySerializer])
+def test_get_event_with_balance_proof(serializer):
     """ All events which contain a balance proof must be found by when
     querying the database.
     """
-    serializer = JSONSerializer
     storage = SerializedSQLiteStorage(':memory:', serializer)
     counter = itertools.count()
 
@@ -284,6 +309,448 @@ def test_get_event_with_balance_proof():
         # Issue https://github.com/raiden-network/raiden/issues/3179
         assert event_record.data.balance_proof == event.balance_proof
 
+        event_record = get_event_with_balance_proof_by_locksroot(
+            storage=storage,
+            chain_id=balance_proof.chain_id,
+            token_network_identifier=balance_proof.token_network_identifier,
+            channel_identifier=balance_proof.channel_identifier,
+            locksroot=balance_proof.locksroot,
+        )
+        assert event_record.data == event
+
+
+def test_balance_proof_lookup_tables_match_serialized_data():
+    """ The lookup tables must have the same values as the serialized data,
+    otherwise the indexed queries would not find the rows found by a full
+    table scan.
+    """
+    serializer = JSONSerializer
+    storage = SerializedSQLiteStorage(':memory:', serializer)
+    counter = itertools.count()
+
+    unlock = ReceiveUnlock(
+        message_identifier=next(counter),
+        secret=sha3(factories.make_secret(next(counter))),
+        balance_proof=make_signed_balance_proof_from_counter(counter),
+    )
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+    state_change_identifier = storage.write_state_change(unlock, timestamp)
+
+    cursor = storage.conn.cursor()
+    for field in BALANCE_PROOF_LOOKUP_FIELDS:
+        cursor.execute(
+            f'SELECT bp.{field}, json_extract(sc.data, ?) '
+            f'FROM state_changes_balance_proofs AS bp '
+            f'JOIN state_changes AS sc ON sc.identifier = bp.state_change_identifier '
+            f'WHERE sc.identifier = ?',
+            (f'$.balance_proof.{field}', state_change_identifier),
+        )
+        indexed_value, serialized_value = cursor.fetchone()
+        assert indexed_value == serialized_value
+
+
+def test_convert_serialization():
+    counter = itertools.count()
+    unlock = ReceiveUnlock(
+        message_identifier=next(counter),
+        secret=sha3(factories.make_secret(next(counter))),
+        balance_proof=make_signed_balance_proof_from_counter(counter),
+    )
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+
+    storage = SerializedSQLiteStorage(':memory:', JSONSerializer)
+    for _ in range(3):
+        storage.write_state_change(unlock, timestamp)
+    storage.write_events(1, [make_signed_transfer_from_counter(counter)], timestamp)
+
+    storage.serializer = BinarySerializer
+    storage.write_state_change(unlock, timestamp)
+    assert storage.get_serialization_format() == 'json'
+
+    storage.convert_serialization(batch_size=2)
+
+    assert storage.get_serialization_format() == 'binary'
+    for table in ('state_changes', 'state_events'):
+        cursor = storage.conn.execute(f'SELECT DISTINCT typeof(data) FROM {table}')
+        assert cursor.fetchall() == [('blob',)]
+
+    assert storage.get_statechanges_by_identifier(1, 'latest') == [unlock] * 4
+
+
+def test_compression():
+    for data in ('{"a": "0x00"}', b'\x81\xa1a\xa40x00', ''):
+        compressed = compress(data, ZlibCodec)
+        assert is_compressed(compressed)
+        assert decompress(compressed) == data
+
+    assert decompress('{}') == '{}'
+    assert decompress(b'\x80') == b'\x80'
+
+    with pytest.raises(ValueError):
+        decompress(b'\x00\xffb')
+
+
+@pytest.mark.parametrize('serializer', [JSONSerializer, BinarySerializer])
+def test_compressed_storage(serializer, netting_channel_state, chain_state):
+    """ The compressed and uncompressed rows must be readable with any
+    configuration.
+    """
+    storage = SerializedSQLiteStorage(
+        ':memory:',
+        serializer,
+        compression='zlib',
+        compress_state_changes=True,
+    )
+    counter = itertools.count()
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+
+    unlock = ReceiveUnlock(
+        message_identifier=next(counter),
+        secret=sha3(factories.make_secret(next(counter))),
+        balance_proof=make_signed_balance_proof_from_counter(counter),
+    )
+    balance_proof = SendBalanceProof(
+        recipient=factories.make_address(),
+        channel_identifier=factories.make_channel_identifier(),
+        message_identifier=next(counter),
+        payment_identifier=next(counter),
+        token_address=factories.make_address(),
+        secret=factories.make_secret(next(counter)),
+        balance_proof=make_balance_proof_from_counter(counter),
+    )
+    state_change_identifier = storage.write_state_change(unlock, timestamp)
+    storage.write_events(state_change_identifier, [balance_proof], timestamp)
+    storage.write_state_snapshot(state_change_identifier, chain_state)
+
+    for table in ('state_changes', 'state_events', 'state_snapshot'):
+        data, = storage.conn.execute(f'SELECT data FROM {table}').fetchone()
+        assert is_compressed(data)
+
+    # Only the snapshots are compressed by default
+    uncompressed_storage = SerializedSQLiteStorage(':memory:', serializer, compression='zlib')
+    uncompressed_storage.write_state_change(unlock, timestamp)
+    data, = uncompressed_storage.conn.execute('SELECT data FROM state_changes').fetchone()
+    assert not is_compressed(data)
+
+    storage.compression_codec = None
+    storage.compressed_tables = ()
+    storage.write_state_change(unlock, timestamp)
+
+    assert storage.get_statechanges_by_identifier(1, 'latest') == [unlock, unlock]
+    assert storage.get_events() == [balance_proof]
+    _, restored_chain_state = storage.get_snapshot_closest_to_state_change('latest')
+    assert restored_chain_state == chain_state
+    assert views.get_channelstate_by_id(
+        chain_state=restored_chain_state,
+        payment_network_id=netting_channel_state.payment_network_identifier,
+        token_address=netting_channel_state.token_address,
+        channel_id=netting_channel_state.identifier,
+    ) == netting_channel_state
+    assert get_event_with_balance_proof_by_balance_hash(
+        storage=storage,
+        chain_id=balance_proof.balance_proof.chain_id,
+        token_network_identifier=balance_proof.balance_proof.token_network_identifier,
+        channel_identifier=balance_proof.balance_proof.channel_identifier,
+        balance_hash=balance_proof.balance_proof.balance_hash,
+    ).data == balance_proof
+
+
+def test_compressed_storage_rejects_unindexed_filters():
+    storage = SerializedSQLiteStorage(
+        ':memory:',
+        JSONSerializer,
+        compression='zlib',
+        compress_state_changes=True,
+    )
+
+    with pytest.raises(ValueError):
+        storage.get_latest_event_by_data_field({
+            '_type': 'raiden.transfer.mediated_transfer.events.SendBalanceProof',
+        })
+
+
+def test_binary_storage_rejects_unindexed_filters():
+    storage = SerializedSQLiteStorage(':memory:', BinarySerializer)
+
+    with pytest.raises(ValueError):
+        storage.get_latest_state_change_by_data_field({
+            '_type': 'raiden.transfer.state_change.ReceiveUnlock',
+        })
+
+
+def test_iterate_statechanges_by_identifier():
+    """ The iterators must return the same rows as the list based methods,
+    independently of the batch size, reading one batch at a time.
+    """
+    storage = SerializedSQLiteStorage(':memory:', JSONSerializer)
+    counter = itertools.count()
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+
+    state_changes = [
+        ReceiveUnlock(
+            message_identifier=next(counter),
+            secret=sha3(factories.make_secret(next(counter))),
+            balance_proof=make_signed_balance_proof_from_counter(counter),
+        )
+        for _ in range(7)
+    ]
+    for state_change in state_changes:
+        storage.write_state_change(state_change, timestamp)
+
+    queries = []
+
+    def trace(query):
+        queries.append(query)
+
+    storage.conn.set_trace_callback(trace)
+
+    iterator = storage.iterate_statechanges_by_identifier(0, 'latest', batch_size=3)
+    assert next(iterator) == state_changes[0]
+    assert len(queries) == 1
+    assert list(iterator) == state_changes[1:]
+    assert len(queries) == 3
+
+    storage.conn.set_trace_callback(None)
+
+    for batch_size in (1, 2, 7, 10):
+        assert list(storage.iterate_statechanges_by_identifier(
+            2, 5, batch_size=batch_size,
+        )) == state_changes[1:5]
+        assert list(storage.iterate_statechanges_by_identifier(
+            1, 'latest', batch_size=batch_size,
+        )) == state_changes
+
+    assert storage.get_statechanges_by_identifier(3, 3) == state_changes[2:3]
+
+
+def test_iterate_events():
+    storage = SerializedSQLiteStorage(':memory:', JSONSerializer)
+    counter = itertools.count()
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+
+    events = [
+        SendLockExpired(
+            recipient=factories.make_address(),
+            message_identifier=next(counter),
+            balance_proof=make_balance_proof_from_counter(counter),
+            secrethash=sha3(factories.make_secret(next(counter))),
+        )
+        for _ in range(7)
+    ]
+    state_change_identifier = storage.write_state_change('', timestamp)
+    storage.write_events(state_change_identifier, events, timestamp)
+
+    for batch_size in (1, 2, 7, 10):
+        assert list(storage.iterate_events(batch_size=batch_size)) == events
+        assert list(storage.iterate_events(
+            limit=3,
+            offset=2,
+            batch_size=batch_size,
+        )) == events[2:5]
+        assert list(storage.iterate_events(
+            offset=5,
+            batch_size=batch_size,
+        )) == events[5:]
+
+        timestamped_events = storage.iterate_events_with_timestamps(
+            limit=0,
+            batch_size=batch_size,
+        )
+        assert list(timestamped_events) == []
+
+    timestamped_events = storage.get_events_with_timestamps(offset=6)
+    assert [event.wrapped_event for event in timestamped_events] == events[6:]
+    assert [event.log_time for event in timestamped_events] == [timestamp]
+
+    with pytest.raises(InvalidNumberInput):
+        storage.iterate_events(limit=-1)
+
+
+def make_payment_events(token_network_identifier, partner, counter):
+    payment_network_identifier = factories.make_payment_network_identifier()
+    return [
+        EventPaymentSentSuccess(
+            payment_network_identifier=payment_network_identifier,
+            token_network_identifier=token_network_identifier,
+            identifier=next(counter),
+            amount=5,
+            target=partner,
+        ),
+        EventPaymentSentFailed(
+            payment_network_identifier=payment_network_identifier,
+            token_network_identifier=token_network_identifier,
+            identifier=next(counter),
+            target=partner,
+            reason='whatever',
+        ),
+        EventPaymentReceivedSuccess(
+            payment_network_identifier=payment_network_identifier,
+            token_network_identifier=token_network_identifier,
+            identifier=next(counter),
+            amount=5,
+            initiator=partner,
+        ),
+    ]
+
+
+@pytest.mark.parametrize('serializer', [JSONSerializer, BinarySerializer])
+def test_iterate_payment_history(serializer):
+    storage = SerializedSQLiteStorage(':memory:', serializer)
+    counter = itertools.count()
+    token_network_identifier = factories.make_address()
+    partner = factories.make_address()
+
+    payments = []
+    timestamps = []
+    for minute in range(3):
+        timestamp = datetime(2019, 1, 1, 0, minute).isoformat(timespec='milliseconds')
+        events = (
+            make_payment_events(token_network_identifier, partner, counter) +
+            make_payment_events(factories.make_address(), partner, counter) +
+            make_payment_events(token_network_identifier, factories.make_address(), counter)
+        )
+        # Not part of the history
+        events.insert(1, SendLockExpired(
+            recipient=partner,
+            message_identifier=next(counter),
+            balance_proof=make_balance_proof_from_counter(counter),
+            secrethash=sha3(factories.make_secret(next(counter))),
+        ))
+
+        state_change_identifier = storage.write_state_change('', timestamp)
+        storage.write_events(state_change_identifier, events, timestamp)
+        payments.extend(event for event in events if not isinstance(event, SendLockExpired))
+        timestamps.append(timestamp)
+
+    def history(**kwargs):
+        return [record.data for record in storage.iterate_payment_history(**kwargs)]
+
+    assert history() == payments
+    assert history(
+        token_network_identifier=optional_address_to_string(token_network_identifier),
+    ) == [
+        payment
+        for payment in payments
+        if payment.token_network_identifier == token_network_identifier
+    ]
+    assert history(
+        token_network_identifier=optional_address_to_string(token_network_identifier),
+        partner=optional_address_to_string(partner),
+        event_types=['EventPaymentSentSuccess', 'EventPaymentReceivedSuccess'],
+        from_time=timestamps[1],
+        to_time=timestamps[1],
+    ) == [payments[9], payments[11]]
+
+    # The pages returned with the identifier of the last record match the
+    # pages returned with an offset
+    after_event_identifier = 0
+    for page in range(6):
+        records = list(storage.iterate_payment_history(
+            after_event_identifier=after_event_identifier,
+            limit=5,
+            batch_size=2,
+        ))
+        expected = payments[page * 5:(page + 1) * 5]
+        assert [record.data for record in records] == expected
+        assert history(limit=5, offset=page * 5, batch_size=2) == expected
+
+        if records:
+            after_event_identifier = records[-1].event_identifier
+
+    with pytest.raises(InvalidNumberInput):
+        storage.iterate_payment_history(offset=-1)
+
+
+def test_read_connections(tmp_path):
+    storage = SerializedSQLiteStorage(':memory:', JSONSerializer, read_connections=1)
+    assert storage.read_pool is None
+
+    storage = SerializedSQLiteStorage(
+        str(tmp_path / 'log.db'),
+        JSONSerializer,
+        read_connections=2,
+    )
+    storage.attach_archive(str(tmp_path / 'archive.db'))
+    assert storage.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    counter = itertools.count()
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+    events = make_payment_events(factories.make_address(), factories.make_address(), counter)
+    state_change_identifier = storage.write_state_change('', timestamp)
+    storage.write_events(state_change_identifier, events[:2], timestamp)
+
+    # A reader sees the database as of its first query
+    reader = storage.iterate_events(batch_size=1)
+    assert next(reader) == events[0]
+    storage.write_events(state_change_identifier, events[2:], timestamp)
+    assert list(reader) == events[1:2]
+    assert storage.get_events() == events
+
+    # The writes of a transaction are only visible once committed
+    with storage.transaction():
+        storage.write_events(state_change_identifier, events, timestamp)
+        assert len(list(storage.iterate_payment_history())) == len(events)
+
+    assert len(list(storage.iterate_payment_history())) == 2 * len(events)
+    assert storage.read_pool.idle_connections.qsize() == 2
+
+    storage.close()
+
+
+def test_storage_executor_measures_hub_blocking():
+    executor = StorageExecutor()
+
+    def nested_operation():
+        return executor.run(time.sleep, 0.01)
+
+    executor.run(nested_operation)
+    executor.run_concurrently(time.sleep, 0.01)
+
+    assert executor.operations == 2
+    assert executor.hub_blocked_duration >= 0.02
+    assert executor.hub_blocked_max_duration >= 0.01
+
+
+def test_storage_executor_dedicated_thread(tmp_path):
+    executor = StorageExecutor(dedicated_thread=True)
+    ticks = []
+
+    def tick():
+        while True:
+            ticks.append(None)
+            gevent.sleep(0.01)
+
+    ticker = gevent.spawn(tick)
+    gevent.sleep(0)
+    executor.run(time.sleep, 0.1)
+    ticker.kill()
+
+    # The greenlets ran while the operation was running
+    assert len(ticks) > 2
+    assert executor.operations == 0
+
+    storage = SerializedSQLiteStorage(
+        str(tmp_path / 'log.db'),
+        JSONSerializer,
+        read_connections=1,
+        executor=executor,
+    )
+    counter = itertools.count()
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+    events = make_payment_events(factories.make_address(), factories.make_address(), counter)
+
+    with storage.transaction():
+        state_change_identifier = storage.write_state_change('', timestamp)
+        storage.write_events(state_change_identifier, events, timestamp)
+
+    storage.write_state_snapshot(state_change_identifier, events)
+
+    assert storage.get_events() == events
+    assert storage.get_statechanges_by_identifier(1, 'latest') == ['']
+    assert storage.get_latest_state_snapshot() == (state_change_identifier, events)
+
+    storage.close()
+
 
 def test_log_run():
     with patch('raiden.storage.sqlite.get_system_spec') as get_speck_mock:
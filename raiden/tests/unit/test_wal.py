@@ -1,17 +1,27 @@
 import os
 import sqlite3
+from datetime import datetime
 
+import gevent
 import pytest
 
 from raiden.exceptions import InvalidDBData
+from raiden.storage import state_cache, wal as wal_module
+from raiden.storage.replay import ParallelDecoder
 from raiden.storage.serialize import JSONSerializer
 from raiden.storage.sqlite import RAIDEN_DB_VERSION, SerializedSQLiteStorage
 from raiden.storage.utils import TimestampedEvent
-from raiden.storage.wal import WriteAheadLog, restore_to_state_change
+from raiden.storage.wal import GroupCommitWriteAheadLog, WriteAheadLog, restore_to_state_change
 from raiden.tests.utils import factories
 from raiden.transfer.architecture import State, StateManager, TransitionResult
-from raiden.transfer.events import EventPaymentSentFailed
-from raiden.transfer.state_change import Block, ContractReceiveChannelBatchUnlock
+from raiden.transfer.events import (
+    EventInvalidReceivedLockedTransfer,
+    EventPaymentReceivedSuccess,
+    EventPaymentSentFailed,
+)
+from raiden.transfer.mediated_transfer.events import SendLockExpired
+from raiden.transfer.state_change import Block, ContractReceiveChannelBatchUnlock, ReceiveUnlock
+from raiden.transfer.utils import get_event_with_balance_proof_by_balance_hash
 from raiden.utils import sha3
 
 
@@ -263,3 +273,442 @@ def test_get_snapshot_closest_to_state_change():
 
     _, snapshot = wal.storage.get_snapshot_closest_to_state_change('latest')
     assert snapshot.state_changes == [block1, block2, block3]
+
+
+def new_group_commit_wal(state_transition, commit_window=0.01, max_batch_size=10):
+    wal = new_wal(state_transition)
+    return GroupCommitWriteAheadLog(
+        state_manager=wal.state_manager,
+        storage=wal.storage,
+        commit_window=commit_window,
+        max_batch_size=max_batch_size,
+    )
+
+
+def make_block(block_number):
+    return Block(
+        block_number=block_number,
+        gas_limit=1,
+        block_hash=factories.make_transaction_hash(),
+    )
+
+
+def test_group_commit_coalesces_concurrent_writers():
+    wal = new_group_commit_wal(state_transtion_acc)
+    blocks = [make_block(block_number) for block_number in range(1, 6)]
+
+    greenlets = [gevent.spawn(wal.log_and_dispatch, block) for block in blocks]
+    gevent.joinall(greenlets, raise_error=True)
+
+    assert not wal.storage.in_transaction
+    assert wal.state_manager.current_state.state_changes == blocks
+
+    state_changes = wal.storage.get_statechanges_by_identifier(
+        from_identifier=0,
+        to_identifier='latest',
+    )
+    assert state_changes == blocks
+
+
+def test_group_commit_commits_full_batch_without_waiting():
+    wal = new_group_commit_wal(state_transtion_acc, commit_window=60, max_batch_size=1)
+
+    with gevent.Timeout(1):
+        wal.log_and_dispatch(make_block(1))
+
+    assert not wal.storage.in_transaction
+
+
+def make_payment_transition(token_network_identifier):
+    """ Transition which receives a payment with the block number as the
+    identifier, in `token_network_identifier` for the odd blocks.
+    """
+
+    def state_transition(state, block):
+        payment_received = EventPaymentReceivedSuccess(
+            payment_network_identifier=factories.make_payment_network_identifier(),
+            token_network_identifier=(
+                token_network_identifier if block.block_number % 2 else factories.make_address()
+            ),
+            identifier=block.block_number,
+            amount=1,
+            initiator=factories.make_address(),
+        )
+        return TransitionResult(state, [payment_received])
+
+    return state_transition
+
+
+def test_wal_publishes_events():
+    token_network_identifier = factories.make_address()
+    wal = new_wal(make_payment_transition(token_network_identifier))
+
+    token_network_subscription = wal.event_bus.subscribe(
+        event_types=(EventPaymentReceivedSuccess, ),
+        token_network_identifier=token_network_identifier,
+    )
+    with wal.event_bus.subscribe(payment_identifier=2) as payment_subscription:
+        for block_number in range(1, 5):
+            wal.log_and_dispatch(make_block(block_number))
+
+        assert payment_subscription.get(block=False).identifier == 2
+        assert payment_subscription.events.empty()
+
+    token_network_subscription.unsubscribe()
+    assert [event.identifier for event in token_network_subscription] == [1, 3]
+    assert wal.event_bus.subscriptions == []
+
+    # Only the events published while subscribed are received
+    wal.log_and_dispatch(make_block(5))
+    assert list(payment_subscription) == []
+
+
+def test_group_commit_publishes_events_once_committed():
+    wal = new_group_commit_wal(
+        make_payment_transition(factories.make_address()),
+        commit_window=60,
+    )
+    subscription = wal.event_bus.subscribe()
+
+    greenlet = gevent.spawn(wal.log_and_dispatch, make_block(1))
+    gevent.sleep(0)
+    assert wal.storage.in_transaction
+    assert subscription.events.empty()
+
+    wal.flush()
+    greenlet.get()
+    assert subscription.get(block=False).identifier == 1
+
+
+def test_group_commit_snapshot_and_restore():
+    wal = new_group_commit_wal(state_transtion_acc)
+
+    block1 = make_block(5)
+    wal.log_and_dispatch(block1)
+    wal.snapshot()
+
+    block2 = make_block(7)
+    wal.log_and_dispatch(block2)
+    wal.flush()
+    assert not wal.storage.conn.in_transaction
+
+    _, snapshot = wal.storage.get_snapshot_closest_to_state_change('latest')
+    assert snapshot.state_changes == [block1]
+
+    newwal = restore_to_state_change(
+        transition_function=state_transtion_acc,
+        storage=wal.storage,
+        state_change_identifier='latest',
+    )
+    # The state change of the snapshot is replayed on top of it
+    assert newwal.state_manager.current_state.state_changes == [block1, block1, block2]
+
+
+def test_group_commit_failure_is_raised_to_callers():
+    wal = new_group_commit_wal(state_transition_noop, commit_window=60, max_batch_size=2)
+
+    def fail_commit():
+        raise sqlite3.OperationalError('disk I/O error')
+
+    wal.storage.commit = fail_commit
+
+    first = gevent.spawn(wal.log_and_dispatch, make_block(1))
+    gevent.sleep(0)
+    second = gevent.spawn(wal.log_and_dispatch, make_block(2))
+    gevent.joinall([first, second])
+
+    assert isinstance(first.exception, sqlite3.OperationalError)
+    assert isinstance(second.exception, sqlite3.OperationalError)
+    assert wal.state_diverged
+
+
+def test_log_and_dispatch_many():
+    token_network_identifier = factories.make_address()
+    wal = new_wal(make_payment_transition(token_network_identifier))
+
+    blocks = [make_block(block_number) for block_number in range(1, 4)]
+    with wal.event_bus.subscribe() as subscription:
+        events = wal.log_and_dispatch_many(blocks)
+
+    assert [[event.identifier for event in block_events] for block_events in events] == [
+        [1],
+        [2],
+        [3],
+    ]
+    assert [event.identifier for event in subscription] == [1, 2, 3]
+    assert not wal.storage.in_transaction
+
+    state_changes = wal.storage.get_statechanges_by_identifier(
+        from_identifier=0,
+        to_identifier='latest',
+    )
+    assert state_changes == blocks
+    assert wal.storage.get_events() == [event for block_events in events for event in block_events]
+
+
+def test_log_and_dispatch_many_is_atomic():
+    wal = new_wal(state_transtion_acc)
+    wal.log_and_dispatch(make_block(1))
+    state = wal.state_manager.current_state
+
+    def fail_on_second_block(state, block):
+        if block.block_number == 2:
+            raise ValueError('transition failed')
+        return state_transtion_acc(state, block)
+
+    wal.state_manager.state_transition = fail_on_second_block
+    with pytest.raises(ValueError):
+        wal.log_and_dispatch_many([make_block(3), make_block(2)])
+
+    # Neither the log nor the state have any of the state changes
+    assert not wal.state_diverged
+    assert wal.state_manager.current_state is state
+    assert len(state.state_changes) == 1
+    assert wal.storage.count_state_changes_since_latest_snapshot() == 1
+
+
+def test_group_commit_log_and_dispatch_many():
+    wal = new_group_commit_wal(state_transtion_acc, commit_window=60, max_batch_size=2)
+    blocks = [make_block(block_number) for block_number in range(1, 4)]
+
+    # The batch is committed once full, even if the state changes exceed its size
+    with gevent.Timeout(1):
+        assert wal.log_and_dispatch_many(blocks) == [[], [], []]
+
+    assert not wal.storage.in_transaction
+    assert wal.state_manager.current_state.state_changes == blocks
+
+
+def test_group_commit_log_and_dispatch_many_is_atomic():
+    wal = new_group_commit_wal(state_transtion_acc, commit_window=60)
+    block1 = make_block(1)
+
+    greenlet = gevent.spawn(wal.log_and_dispatch, block1)
+    gevent.sleep(0)
+    assert wal.storage.in_transaction
+    state = wal.state_manager.current_state
+
+    def fail_on_second_block(state, block):
+        if block.block_number == 2:
+            raise ValueError('transition failed')
+        return state_transtion_acc(state, block)
+
+    wal.state_manager.state_transition = fail_on_second_block
+    with pytest.raises(ValueError):
+        wal.log_and_dispatch_many([make_block(3), make_block(2)])
+
+    # The batch is still open and only has the state change of the other call
+    assert wal.storage.in_transaction
+    wal.flush()
+    greenlet.get()
+
+    assert not wal.state_diverged
+    assert wal.state_manager.current_state is state
+    assert state.state_changes == [block1]
+
+    state_changes = wal.storage.get_statechanges_by_identifier(
+        from_identifier=0,
+        to_identifier='latest',
+    )
+    assert state_changes == [block1]
+
+
+def test_group_commit_rolls_back_a_failed_state_change():
+    wal = new_group_commit_wal(state_transtion_acc, commit_window=60)
+    block1 = make_block(1)
+
+    greenlet = gevent.spawn(wal.log_and_dispatch, block1)
+    gevent.sleep(0)
+
+    def fail(state, block):  # pylint: disable=unused-argument
+        raise ValueError('transition failed')
+
+    wal.state_manager.state_transition = fail
+    with pytest.raises(ValueError):
+        wal.log_and_dispatch(make_block(2))
+
+    wal.flush()
+    greenlet.get()
+
+    assert not wal.state_diverged
+    state_changes = wal.storage.get_statechanges_by_identifier(
+        from_identifier=0,
+        to_identifier='latest',
+    )
+    assert state_changes == [block1]
+
+
+def test_count_state_changes_since_latest_snapshot():
+    wal = new_wal(state_transtion_acc)
+    assert wal.storage.count_state_changes_since_latest_snapshot() == 0
+
+    wal.log_and_dispatch(make_block(1))
+    wal.log_and_dispatch(make_block(2))
+    assert wal.storage.count_state_changes_since_latest_snapshot() == 2
+
+    wal.snapshot()
+    assert wal.storage.count_state_changes_since_latest_snapshot() == 0
+
+    wal.log_and_dispatch(make_block(3))
+    assert wal.storage.count_state_changes_since_latest_snapshot() == 1
+
+
+def test_state_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(state_cache, 'get_system_spec', lambda: {'raiden': '1.0.0'})
+
+    cache_path = os.path.join(tmpdir, 'state.cache')
+    storage = SerializedSQLiteStorage(os.path.join(tmpdir, 'log.db'), JSONSerializer)
+    wal = WriteAheadLog(StateManager(state_transtion_acc, None), storage)
+    wal.log_and_dispatch(make_block(1))
+    wal.log_and_dispatch(make_block(2))
+
+    state_cache.write_state_cache(cache_path, storage, wal.state_manager.current_state)
+    cached_state = state_cache.read_state_cache(cache_path, storage)
+    assert cached_state.state_changes == wal.state_manager.current_state.state_changes
+
+    # The cache is only read once
+    assert not os.path.exists(cache_path)
+    assert state_cache.read_state_cache(cache_path, storage) is None
+
+    # Outdated by a new state change
+    state_cache.write_state_cache(cache_path, storage, wal.state_manager.current_state)
+    wal.log_and_dispatch(make_block(3))
+    assert state_cache.read_state_cache(cache_path, storage) is None
+    assert not os.path.exists(cache_path)
+
+    # Written by another release
+    state_cache.write_state_cache(cache_path, storage, wal.state_manager.current_state)
+    monkeypatch.setattr(state_cache, 'get_system_spec', lambda: {'raiden': '1.0.1'})
+    assert state_cache.read_state_cache(cache_path, storage) is None
+
+    with open(cache_path, 'wb') as cache_file:
+        cache_file.write(os.urandom(64))
+    assert state_cache.read_state_cache(cache_path, storage) is None
+    assert not os.path.exists(cache_path)
+
+
+def test_wal_state_diverged_on_dispatch_failure():
+    def state_transition_fail(state, state_change):  # pylint: disable=unused-argument
+        raise ValueError('invalid state change')
+
+    wal = new_wal(state_transition_fail)
+    assert not wal.state_diverged
+
+    with pytest.raises(ValueError):
+        wal.log_and_dispatch(make_block(1))
+
+    assert wal.state_diverged
+
+
+def test_archive_history(tmpdir):
+    storage = SerializedSQLiteStorage(os.path.join(tmpdir, 'log.db'), JSONSerializer)
+    storage.attach_archive(os.path.join(tmpdir, 'archive.db'))
+    wal = WriteAheadLog(StateManager(state_transtion_acc, None), storage)
+    timestamp = datetime.utcnow().isoformat(timespec='milliseconds')
+
+    unlock = ReceiveUnlock(
+        message_identifier=1,
+        secret=factories.make_secret(),
+        balance_proof=factories.make_signed_balance_proof(nonce=1),
+    )
+    lock_expired = SendLockExpired(
+        recipient=factories.make_address(),
+        message_identifier=2,
+        balance_proof=factories.make_signed_balance_proof(nonce=2),
+        secrethash=sha3(factories.make_secret()),
+    )
+    invalid_transfer = EventInvalidReceivedLockedTransfer(
+        payment_identifier=1,
+        reason='whatever',
+    )
+    payment_failed = EventPaymentSentFailed(
+        payment_network_identifier=factories.make_payment_network_identifier(),
+        token_network_identifier=factories.make_address(),
+        identifier=1,
+        target=factories.make_address(),
+        reason='whatever',
+    )
+
+    blocks = [make_block(block_number) for block_number in range(1, 6)]
+
+    wal.log_and_dispatch(blocks[0])
+    # Enough data to free whole pages once archived
+    storage.write_events(wal.state_change_id, [invalid_transfer] * 100, timestamp)
+    wal.log_and_dispatch(unlock)
+    wal.log_and_dispatch(blocks[1])
+    storage.write_events(wal.state_change_id, [lock_expired, payment_failed], timestamp)
+    wal.log_and_dispatch(blocks[2])
+    wal.snapshot()
+
+    # There is a single snapshot
+    assert storage.archive_history(retained_snapshots=2) == (0, 0, 0)
+
+    wal.log_and_dispatch(blocks[3])
+    wal.snapshot()
+    wal.log_and_dispatch(blocks[4])
+
+    restored_state = restore_to_state_change(
+        transition_function=state_transtion_acc,
+        storage=storage,
+        state_change_identifier='latest',
+    ).state_manager.current_state.state_changes
+
+    archived = storage.archive_history(retained_snapshots=1)
+
+    # The unlock and the second block are kept for the balance proof lookups
+    assert archived.state_changes == 2
+    assert archived.events == 100
+    assert archived.snapshots == 1
+    assert storage.get_statechanges_by_identifier(1, 'latest') == [
+        unlock,
+        blocks[1],
+        blocks[3],
+        blocks[4],
+    ]
+    assert storage.get_events() == [invalid_transfer] * 100 + [lock_expired, payment_failed]
+    assert [record.data for record in storage.iterate_payment_history()] == [payment_failed]
+
+    balance_proof = lock_expired.balance_proof
+    assert get_event_with_balance_proof_by_balance_hash(
+        storage=storage,
+        chain_id=balance_proof.chain_id,
+        token_network_identifier=balance_proof.token_network_identifier,
+        channel_identifier=balance_proof.channel_identifier,
+        balance_hash=balance_proof.balance_hash,
+    ).data == lock_expired
+
+    assert storage.vacuum()
+    assert not storage.vacuum()
+
+    assert restore_to_state_change(
+        transition_function=state_transtion_acc,
+        storage=storage,
+        state_change_identifier='latest',
+    ).state_manager.current_state.state_changes == restored_state
+
+
+def test_restore_with_decode_workers(monkeypatch):
+    monkeypatch.setattr(wal_module, 'PARALLEL_DECODE_MIN_STATE_CHANGES', 5)
+    monkeypatch.setattr(wal_module, 'PARALLEL_DECODE_BATCH_SIZE', 2)
+    monkeypatch.setattr(wal_module, 'can_decode_in_workers', lambda: True)
+
+    wal = new_wal(state_transtion_acc)
+    blocks = [make_block(block_number) for block_number in range(1, 10)]
+    for block in blocks:
+        wal.log_and_dispatch(block)
+
+    restored_wal = restore_to_state_change(
+        transition_function=state_transtion_acc,
+        storage=wal.storage,
+        state_change_identifier='latest',
+        decode_workers=2,
+    )
+    assert restored_wal.state_manager.current_state.state_changes == blocks
+
+
+def test_parallel_decoder_worker_failure():
+    decoder = ParallelDecoder(JSONSerializer.name, workers=1)
+    state_changes = decoder.decode(iter([['not json']]))
+
+    with pytest.raises(RuntimeError):
+        list(state_changes)
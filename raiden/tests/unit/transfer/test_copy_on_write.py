@@ -0,0 +1,393 @@
+from copy import deepcopy
+
+import pytest
+
+from raiden.storage.serialize import JSONSerializer
+from raiden.tests.utils import factories
+from raiden.tests.utils.transfer import make_receive_transfer_mediated
+from raiden.transfer import block_deadlines, copy_on_write, node, views
+from raiden.transfer.architecture import StateManager
+from raiden.transfer.copy_on_write import CopyOnWriteStateManager
+from raiden.transfer.mediated_transfer.events import SendLockedTransfer
+from raiden.transfer.mediated_transfer.state_change import (
+    ActionInitInitiator,
+    ActionInitMediator,
+    ActionInitTarget,
+    ReceiveSecretRequest,
+    ReceiveSecretReveal,
+)
+from raiden.transfer.state import (
+    NODE_NETWORK_REACHABLE,
+    NODE_NETWORK_UNREACHABLE,
+    ChainState,
+    HashTimeLockState,
+)
+from raiden.transfer.state_change import (
+    ActionChangeNodeNetworkState,
+    ActionChannelClose,
+    Block,
+    ContractReceiveChannelClosed,
+    ContractReceiveChannelSettled,
+)
+from raiden.utils import sha3
+from raiden.utils.typing import BlockNumber
+
+
+def make_channels(token_network_state, payment_network_state, our_address, number_of_channels):
+    channels = list()
+    keys = list()
+    for _ in range(number_of_channels):
+        privkey, partner = factories.make_privkey_address()
+        channel_state = factories.make_channel(
+            our_balance=100,
+            partner_balance=100,
+            our_address=our_address,
+            partner_address=partner,
+            token_address=token_network_state.token_address,
+            payment_network_identifier=payment_network_state.address,
+            token_network_identifier=token_network_state.address,
+        )
+        token_network_state.partneraddresses_to_channelidentifiers[partner].append(
+            channel_state.identifier,
+        )
+        token_network_state.channelidentifiers_to_channels[channel_state.identifier] = (
+            channel_state
+        )
+        channels.append(channel_state)
+        keys.append(privkey)
+
+    return channels, keys
+
+
+def make_block(block_number):
+    return Block(
+        block_number=block_number,
+        gas_limit=1,
+        block_hash=factories.make_block_hash(),
+    )
+
+
+def get_channel(chain_state, channel_state):
+    return views.get_channelstate_by_token_network_identifier(
+        chain_state,
+        channel_state.token_network_identifier,
+        channel_state.identifier,
+    )
+
+
+def dispatch_both(reference, manager, state_change, serializer):
+    previous_state = manager.current_state
+    serialized_previous_state = serializer.serialize(previous_state)
+
+    reference_events = reference.dispatch(state_change)
+    events = manager.dispatch(state_change)
+
+    assert events == reference_events
+    assert manager.current_state == reference.current_state
+    assert serializer.serialize(previous_state) == serialized_previous_state
+
+    return events
+
+
+def test_copy_on_write_shares_the_channels_not_modified(
+        chain_state,
+        token_network_state,
+        payment_network_state,
+        our_address,
+):
+    channels, _ = make_channels(token_network_state, payment_network_state, our_address, 2)
+    manager = CopyOnWriteStateManager(node.state_transition, chain_state)
+
+    # Every channel is due at the first block, the state is deep copied
+    manager.dispatch(make_block(chain_state.block_number + 1))
+    assert copy_on_write.get_footprint(
+        manager.current_state,
+        make_block(chain_state.block_number + 2),
+    ) is not None
+
+    previous_state = manager.current_state
+    manager.dispatch(ActionChannelClose(
+        token_network_identifier=token_network_state.address,
+        channel_identifier=channels[0].identifier,
+    ))
+    current_state = manager.current_state
+
+    assert get_channel(current_state, channels[0]) is not get_channel(previous_state, channels[0])
+    assert get_channel(current_state, channels[1]) is get_channel(previous_state, channels[1])
+    assert get_channel(previous_state, channels[0]).close_transaction is None
+    assert get_channel(current_state, channels[0]).close_transaction is not None
+
+
+def test_copy_on_write_rollback(chain_state, token_network_state, payment_network_state):
+    channels, _ = make_channels(
+        token_network_state,
+        payment_network_state,
+        chain_state.our_address,
+        2,
+    )
+
+    def failing_transition(state, state_change):
+        node.state_transition(state, state_change)
+        raise ValueError('transition failed')
+
+    serializer = JSONSerializer()
+    manager = CopyOnWriteStateManager(node.state_transition, chain_state)
+    manager.dispatch(make_block(chain_state.block_number + 1))
+    previous_state = manager.current_state
+    serialized_previous_state = serializer.serialize(previous_state)
+
+    manager.state_transition = failing_transition
+    with pytest.raises(ValueError):
+        manager.dispatch(ActionChannelClose(
+            token_network_identifier=token_network_state.address,
+            channel_identifier=channels[0].identifier,
+        ))
+
+    assert manager.current_state is previous_state
+    assert serializer.serialize(previous_state) == serialized_previous_state
+
+
+def test_copy_on_write_dispatch_many(chain_state, token_network_state, payment_network_state):
+    channels, _ = make_channels(
+        token_network_state,
+        payment_network_state,
+        chain_state.our_address,
+        3,
+    )
+    state_changes = [
+        make_block(chain_state.block_number + 1),
+        ActionChannelClose(
+            token_network_identifier=token_network_state.address,
+            channel_identifier=channels[1].identifier,
+        ),
+        make_block(chain_state.block_number + 2),
+    ]
+
+    serializer = JSONSerializer()
+    reference = StateManager(node.state_transition, deepcopy(chain_state))
+    manager = CopyOnWriteStateManager(node.state_transition, chain_state)
+    serialized_previous_state = serializer.serialize(chain_state)
+
+    assert manager.dispatch_many(state_changes) == reference.dispatch_many(state_changes)
+    assert manager.current_state == reference.current_state
+    assert serializer.serialize(chain_state) == serialized_previous_state
+
+    def fail(state, state_change):
+        raise ValueError('transition failed')
+
+    # The state changes are applied all together or not at all
+    current_state = manager.current_state
+    manager.state_transition = lambda state, state_change: (
+        fail(state, state_change)
+        if isinstance(state_change, ActionChannelClose)
+        else node.state_transition(state, state_change)
+    )
+    with pytest.raises(ValueError):
+        manager.dispatch_many([
+            make_block(chain_state.block_number + 3),
+            ActionChannelClose(
+                token_network_identifier=token_network_state.address,
+                channel_identifier=channels[2].identifier,
+            ),
+        ])
+
+    assert manager.current_state is current_state
+    assert current_state == reference.current_state
+
+
+def test_copy_chain_state_copies_the_mutable_attributes(chain_state):
+    """ Every attribute of the chain state which a transition may modify in
+    place must be copied, the others are immutable.
+    """
+    footprint = copy_on_write.Footprint()
+    copy_state = copy_on_write.copy_chain_state(chain_state, footprint)
+
+    for name in ChainState.__slots__:
+        value = getattr(chain_state, name)
+        if value is None or isinstance(value, (bytes, int, str)):
+            continue
+        assert getattr(copy_state, name) is not value, name
+
+
+def test_footprint_of_a_block(chain_state, token_network_state, payment_network_state):
+    channels, _ = make_channels(
+        token_network_state,
+        payment_network_state,
+        chain_state.our_address,
+        2,
+    )
+    block_number = chain_state.block_number
+
+    # Every channel is due at the first block
+    assert copy_on_write.get_footprint(chain_state, make_block(block_number + 1)) is None
+
+    block_deadlines.schedule_all(chain_state, BlockNumber(block_number + 10))
+    block_deadlines.schedule(
+        chain_state.channel_deadlines,
+        (token_network_state.address, channels[1].identifier),
+        BlockNumber(block_number + 1),
+    )
+
+    footprint = copy_on_write.get_footprint(chain_state, make_block(block_number + 1))
+    assert footprint.channels == {token_network_state.address: {channels[1].identifier}}
+    assert not footprint.secrethashes
+
+
+def test_copy_on_write_payments(
+        chain_state,
+        token_network_state,
+        payment_network_state,
+        our_address,
+):
+    """ The copy-on-write transitions must produce the same states and events
+    as the transitions on a deep copy, without modifying the previous state.
+    """
+    channels, keys = make_channels(token_network_state, payment_network_state, our_address, 3)
+
+    serializer = JSONSerializer()
+    reference = StateManager(node.state_transition, serializer.deserialize(
+        serializer.serialize(chain_state),
+    ))
+    manager = CopyOnWriteStateManager(node.state_transition, chain_state)
+    block_number = chain_state.block_number
+
+    def new_block():
+        nonlocal block_number
+        block_number += 1
+        return make_block(block_number)
+
+    dispatch_both(reference, manager, new_block(), serializer)
+
+    # A payment to the partner of the first channel
+    secret = factories.make_secret(1)
+    secrethash = sha3(secret)
+    target = channels[0].partner_state.address
+    transfer_description = factories.make_transfer_description(
+        payment_network_identifier=payment_network_state.address,
+        payment_identifier=1,
+        amount=5,
+        token_network=token_network_state.address,
+        initiator=our_address,
+        target=target,
+        secret=secret,
+    )
+    events = dispatch_both(reference, manager, ActionInitInitiator(
+        transfer_description,
+        [factories.make_route_from_channel(channels[0])],
+    ), serializer)
+    locked_transfer = next(event for event in events if isinstance(event, SendLockedTransfer))
+
+    dispatch_both(reference, manager, ReceiveSecretRequest(
+        payment_identifier=1,
+        amount=5,
+        expiration=locked_transfer.transfer.lock.expiration,
+        secrethash=secrethash,
+        sender=target,
+    ), serializer)
+    dispatch_both(reference, manager, ReceiveSecretReveal(secret, target), serializer)
+
+    # A payment received from the partner of the second channel, which expires
+    lock = HashTimeLockState(amount=5, expiration=block_number + 20, secrethash=sha3(b'lock'))
+    transfer = make_receive_transfer_mediated(
+        channel_state=channels[1],
+        privkey=keys[1],
+        nonce=1,
+        transferred_amount=0,
+        lock=lock,
+    )
+    dispatch_both(reference, manager, ActionInitTarget(
+        factories.make_route_from_channel(channels[1]),
+        transfer,
+    ), serializer)
+
+    for _ in range(30):
+        dispatch_both(reference, manager, new_block(), serializer)
+
+    # The third channel is closed by the partner and settled
+    dispatch_both(reference, manager, ContractReceiveChannelClosed(
+        transaction_hash=factories.make_transaction_hash(),
+        transaction_from=channels[2].partner_state.address,
+        token_network_identifier=token_network_state.address,
+        channel_identifier=channels[2].identifier,
+        block_number=block_number,
+        block_hash=factories.make_block_hash(),
+    ), serializer)
+
+    for _ in range(channels[2].settle_timeout + 1):
+        dispatch_both(reference, manager, new_block(), serializer)
+
+    dispatch_both(reference, manager, ContractReceiveChannelSettled(
+        transaction_hash=factories.make_transaction_hash(),
+        token_network_identifier=token_network_state.address,
+        channel_identifier=channels[2].identifier,
+        block_number=block_number,
+        block_hash=factories.make_block_hash(),
+    ), serializer)
+
+    assert serializer.deserialize(serializer.serialize(manager.current_state)) == (
+        reference.current_state
+    )
+
+
+def test_copy_on_write_mediator(
+        chain_state,
+        token_network_state,
+        payment_network_state,
+        our_address,
+):
+    """ The copy-on-write transitions of a mediated payment, which uses two
+    channels, must produce the same states and events as the transitions on a
+    deep copy.
+    """
+    channels, keys = make_channels(token_network_state, payment_network_state, our_address, 3)
+    payer_channel, payee_channel, _ = channels
+    chain_state.nodeaddresses_to_networkstates[payee_channel.partner_state.address] = (
+        NODE_NETWORK_REACHABLE
+    )
+
+    serializer = JSONSerializer()
+    reference = StateManager(node.state_transition, deepcopy(chain_state))
+    manager = CopyOnWriteStateManager(node.state_transition, chain_state)
+    block_number = chain_state.block_number
+
+    def new_block():
+        nonlocal block_number
+        block_number += 1
+        return make_block(block_number)
+
+    dispatch_both(reference, manager, new_block(), serializer)
+
+    secret = factories.make_secret(2)
+    lock = HashTimeLockState(amount=5, expiration=block_number + 40, secrethash=sha3(secret))
+    from_transfer = make_receive_transfer_mediated(
+        channel_state=payer_channel,
+        privkey=keys[0],
+        nonce=1,
+        transferred_amount=0,
+        lock=lock,
+    )
+    events = dispatch_both(reference, manager, ActionInitMediator(
+        routes=[factories.make_route_from_channel(payee_channel)],
+        from_route=factories.make_route_from_channel(payer_channel),
+        from_transfer=from_transfer,
+    ), serializer)
+    assert any(isinstance(event, SendLockedTransfer) for event in events)
+
+    dispatch_both(reference, manager, ActionChangeNodeNetworkState(
+        payee_channel.partner_state.address,
+        NODE_NETWORK_UNREACHABLE,
+    ), serializer)
+    dispatch_both(reference, manager, new_block(), serializer)
+    dispatch_both(
+        reference,
+        manager,
+        ReceiveSecretReveal(secret, payee_channel.partner_state.address),
+        serializer,
+    )
+
+    for _ in range(50):
+        dispatch_both(reference, manager, new_block(), serializer)
+
+    assert serializer.deserialize(serializer.serialize(manager.current_state)) == (
+        reference.current_state
+    )
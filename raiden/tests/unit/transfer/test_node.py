@@ -1,8 +1,30 @@
+import json
+import os
+
 from raiden.constants import EMPTY_MERKLE_ROOT
+from raiden.storage.serialize import JSONSerializer
+from raiden.tests.utils import factories
 from raiden.tests.utils.factories import HOP1, HOP2, UNIT_SECRETHASH, make_block_hash
-from raiden.transfer.events import ContractSendChannelBatchUnlock
+from raiden.tests.utils.transfer import make_receive_transfer_mediated
+from raiden.transfer import block_deadlines, node, profiling, views
+from raiden.transfer.architecture import TransitionResult
+from raiden.transfer.events import (
+    ContractSendChannelBatchUnlock,
+    ContractSendChannelClose,
+    ContractSendChannelSettle,
+    ContractSendSecretReveal,
+)
+from raiden.transfer.mediated_transfer.state_change import ActionInitTarget
 from raiden.transfer.node import is_transaction_effect_satisfied
-from raiden.transfer.state_change import ContractReceiveChannelBatchUnlock
+from raiden.transfer.state import BlockDeadlinesState, HashTimeLockState
+from raiden.transfer.state_change import (
+    Block,
+    ContractReceiveChannelBatchUnlock,
+    ContractReceiveChannelClosed,
+    ContractReceiveChannelNew,
+    ContractReceiveChannelSettled,
+)
+from raiden.utils import sha3
 
 
 def test_is_transaction_effect_satisfied(
@@ -40,3 +62,264 @@ def test_is_transaction_effect_satisfied(
     state_change.participant = netting_channel_state.our_state.address
     state_change.partner = netting_channel_state.partner_state.address
     assert is_transaction_effect_satisfied(chain_state, transaction, state_change)
+
+
+def test_block_deadlines_pop_due():
+    index = BlockDeadlinesState()
+
+    block_deadlines.schedule(index, b'b', 10)
+    block_deadlines.schedule(index, b'a', 12)
+    block_deadlines.schedule(index, b'c', 20)
+    # An entry is visited at its earliest deadline only
+    block_deadlines.schedule(index, b'a', 10)
+    block_deadlines.schedule(index, b'c', 30)
+
+    assert block_deadlines.get_due(index, 12) == [b'a', b'b']
+    assert block_deadlines.get_due(index, 25) == [b'a', b'b', b'c']
+
+    assert block_deadlines.pop_due(index, 9) == []
+    assert block_deadlines.pop_due(index, 12) == [b'a', b'b']
+    assert block_deadlines.pop_due(index, 19) == []
+    assert block_deadlines.pop_due(index, 25) == [b'c']
+    assert not index.keys_to_deadlines
+
+
+def test_block_is_dispatched_to_due_channels(
+        chain_state,
+        token_network_state,
+        netting_channel_state,
+):
+    def new_block():
+        block_number = chain_state.block_number + 1
+        block = Block(
+            block_number=block_number,
+            gas_limit=1,
+            block_hash=make_block_hash(),
+        )
+        return node.state_transition(chain_state, block).events
+
+    key = (token_network_state.address, netting_channel_state.identifier)
+
+    # The first block visits every channel, an opened channel has no deadline
+    assert chain_state.channel_deadlines.all_due
+    assert new_block() == []
+    assert not chain_state.channel_deadlines.all_due
+    assert key not in chain_state.channel_deadlines.keys_to_deadlines
+
+    closed_block_number = chain_state.block_number
+    channel_closed = ContractReceiveChannelClosed(
+        transaction_hash=factories.make_transaction_hash(),
+        transaction_from=netting_channel_state.partner_state.address,
+        token_network_identifier=token_network_state.address,
+        channel_identifier=netting_channel_state.identifier,
+        block_number=closed_block_number,
+        block_hash=make_block_hash(),
+    )
+    node.state_transition(chain_state, channel_closed)
+    assert chain_state.channel_deadlines.keys_to_deadlines[key] == closed_block_number + 1
+
+    # The closed channel is visited again at the end of the settlement period
+    assert new_block() == []
+    settlement_end = closed_block_number + netting_channel_state.settle_timeout
+    assert chain_state.channel_deadlines.keys_to_deadlines[key] == settlement_end + 1
+
+    while chain_state.block_number < settlement_end:
+        assert new_block() == []
+
+    events = new_block()
+    assert len(events) == 1
+    assert isinstance(events[0], ContractSendChannelSettle)
+
+
+def test_updated_balance_proofs(chain_state, token_network_state, our_address):
+    pkey, partner_address = factories.make_privkey_address()
+    channel_state = factories.make_channel(
+        our_balance=80,
+        our_address=our_address,
+        partner_balance=80,
+        partner_address=partner_address,
+        token_network_identifier=token_network_state.address,
+    )
+    token_network_state.partneraddresses_to_channelidentifiers[partner_address].append(
+        channel_state.identifier,
+    )
+    token_network_state.channelidentifiers_to_channels[channel_state.identifier] = channel_state
+
+    lock = HashTimeLockState(
+        amount=30,
+        expiration=20,
+        secrethash=sha3(sha3(b'test_updated_balance_proofs')),
+    )
+    mediated_transfer = make_receive_transfer_mediated(
+        channel_state=channel_state,
+        privkey=pkey,
+        nonce=1,
+        transferred_amount=0,
+        lock=lock,
+    )
+    init_target = ActionInitTarget(
+        factories.route_from_channel(channel_state),
+        mediated_transfer,
+    )
+
+    node.state_transition(chain_state, init_target)
+    assert chain_state.updated_balance_proofs == [mediated_transfer.balance_proof]
+
+    # The balance proof is not updated again by the same transfer
+    node.state_transition(chain_state, init_target)
+    assert chain_state.updated_balance_proofs == []
+
+
+def test_pending_transactions_are_cleared_by_their_state_changes(
+        chain_state,
+        token_network_state,
+        netting_channel_state,
+):
+    def make_close(channel_identifier):
+        return ContractSendChannelClose(
+            channel_identifier=channel_identifier,
+            token_address=token_network_state.token_address,
+            token_network_identifier=token_network_state.address,
+            balance_proof=None,
+            triggered_by_block_hash=make_block_hash(),
+        )
+
+    close = make_close(netting_channel_state.identifier)
+    other_close = make_close(factories.make_channel_identifier())
+    secret_reveal = ContractSendSecretReveal(
+        expiration=chain_state.block_number + 5,
+        secret=factories.make_secret(),
+        triggered_by_block_hash=make_block_hash(),
+    )
+    block = Block(
+        block_number=chain_state.block_number,
+        gas_limit=1,
+        block_hash=make_block_hash(),
+    )
+    node.update_queues(TransitionResult(chain_state, [close, other_close, secret_reveal]), block)
+    assert chain_state.pending_transactions == [close, other_close, secret_reveal]
+
+    def channel_closed(channel_identifier):
+        return ContractReceiveChannelClosed(
+            transaction_hash=factories.make_transaction_hash(),
+            transaction_from=netting_channel_state.partner_state.address,
+            token_network_identifier=token_network_state.address,
+            channel_identifier=channel_identifier,
+            block_number=chain_state.block_number,
+            block_hash=make_block_hash(),
+        )
+
+    node.update_queues(TransitionResult(chain_state, []), channel_closed(close.channel_identifier))
+    assert chain_state.pending_transactions == [other_close, secret_reveal]
+
+    # The expired transactions are cleared by any contract state change
+    chain_state.block_number = secret_reveal.expiration + 1
+    node.update_queues(TransitionResult(chain_state, []), channel_closed(close.channel_identifier))
+    assert chain_state.pending_transactions == [other_close]
+
+
+def test_lookup_indexes_follow_the_channels(
+        chain_state,
+        payment_network_state,
+        token_network_state,
+        netting_channel_state,
+):
+    partner_address = netting_channel_state.partner_state.address
+    token_network_id = token_network_state.address
+
+    assert views.get_token_network_by_identifier(chain_state, token_network_id) is (
+        token_network_state
+    )
+    assert views.get_token_network_registry_by_token_network_identifier(
+        chain_state,
+        token_network_id,
+    ) is payment_network_state
+    assert views.get_token_network_by_identifier(chain_state, factories.make_address()) is None
+    assert views.all_neighbour_nodes(chain_state) == {partner_address}
+
+    new_partner_address = factories.make_address()
+    new_channel_state = factories.make_channel(
+        our_address=chain_state.our_address,
+        partner_address=new_partner_address,
+        token_address=token_network_state.token_address,
+        payment_network_identifier=payment_network_state.address,
+        token_network_identifier=token_network_id,
+    )
+    channel_new = ContractReceiveChannelNew(
+        transaction_hash=factories.make_transaction_hash(),
+        token_network_identifier=token_network_id,
+        channel_state=new_channel_state,
+        block_number=chain_state.block_number,
+        block_hash=make_block_hash(),
+    )
+    node.state_transition(chain_state, channel_new)
+
+    assert views.all_neighbour_nodes(chain_state) == {partner_address, new_partner_address}
+    partneraddresses_to_tokennetworkids = (
+        chain_state.lookup_indexes.partneraddresses_to_tokennetworkids
+    )
+    assert partneraddresses_to_tokennetworkids[new_partner_address] == {token_network_id}
+
+    channel_settled = ContractReceiveChannelSettled(
+        transaction_hash=factories.make_transaction_hash(),
+        token_network_identifier=token_network_id,
+        channel_identifier=netting_channel_state.identifier,
+        block_number=chain_state.block_number,
+        block_hash=make_block_hash(),
+    )
+    node.state_transition(chain_state, channel_settled)
+
+    assert views.all_neighbour_nodes(chain_state) == {new_partner_address}
+    assert partner_address not in chain_state.lookup_indexes.partneraddresses_to_tokennetworkids
+
+    # A restored chain state builds its indexes when they are first used
+    restored = JSONSerializer.deserialize(JSONSerializer.serialize(chain_state))
+    assert restored == chain_state
+    assert not restored.lookup_indexes.is_complete
+    assert views.all_neighbour_nodes(restored) == {new_partner_address}
+    assert views.get_token_network_by_identifier(restored, token_network_id) == (
+        token_network_state
+    )
+    assert (
+        restored.lookup_indexes.partneraddresses_to_tokennetworkids ==
+        chain_state.lookup_indexes.partneraddresses_to_tokennetworkids
+    )
+
+
+def test_state_transitions_profiling(chain_state, tmpdir):
+    def new_block():
+        block = Block(
+            block_number=chain_state.block_number + 1,
+            gas_limit=1,
+            block_hash=make_block_hash(),
+        )
+        node.state_transition(chain_state, block)
+
+    key = 'raiden.transfer.node.state_transition'
+
+    # Nothing is recorded unless the profiling is enabled
+    new_block()
+    assert key not in profiling.get_stats()
+
+    profiling.enable()
+    try:
+        new_block()
+        new_block()
+    finally:
+        profiling.disable()
+
+    stats = profiling.get_stats()
+    assert stats[key]['Block']['count'] == 2
+    assert stats[key]['Block']['duration'] > 0
+
+    profile_path = os.path.join(tmpdir, 'state_transitions.json')
+    profiling.dump_stats(profile_path)
+    with open(profile_path) as profile_file:
+        assert json.load(profile_file) == stats
+
+    # The measures are kept once the profiling is disabled, until reset
+    new_block()
+    assert profiling.get_stats() == stats
+
+    profiling.reset()
+    assert profiling.get_stats() == {}
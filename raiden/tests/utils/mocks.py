@@ -1,4 +1,5 @@
 import random
+from contextlib import contextmanager
 
 from raiden.storage.serialize import JSONSerializer
 from raiden.storage.sqlite import SerializedSQLiteStorage
@@ -76,5 +77,13 @@ class MockRaidenService:
     def handle_state_change(self, state_change):
         pass
 
+    @staticmethod
+    @contextmanager
+    def batch_state_changes():
+        yield
+
+    def flush_state_changes(self):
+        pass
+
     def sign(self, message):
         message.sign(self.signer)
@@ -186,6 +186,23 @@ def assert_locked(from_channel, pending_locks):
         assert pending or unclaimed
 
 
+def assert_amount_locked(end_state):
+    """ Assert the amount locked maintained by `end_state` is the sum of its
+    locks.
+    """
+    pending = sum(lock.amount for lock in end_state.secrethashes_to_lockedlocks.values())
+    unclaimed = sum(
+        unlock.lock.amount
+        for unlock in end_state.secrethashes_to_unlockedlocks.values()
+    )
+    unclaimed_onchain = sum(
+        unlock.lock.amount
+        for unlock in end_state.secrethashes_to_onchain_unlockedlocks.values()
+    )
+
+    assert end_state.amount_locked == pending + unclaimed + unclaimed_onchain
+
+
 def assert_balance(from_channel, balance, locked):
     """ Assert the from_channel overall token values. """
     assert balance >= 0
@@ -278,15 +278,8 @@ class StateManager:
         """
         assert isinstance(state_change, StateChange)
 
-        # the state objects must be treated as immutable, so make a copy of the
-        # current state and pass the copy to the state machine to be modified.
-        next_state = deepcopy(self.current_state)
-
         # update the current state by applying the change
-        iteration = self.state_transition(
-            next_state,
-            state_change,
-        )
+        iteration = self.transition(state_change)
 
         assert isinstance(iteration, TransitionResult)
 
@@ -298,6 +291,59 @@ class StateManager:
 
         return events
 
+    def dispatch_many(self, state_changes: List[StateChange]) -> List[List[Event]]:
+        """ Apply the `state_changes` in order and return the events of each
+        of them.
+
+        The state changes are applied to a single copy of the current state,
+        which replaces it only once all of them are applied. If any of the
+        state transitions raises the current state is left unmodified.
+        """
+        assert all(isinstance(state_change, StateChange) for state_change in state_changes)
+
+        iterations = self.transition_many(state_changes)
+
+        if iterations:
+            self.current_state = iterations[-1].new_state
+
+        assert isinstance(self.current_state, (State, type(None)))
+        assert all(
+            isinstance(e, Event)
+            for iteration in iterations
+            for e in iteration.events
+        )
+
+        return [iteration.events for iteration in iterations]
+
+    def transition(self, state_change: StateChange) -> 'TransitionResult':
+        """ Apply the `state_change` to a copy of the current state, the
+        current state is not modified.
+        """
+        # the state objects must be treated as immutable, so make a copy of the
+        # current state and pass the copy to the state machine to be modified.
+        next_state = deepcopy(self.current_state)
+
+        return self.state_transition(
+            next_state,
+            state_change,
+        )
+
+    def transition_many(self, state_changes: List[StateChange]) -> List['TransitionResult']:
+        """ Apply the `state_changes` in order to a single copy of the current
+        state, the current state is not modified.
+        """
+        next_state = deepcopy(self.current_state)
+
+        iterations = list()
+        for state_change in state_changes:
+            iteration = self.state_transition(next_state, state_change)
+            assert isinstance(iteration, TransitionResult)
+
+            iterations.append(iteration)
+            next_state = iteration.new_state
+
+        return iterations
+
     def __eq__(self, other):
         return (
             isinstance(other, StateManager) and
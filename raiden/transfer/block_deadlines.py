@@ -0,0 +1,166 @@
+""" Index of the channels and payment tasks by the next block which may affect
+them.
+
+Most of the channels and payment tasks only react to a new block once a
+deadline is reached, e.g. the end of the settlement period of a closed
+channel, the confirmation of a deposit, the start of the unsafe region of a
+lock or its expiration. Instead of dispatching every block to every channel and
+every payment task, the node only dispatches it to the entries of the index
+which are due, and schedules them again at their next deadline.
+
+The index is derived from the rest of the chain state and it is not
+serialized:
+- An entry modified by any state change other than a block is due at the next
+  block, which computes its deadline.
+- An entry for which a block had an effect is also due at the next block, some
+  of the state machines repeat their events until the state changes.
+- A new or restored chain state has all its entries due at the next block.
+"""
+import heapq
+
+from raiden.settings import DEFAULT_NUMBER_OF_BLOCK_CONFIRMATIONS, DEFAULT_WAIT_BEFORE_LOCK_REMOVAL
+from raiden.utils.typing import (
+    TYPE_CHECKING,
+    Any,
+    BlockExpiration,
+    BlockNumber,
+    BlockTimeout,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+)
+
+# Upgrade pyflakes to 2.0.0 and remove the 'if' and '# noqa'.
+if TYPE_CHECKING:
+    from raiden.transfer.state import BlockDeadlinesState, ChainState  # noqa: F401
+
+# Number of blocks after the expiration of a lock during which a Block may
+# still affect it, the lock is removed at most DEFAULT_WAIT_BEFORE_LOCK_REMOVAL
+# blocks after its expiration.
+LOCK_BLOCKS_AFTER_EXPIRATION = max(
+    DEFAULT_WAIT_BEFORE_LOCK_REMOVAL,
+    DEFAULT_NUMBER_OF_BLOCK_CONFIRMATIONS * 2,
+) + 1
+
+
+def get_next_deadline(
+        deadlines: Iterable[int],
+        block_number: BlockNumber,
+) -> Optional[BlockNumber]:
+    """ Return the first of `deadlines` after `block_number`, None if all of
+    them passed.
+    """
+    future_deadlines = [deadline for deadline in deadlines if deadline > block_number]
+
+    if not future_deadlines:
+        return None
+
+    return BlockNumber(min(future_deadlines))
+
+
+def get_lock_deadline(
+        expiration: BlockExpiration,
+        reveal_timeout: BlockTimeout,
+        block_number: BlockNumber,
+) -> Optional[BlockNumber]:
+    """ Return the next block at which a Block may affect a lock, None if the
+    lock can not be affected by blocks anymore.
+
+    Every block from the start of the unsafe region of the lock, i.e.
+    `reveal_timeout` blocks before its expiration, until it can be removed
+    is a deadline.
+    """
+    first_block = expiration - reveal_timeout
+    last_block = expiration + LOCK_BLOCKS_AFTER_EXPIRATION
+    next_block = block_number + 1
+
+    if next_block > last_block:
+        return None
+
+    return BlockNumber(max(first_block, next_block))
+
+
+def schedule(index: 'BlockDeadlinesState', key: Hashable, deadline: BlockNumber):
+    """ Make the entry `key` due at `deadline`, unless it is due earlier. """
+    current_deadline = index.keys_to_deadlines.get(key)
+
+    if current_deadline is None or deadline < current_deadline:
+        index.keys_to_deadlines[key] = deadline
+        heapq.heappush(index.heap, (deadline, key))
+
+
+def pop_due(index: 'BlockDeadlinesState', block_number: BlockNumber) -> List[Any]:
+    """ Remove and return the keys of the entries due at `block_number`.
+
+    The keys are sorted, so the order in which the entries are visited does not
+    depend on their deadlines.
+    """
+    heap = index.heap
+    keys_to_deadlines = index.keys_to_deadlines
+    due = list()
+
+    while heap and heap[0][0] <= block_number:
+        deadline, key = heapq.heappop(heap)
+
+        if keys_to_deadlines.get(key) == deadline:
+            del keys_to_deadlines[key]
+            due.append(key)
+
+    due.sort()
+    return due
+
+
+def get_due(index: 'BlockDeadlinesState', block_number: BlockNumber) -> List[Any]:
+    """ Return the keys of the entries due at `block_number`, without removing
+    them from the index.
+
+    Only the part of the heap with the deadlines up to `block_number` is
+    visited.
+    """
+    heap = index.heap
+    keys_to_deadlines = index.keys_to_deadlines
+    # A key may be in the heap more than once with its current deadline
+    due = set()
+    positions = [0] if heap else []
+
+    while positions:
+        position = positions.pop()
+        deadline, key = heap[position]
+
+        if deadline > block_number:
+            continue
+
+        if keys_to_deadlines.get(key) == deadline:
+            due.add(key)
+
+        positions.extend(
+            child
+            for child in (2 * position + 1, 2 * position + 2)
+            if child < len(heap)
+        )
+
+    return sorted(due)
+
+
+def schedule_all(chain_state: 'ChainState', deadline: BlockNumber):
+    """ Make every channel and payment task of `chain_state` due at
+    `deadline`, if its index is not complete.
+    """
+    channel_deadlines = chain_state.channel_deadlines
+    if channel_deadlines.all_due:
+        for payment_network in chain_state.identifiers_to_paymentnetworks.values():
+            for token_network in payment_network.tokenidentifiers_to_tokennetworks.values():
+                for channel_identifier in token_network.channelidentifiers_to_channels:
+                    schedule(
+                        channel_deadlines,
+                        (token_network.address, channel_identifier),
+                        deadline,
+                    )
+        channel_deadlines.all_due = False
+
+    payment_task_deadlines = chain_state.payment_task_deadlines
+    if payment_task_deadlines.all_due:
+        for secrethash in chain_state.payment_mapping.secrethashes_to_task:
+            schedule(payment_task_deadlines, secrethash, deadline)
+        payment_task_deadlines.all_due = False
@@ -11,6 +11,7 @@ from raiden.constants import (
     UINT256_MAX,
 )
 from raiden.settings import DEFAULT_NUMBER_OF_BLOCK_CONFIRMATIONS
+from raiden.transfer import profiling
 from raiden.transfer.architecture import Event, StateChange, TransitionResult
 from raiden.transfer.balance_proof import pack_balance_proof
 from raiden.transfer.events import (
@@ -41,7 +42,13 @@ from raiden.transfer.mediated_transfer.state_change import (
     ReceiveTransferRefund,
     ReceiveTransferRefundCancelRoute,
 )
-from raiden.transfer.merkle_tree import LEAVES, compute_layers, compute_merkleproof_for, merkleroot
+from raiden.transfer.merkle_tree import (
+    LEAVES,
+    compute_layers_with,
+    compute_layers_without,
+    compute_merkleproof_for,
+    merkleroot,
+)
 from raiden.transfer.state import (
     CHANNEL_STATE_CLOSED,
     CHANNEL_STATE_CLOSING,
@@ -87,6 +94,7 @@ from raiden.utils.typing import (
     BlockNumber,
     ChainID,
     ChannelID,
+    Dict,
     InitiatorAddress,
     List,
     LockHash,
@@ -105,6 +113,7 @@ from raiden.utils.typing import (
     TokenNetworkAddress,
     TokenNetworkID,
     Tuple,
+    Union,
 )
 
 # This should be changed to `Union[str, MerkleTreeState]`
@@ -830,19 +839,10 @@ def get_amount_unclaimed_onchain(end_state: NettingChannelEndState) -> TokenAmou
 
 
 def get_amount_locked(end_state: NettingChannelEndState) -> TokenAmount:
-    total_pending = sum(
-        lock.amount
-        for lock in end_state.secrethashes_to_lockedlocks.values()
-    )
-
-    total_unclaimed = sum(
-        unlock.lock.amount
-        for unlock in end_state.secrethashes_to_unlockedlocks.values()
-    )
-
-    total_unclaimed_onchain = get_amount_unclaimed_onchain(end_state)
-
-    return total_pending + total_unclaimed + total_unclaimed_onchain
+    """ Sum of the amounts of the pending, unclaimed, and unclaimed on-chain
+    locks of `end_state`.
+    """
+    return end_state.amount_locked
 
 
 def get_balance(
@@ -1021,15 +1021,57 @@ def get_status(channel_state):
     return result
 
 
-def _del_unclaimed_lock(
+def _lock_entry_amount(entry: Union[HashTimeLockState, UnlockPartialProofState]) -> TokenAmount:
+    if isinstance(entry, UnlockPartialProofState):
+        return entry.lock.amount
+    return entry.amount
+
+
+def _set_lock_entry(
         end_state: NettingChannelEndState,
+        locks: Dict[SecretHash, Union[HashTimeLockState, UnlockPartialProofState]],
         secrethash: SecretHash,
+        entry: Union[HashTimeLockState, UnlockPartialProofState],
 ) -> None:
-    if secrethash in end_state.secrethashes_to_lockedlocks:
-        del end_state.secrethashes_to_lockedlocks[secrethash]
+    """ Stores `entry` in `locks`, which must be one of the lock dictionaries
+    of `end_state`, and updates the amount locked.
+    """
+    _pop_lock_entry(end_state, locks, secrethash)
+    locks[secrethash] = entry
+    end_state.amount_locked = TokenAmount(end_state.amount_locked + _lock_entry_amount(entry))
 
-    if secrethash in end_state.secrethashes_to_unlockedlocks:
-        del end_state.secrethashes_to_unlockedlocks[secrethash]
+
+def _pop_lock_entry(
+        end_state: NettingChannelEndState,
+        locks: Dict[SecretHash, Union[HashTimeLockState, UnlockPartialProofState]],
+        secrethash: SecretHash,
+) -> Optional[Union[HashTimeLockState, UnlockPartialProofState]]:
+    """ Removes the entry of `secrethash` from `locks`, which must be one of
+    the lock dictionaries of `end_state`, and updates the amount locked.
+    """
+    entry = locks.pop(secrethash, None)
+
+    if entry is not None:
+        end_state.amount_locked = TokenAmount(end_state.amount_locked - _lock_entry_amount(entry))
+
+    return entry
+
+
+def register_lock(end_state: NettingChannelEndState, lock: HashTimeLockState) -> None:
+    """ Registers a lock for which the secret is not known yet.
+
+    Note:
+        This won't change the merkletree!
+    """
+    _set_lock_entry(end_state, end_state.secrethashes_to_lockedlocks, lock.secrethash, lock)
+
+
+def _del_unclaimed_lock(
+        end_state: NettingChannelEndState,
+        secrethash: SecretHash,
+) -> None:
+    _pop_lock_entry(end_state, end_state.secrethashes_to_lockedlocks, secrethash)
+    _pop_lock_entry(end_state, end_state.secrethashes_to_unlockedlocks, secrethash)
 
 
 def _del_lock(end_state: NettingChannelEndState, secrethash: SecretHash) -> None:
@@ -1041,9 +1083,7 @@ def _del_lock(end_state: NettingChannelEndState, secrethash: SecretHash) -> None
     assert is_lock_pending(end_state, secrethash)
 
     _del_unclaimed_lock(end_state, secrethash)
-
-    if secrethash in end_state.secrethashes_to_onchain_unlockedlocks:
-        del end_state.secrethashes_to_onchain_unlockedlocks[secrethash]
+    _pop_lock_entry(end_state, end_state.secrethashes_to_onchain_unlockedlocks, secrethash)
 
 
 def set_closed(
@@ -1107,15 +1147,12 @@ def compute_merkletree_with(
 ) -> Optional[MerkleTreeState]:
     """Register the given lockhash with the existing merkle tree."""
     # Use None to inform the caller the lockshash is already known
-    result = None
+    layers = compute_layers_with(merkletree.layers, lockhash)
 
-    leaves = merkletree.layers[LEAVES]
-    if lockhash not in leaves:
-        leaves = list(leaves)
-        leaves.append(lockhash)
-        result = MerkleTreeState(compute_layers(leaves))
+    if layers is None:
+        return None
 
-    return result
+    return MerkleTreeState(layers)
 
 
 def compute_merkletree_without(
@@ -1123,19 +1160,15 @@ def compute_merkletree_without(
         lockhash: LockHash,
 ) -> Optional[MerkleTreeState]:
     # Use None to inform the caller the lockshash is unknown
-    result = None
+    layers = compute_layers_without(merkletree.layers, lockhash)
 
-    leaves = merkletree.layers[LEAVES]
-    if lockhash in leaves:
-        leaves = list(leaves)
-        leaves.remove(lockhash)
+    if layers is None:
+        return None
 
-        if leaves:
-            result = MerkleTreeState(compute_layers(leaves))
-        else:
-            result = make_empty_merkle_tree()
+    if not layers[LEAVES]:
+        return make_empty_merkle_tree()
 
-    return result
+    return MerkleTreeState(layers)
 
 
 def create_sendlockedtransfer(
@@ -1304,7 +1337,7 @@ def send_lockedtransfer(
     lock = transfer.lock
     channel_state.our_state.balance_proof = transfer.balance_proof
     channel_state.our_state.merkletree = merkletree
-    channel_state.our_state.secrethashes_to_lockedlocks[lock.secrethash] = lock
+    register_lock(channel_state.our_state, lock)
 
     return send_locked_transfer_event
 
@@ -1341,7 +1374,7 @@ def send_refundtransfer(
 
     channel_state.our_state.balance_proof = mediated_transfer.balance_proof
     channel_state.our_state.merkletree = merkletree
-    channel_state.our_state.secrethashes_to_lockedlocks[lock.secrethash] = lock
+    register_lock(channel_state.our_state, lock)
 
     refund_transfer = refund_from_sendmediated(send_mediated_transfer)
     return refund_transfer
@@ -1485,12 +1518,17 @@ def register_secret_endstate(
         secrethash: SecretHash,
 ) -> None:
     if is_lock_locked(end_state, secrethash):
-        pending_lock = end_state.secrethashes_to_lockedlocks[secrethash]
-        del end_state.secrethashes_to_lockedlocks[secrethash]
+        pending_lock = _pop_lock_entry(
+            end_state,
+            end_state.secrethashes_to_lockedlocks,
+            secrethash,
+        )
 
-        end_state.secrethashes_to_unlockedlocks[secrethash] = UnlockPartialProofState(
-            pending_lock,
-            secret,
+        _set_lock_entry(
+            end_state,
+            end_state.secrethashes_to_unlockedlocks,
+            secrethash,
+            UnlockPartialProofState(pending_lock, secret),
         )
 
 
@@ -1522,9 +1560,11 @@ def register_onchain_secret_endstate(
         if delete_lock:
             _del_lock(end_state, secrethash)
 
-        end_state.secrethashes_to_onchain_unlockedlocks[secrethash] = UnlockPartialProofState(
-            pending_lock,
-            secret,
+        _set_lock_entry(
+            end_state,
+            end_state.secrethashes_to_onchain_unlockedlocks,
+            secrethash,
+            UnlockPartialProofState(pending_lock, secret),
         )
 
 
@@ -1610,7 +1650,7 @@ def handle_refundtransfer(
         channel_state.partner_state.merkletree = merkletree
 
         lock = refund.transfer.lock
-        channel_state.partner_state.secrethashes_to_lockedlocks[lock.secrethash] = lock
+        register_lock(channel_state.partner_state, lock)
 
         send_processed = SendProcessed(
             recipient=refund.transfer.balance_proof.sender,
@@ -1688,7 +1728,7 @@ def handle_receive_lockedtransfer(
         channel_state.partner_state.merkletree = merkletree
 
         lock = mediated_transfer.lock
-        channel_state.partner_state.secrethashes_to_lockedlocks[lock.secrethash] = lock
+        register_lock(channel_state.partner_state, lock)
 
         send_processed = SendProcessed(
             recipient=mediated_transfer.balance_proof.sender,
@@ -1742,6 +1782,29 @@ def handle_unlock(channel_state: NettingChannelState, unlock: ReceiveUnlock) ->
     return is_valid, events, msg
 
 
+def get_block_deadlines(channel_state: NettingChannelState) -> List[BlockNumber]:
+    """ Returns the block numbers at which a Block may affect the channel, i.e.
+    the end of the settlement period and the confirmation of the pending
+    deposits.
+    """
+    deadlines = list()
+
+    if get_status(channel_state) == CHANNEL_STATE_CLOSED:
+        closed_block_number = channel_state.close_transaction.finished_block_number
+        settlement_end = closed_block_number + channel_state.settle_timeout
+        deadlines.append(BlockNumber(settlement_end + 1))
+
+    if channel_state.deposit_transaction_queue:
+        # The queue is ordered by block number, only the first deposit can be
+        # confirmed first.
+        first_deposit_block = channel_state.deposit_transaction_queue[0].block_number
+        deadlines.append(BlockNumber(
+            first_deposit_block + DEFAULT_NUMBER_OF_BLOCK_CONFIRMATIONS + 1,
+        ))
+
+    return deadlines
+
+
 def handle_block(
         channel_state: NettingChannelState,
         state_change: Block,
@@ -1926,6 +1989,7 @@ def handle_channel_batch_unlock(
     return TransitionResult(channel_state, events)
 
 
+@profiling.profiled
 def state_transition(
         channel_state: NettingChannelState,
         state_change: StateChange,
@@ -0,0 +1,466 @@
+""" Path copying of the chain state for the state transitions.
+
+`StateManager.dispatch` applies every state change to a deep copy of the whole
+chain state, so each transition costs as much as all the channels and payment
+tasks together. A transition only modifies the parts of the chain state which
+its state change reaches:
+
+- The channels named by the state change, directly or through its balance
+  proof and routes, and the channels which are due at a block.
+- The payment task of the secrethash of the state change and the payment tasks
+  which are due at a block, with the channels used by these tasks.
+- The routing graph and the partners of a token network, if a channel or a
+  route is opened or removed.
+- The bookkeeping of the node: the message queues, the pending transactions and
+  the derived indexes.
+
+The footprint of a state change lists these parts, and `copy_chain_state`
+copies the chain state along the paths from its root down to them: the chain
+state, the payment and token networks on the paths and their dictionaries are
+shallow copies, the channels and payment tasks of the footprint are deep
+copies, every other channel and payment task is shared with the previous state.
+The containers of the bookkeeping are copied, their items are events which are
+not modified once created.
+
+A state change without a known footprint is applied to a deep copy, e.g. the
+ones which add token networks or the first block of a restored state, at which
+every channel is due.
+"""
+import random
+from collections import defaultdict
+from copy import copy, deepcopy
+
+from raiden.transfer import block_deadlines, node
+from raiden.transfer.architecture import (
+    BalanceProofStateChange,
+    State,
+    StateChange,
+    StateManager,
+    TransitionResult,
+)
+from raiden.transfer.mediated_transfer.state_change import (
+    ActionInitInitiator,
+    ActionInitMediator,
+    ActionInitTarget,
+    ReceiveTransferRefund,
+    ReceiveTransferRefundCancelRoute,
+)
+from raiden.transfer.state import (
+    BlockDeadlinesState,
+    ChainState,
+    LookupIndexesState,
+    MessageQueuesIndexState,
+    PendingTransactionsIndexState,
+    RouteState,
+    TokenNetworkGraphState,
+    TokenNetworkState,
+)
+from raiden.transfer.state_change import (
+    ActionChangeNodeNetworkState,
+    ActionLeaveAllNetworks,
+    ActionUpdateTransportAuthData,
+    Block,
+    ContractReceiveChannelBatchUnlock,
+    ContractReceiveChannelClosed,
+    ContractReceiveChannelNew,
+    ContractReceiveChannelSettled,
+    ContractReceiveRouteClosed,
+    ContractReceiveRouteNew,
+    ReceiveDelivered,
+    ReceiveProcessed,
+)
+from raiden.utils.typing import (
+    MYPY_ANNOTATION,
+    ChannelID,
+    Dict,
+    List,
+    Optional,
+    SecretHash,
+    Set,
+    TokenNetworkID,
+)
+
+# State changes which only modify the chain state itself and the bookkeeping
+STATE_CHANGES_FOR_BOOKKEEPING = (
+    ActionLeaveAllNetworks,
+    ActionUpdateTransportAuthData,
+    ReceiveDelivered,
+    ReceiveProcessed,
+)
+# State changes which open or remove a channel or a route of a token network
+STATE_CHANGES_FOR_TOKEN_NETWORK = (
+    ContractReceiveChannelBatchUnlock,
+    ContractReceiveChannelClosed,
+    ContractReceiveChannelNew,
+    ContractReceiveChannelSettled,
+    ContractReceiveRouteClosed,
+    ContractReceiveRouteNew,
+)
+STATE_CHANGES_FOR_CHANNEL_OR_TOKEN_NETWORK = (
+    node.STATE_CHANGES_FOR_CHANNEL + STATE_CHANGES_FOR_TOKEN_NETWORK
+)
+
+
+class Footprint:
+    """ The channels and payment tasks which a state transition may modify.
+
+    The token networks in `channels` are copied even without channels, their
+    partners may be read through a defaultdict.
+    """
+
+    __slots__ = (
+        'channels',
+        'secrethashes',
+        'token_networks',
+    )
+
+    def __init__(self):
+        self.channels: Dict[TokenNetworkID, Set[ChannelID]] = defaultdict(set)
+        self.secrethashes: Set[SecretHash] = set()
+        #: Token networks of which the graph and the partners are modified
+        self.token_networks: Set[TokenNetworkID] = set()
+
+    def __repr__(self):
+        return '<Footprint channels:{} payment_tasks:{} token_networks:{}>'.format(
+            sum(len(channels) for channels in self.channels.values()),
+            len(self.secrethashes),
+            len(self.token_networks),
+        )
+
+
+def add_payment_task(footprint: Footprint, chain_state: ChainState, secrethash: SecretHash):
+    footprint.secrethashes.add(secrethash)
+    sub_task = chain_state.payment_mapping.secrethashes_to_task.get(secrethash)
+
+    if sub_task is not None:
+        channels = footprint.channels[sub_task.token_network_identifier]
+        for _, channel_identifier in node.get_paymenttask_locks_and_channels(sub_task):
+            channels.add(channel_identifier)
+
+
+def add_state_change_channels(footprint: Footprint, state_change: StateChange):
+    """ Add the channels of the balance proof and the routes of a payment task
+    state change, the task may use any of them.
+    """
+    routes: List[RouteState] = list()
+
+    if isinstance(state_change, ActionInitInitiator):
+        token_network_identifier = state_change.transfer.token_network_identifier
+        routes = state_change.routes
+
+    elif isinstance(state_change, BalanceProofStateChange):
+        balance_proof = state_change.balance_proof
+        token_network_identifier = balance_proof.token_network_identifier
+        footprint.channels[token_network_identifier].add(balance_proof.channel_identifier)
+
+        if isinstance(state_change, ActionInitMediator):
+            routes = state_change.routes + [state_change.from_route]
+        elif isinstance(state_change, ActionInitTarget):
+            routes = [state_change.route]
+        elif isinstance(state_change, (ReceiveTransferRefund, ReceiveTransferRefundCancelRoute)):
+            routes = state_change.routes
+
+    else:
+        return
+
+    channels = footprint.channels[token_network_identifier]
+    for route in routes:
+        channels.add(route.channel_identifier)
+
+
+def add_token_network_channels(footprint: Footprint, chain_state: ChainState, state_change):
+    """ Add the channels and the token network of a state change dispatched to
+    a token network.
+    """
+    # pylint: disable=unidiomatic-typecheck
+    token_network_identifier = state_change.token_network_identifier
+    channels = footprint.channels[token_network_identifier]
+
+    if type(state_change) in STATE_CHANGES_FOR_TOKEN_NETWORK:
+        footprint.token_networks.add(token_network_identifier)
+
+    if type(state_change) == ContractReceiveChannelBatchUnlock:
+        # The channels are found by their participants
+        participants = {state_change.participant, state_change.partner}
+
+        # Not looked up through the views, these may build the lookup indexes
+        # of the previous state
+        for payment_network_state in chain_state.identifiers_to_paymentnetworks.values():
+            token_network_state = payment_network_state.tokenidentifiers_to_tokennetworks.get(
+                token_network_identifier,
+            )
+            if token_network_state is None:
+                continue
+
+            channels.update(
+                channel_state.identifier
+                for channel_state in token_network_state.channelidentifiers_to_channels.values()
+                if {channel_state.our_state.address, channel_state.partner_state.address} ==
+                participants
+            )
+
+    elif type(state_change) not in (ContractReceiveRouteNew, ContractReceiveRouteClosed):
+        channels.add(state_change.channel_identifier)
+
+
+def get_footprint(chain_state: ChainState, state_change: StateChange) -> Optional[Footprint]:
+    """ Return the footprint of `state_change` applied to `chain_state`, None
+    if it is unknown.
+    """
+    # pylint: disable=unidiomatic-typecheck
+    footprint = Footprint()
+
+    if type(state_change) == Block:
+        assert isinstance(state_change, Block), MYPY_ANNOTATION
+        channel_deadlines = chain_state.channel_deadlines
+        payment_task_deadlines = chain_state.payment_task_deadlines
+
+        # Every channel or payment task is due
+        if channel_deadlines.all_due or payment_task_deadlines.all_due:
+            return None
+
+        block_number = state_change.block_number
+        for key in block_deadlines.get_due(channel_deadlines, block_number):
+            token_network_identifier, channel_identifier = key
+            footprint.channels[token_network_identifier].add(channel_identifier)
+
+        for secrethash in block_deadlines.get_due(payment_task_deadlines, block_number):
+            add_payment_task(footprint, chain_state, secrethash)
+
+    elif type(state_change) in node.STATE_CHANGES_FOR_PAYMENT_TASK:
+        secrethash = node.get_secrethash_of_state_change(state_change)
+        add_payment_task(footprint, chain_state, secrethash)
+        add_state_change_channels(footprint, state_change)
+
+    elif type(state_change) in STATE_CHANGES_FOR_CHANNEL_OR_TOKEN_NETWORK:
+        add_token_network_channels(footprint, chain_state, state_change)
+
+    elif type(state_change) == ActionChangeNodeNetworkState:
+        # Dispatched to every mediator task
+        for secrethash in chain_state.payment_mapping.secrethashes_to_task:
+            add_payment_task(footprint, chain_state, secrethash)
+
+    elif type(state_change) not in STATE_CHANGES_FOR_BOOKKEEPING:
+        return None
+
+    return footprint
+
+
+def copy_random(generator: random.Random) -> random.Random:
+    copy_generator = random.Random()
+    copy_generator.setstate(generator.getstate())
+    return copy_generator
+
+
+def copy_block_deadlines(index: BlockDeadlinesState) -> BlockDeadlinesState:
+    copy_index = copy(index)
+    copy_index.heap = list(index.heap)
+    copy_index.keys_to_deadlines = dict(index.keys_to_deadlines)
+    return copy_index
+
+
+def copy_pending_transactions_index(
+        index: PendingTransactionsIndexState,
+) -> PendingTransactionsIndexState:
+    copy_index = copy(index)
+    copy_index.keys_to_transactions = {
+        key: list(transactions)
+        for key, transactions in index.keys_to_transactions.items()
+    }
+    copy_index.expirations = list(index.expirations)
+    return copy_index
+
+
+def copy_message_queues_index(index: MessageQueuesIndexState) -> MessageQueuesIndexState:
+    copy_index = copy(index)
+    copy_index.keys_to_messages = {
+        key: list(messages)
+        for key, messages in index.keys_to_messages.items()
+    }
+    return copy_index
+
+
+def copy_lookup_indexes(indexes: LookupIndexesState, partners: bool) -> LookupIndexesState:
+    """ Copy the indexes, the sets of token networks of the partners are only
+    copied if `partners` is set.
+    """
+    copy_indexes = copy(indexes)
+    copy_indexes.tokennetworkids_to_paymentnetworkids = dict(
+        indexes.tokennetworkids_to_paymentnetworkids,
+    )
+
+    if partners:
+        copy_indexes.partneraddresses_to_tokennetworkids = {
+            partner_address: set(token_network_ids)
+            for partner_address, token_network_ids
+            in indexes.partneraddresses_to_tokennetworkids.items()
+        }
+    else:
+        copy_indexes.partneraddresses_to_tokennetworkids = dict(
+            indexes.partneraddresses_to_tokennetworkids,
+        )
+
+    return copy_indexes
+
+
+def copy_network_graph(network_graph: TokenNetworkGraphState) -> TokenNetworkGraphState:
+    copy_graph = copy(network_graph)
+    copy_graph.network = network_graph.network.copy()
+    copy_graph.channel_identifier_to_participants = dict(
+        network_graph.channel_identifier_to_participants,
+    )
+    return copy_graph
+
+
+def copy_token_network(
+        token_network_state: TokenNetworkState,
+        channel_identifiers: Set[ChannelID],
+        structure: bool,
+) -> TokenNetworkState:
+    """ Copy the token network with deep copies of the channels of
+    `channel_identifiers`, its graph and partners are copied if `structure` is
+    set.
+    """
+    copy_token_network_state = copy(token_network_state)
+
+    channelidentifiers_to_channels = dict(token_network_state.channelidentifiers_to_channels)
+    for channel_identifier in channel_identifiers:
+        channel_state = channelidentifiers_to_channels.get(channel_identifier)
+        if channel_state is not None:
+            channelidentifiers_to_channels[channel_identifier] = deepcopy(channel_state)
+    copy_token_network_state.channelidentifiers_to_channels = channelidentifiers_to_channels
+
+    partneraddresses_to_channelidentifiers = (
+        token_network_state.partneraddresses_to_channelidentifiers
+    )
+    if structure:
+        copy_token_network_state.network_graph = copy_network_graph(
+            token_network_state.network_graph,
+        )
+        copy_token_network_state.partneraddresses_to_channelidentifiers = defaultdict(list, {
+            partner_address: list(partner_channel_identifiers)
+            for partner_address, partner_channel_identifiers
+            in partneraddresses_to_channelidentifiers.items()
+        })
+    else:
+        copy_token_network_state.partneraddresses_to_channelidentifiers = defaultdict(
+            list,
+            partneraddresses_to_channelidentifiers,
+        )
+
+    return copy_token_network_state
+
+
+def copy_chain_state(chain_state: ChainState, footprint: Footprint) -> ChainState:
+    """ Return a copy of `chain_state` in which the parts of `footprint` and the
+    paths to them are not shared with `chain_state`.
+    """
+    copy_state = copy(chain_state)
+
+    identifiers_to_paymentnetworks = dict(chain_state.identifiers_to_paymentnetworks)
+    for payment_network_identifier, payment_network_state in list(
+            identifiers_to_paymentnetworks.items(),
+    ):
+        tokenidentifiers_to_tokennetworks = payment_network_state.tokenidentifiers_to_tokennetworks
+        token_network_identifiers = [
+            token_network_identifier
+            for token_network_identifier in footprint.channels
+            if token_network_identifier in tokenidentifiers_to_tokennetworks
+        ]
+
+        if not token_network_identifiers:
+            continue
+
+        copy_payment_network_state = copy(payment_network_state)
+        copy_payment_network_state.tokenidentifiers_to_tokennetworks = dict(
+            tokenidentifiers_to_tokennetworks,
+        )
+        for token_network_identifier in token_network_identifiers:
+            copy_payment_network_state.tokenidentifiers_to_tokennetworks[
+                token_network_identifier
+            ] = copy_token_network(
+                tokenidentifiers_to_tokennetworks[token_network_identifier],
+                footprint.channels[token_network_identifier],
+                token_network_identifier in footprint.token_networks,
+            )
+
+        identifiers_to_paymentnetworks[payment_network_identifier] = copy_payment_network_state
+
+    copy_state.identifiers_to_paymentnetworks = identifiers_to_paymentnetworks
+
+    secrethashes_to_task = dict(chain_state.payment_mapping.secrethashes_to_task)
+    for secrethash in footprint.secrethashes:
+        sub_task = secrethashes_to_task.get(secrethash)
+        if sub_task is not None:
+            secrethashes_to_task[secrethash] = deepcopy(sub_task)
+
+    copy_state.payment_mapping = copy(chain_state.payment_mapping)
+    copy_state.payment_mapping.secrethashes_to_task = secrethashes_to_task
+
+    copy_state.pseudo_random_generator = copy_random(chain_state.pseudo_random_generator)
+    copy_state.nodeaddresses_to_networkstates = dict(chain_state.nodeaddresses_to_networkstates)
+    copy_state.pending_transactions = list(chain_state.pending_transactions)
+    copy_state.pending_transactions_index = copy_pending_transactions_index(
+        chain_state.pending_transactions_index,
+    )
+    copy_state.queueids_to_queues = {
+        queueid: queue.copy()
+        for queueid, queue in chain_state.queueids_to_queues.items()
+    }
+    copy_state.message_queues_index = copy_message_queues_index(
+        chain_state.message_queues_index,
+    )
+    copy_state.lookup_indexes = copy_lookup_indexes(
+        chain_state.lookup_indexes,
+        partners=bool(footprint.token_networks),
+    )
+    copy_state.channel_deadlines = copy_block_deadlines(chain_state.channel_deadlines)
+    copy_state.payment_task_deadlines = copy_block_deadlines(chain_state.payment_task_deadlines)
+    copy_state.updated_balance_proofs = list(chain_state.updated_balance_proofs)
+
+    return copy_state
+
+
+def copy_state_for_transition(state: Optional[State], state_change: StateChange):
+    """ Return a copy of `state` to which `state_change` can be applied
+    without modifying `state`.
+    """
+    if not isinstance(state, ChainState):
+        return deepcopy(state)
+
+    footprint = get_footprint(state, state_change)
+    if footprint is None:
+        return deepcopy(state)
+
+    return copy_chain_state(state, footprint)
+
+
+class CopyOnWriteStateManager(StateManager):
+    """ State manager which applies the state changes to copies of the paths
+    of the chain state which they modify, instead of deep copies.
+    """
+    __slots__ = ()
+
+    def transition(self, state_change: StateChange) -> TransitionResult:
+        next_state = copy_state_for_transition(self.current_state, state_change)
+
+        return self.state_transition(
+            next_state,
+            state_change,
+        )
+
+    def transition_many(self, state_changes: List[StateChange]) -> List[TransitionResult]:
+        next_state = self.current_state
+
+        iterations = list()
+        for state_change in state_changes:
+            iteration = self.state_transition(
+                copy_state_for_transition(next_state, state_change),
+                state_change,
+            )
+            assert isinstance(iteration, TransitionResult)
+
+            iterations.append(iteration)
+            next_state = iteration.new_state
+
+        return iterations
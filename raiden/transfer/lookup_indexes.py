@@ -0,0 +1,125 @@
+""" Indexes of the chain state used by the views to find a token network, its
+payment network and the partners of this node without walking every payment
+and token network.
+
+The token networks are never removed, so an entry of
+`tokennetworkids_to_paymentnetworkids` is valid for the lifetime of the chain
+state. A token network which is not in the index yet is searched for and added
+to it, the index is not required to be complete.
+
+The partners are indexed by the token networks in which they have a channel
+with this node. The index is updated by the node whenever the channels of a
+token network are added or removed, and it is built from the payment networks
+when first used by a new or a restored chain state.
+
+Only identifiers are indexed, the token networks and the channels are always
+read from the chain state. The state transitions replace channels and the
+state managers copy them, an index of the objects would have to be updated on
+each of these. Listing every channel still walks the token networks, which is
+proportional to the number of channels anyway.
+"""
+from raiden.utils.typing import TYPE_CHECKING, Optional, PaymentNetworkID, TokenNetworkID
+
+# Upgrade pyflakes to 2.0.0 and remove the 'if' and '# noqa'.
+if TYPE_CHECKING:
+    from raiden.transfer.state import (  # noqa: F401
+        ChainState,
+        LookupIndexesState,
+        TokenNetworkState,
+    )
+
+
+def get_lookup_indexes(chain_state: 'ChainState') -> 'LookupIndexesState':
+    """ Return the indexes of `chain_state`, building them if necessary. """
+    lookup_indexes = chain_state.lookup_indexes
+
+    if not lookup_indexes.is_complete:
+        lookup_indexes.tokennetworkids_to_paymentnetworkids.clear()
+        lookup_indexes.partneraddresses_to_tokennetworkids.clear()
+        lookup_indexes.is_complete = True
+
+        for payment_network in chain_state.identifiers_to_paymentnetworks.values():
+            for token_network in payment_network.tokenidentifiers_to_tokennetworks.values():
+                add_token_network(
+                    chain_state,
+                    PaymentNetworkID(payment_network.address),
+                    token_network,
+                )
+
+    return lookup_indexes
+
+
+def get_payment_network_identifier(
+        chain_state: 'ChainState',
+        token_network_id: TokenNetworkID,
+) -> Optional[PaymentNetworkID]:
+    """ Return the identifier of the payment network of the token network
+    `token_network_id`, None if it is unknown.
+    """
+    tokennetworkids_to_paymentnetworkids = get_lookup_indexes(
+        chain_state,
+    ).tokennetworkids_to_paymentnetworkids
+
+    payment_network_id = tokennetworkids_to_paymentnetworkids.get(token_network_id)
+    if payment_network_id is not None:
+        return payment_network_id
+
+    # The token network was added without going through the node
+    for payment_network in chain_state.identifiers_to_paymentnetworks.values():
+        if token_network_id in payment_network.tokenidentifiers_to_tokennetworks:
+            payment_network_id = PaymentNetworkID(payment_network.address)
+            tokennetworkids_to_paymentnetworkids[token_network_id] = payment_network_id
+            return payment_network_id
+
+    return None
+
+
+def add_token_network(
+        chain_state: 'ChainState',
+        payment_network_id: PaymentNetworkID,
+        token_network_state: 'TokenNetworkState',
+):
+    """ Index the token network `token_network_state` of the payment network
+    `payment_network_id` and the partners of its channels.
+    """
+    lookup_indexes = chain_state.lookup_indexes
+    lookup_indexes.tokennetworkids_to_paymentnetworkids[
+        token_network_state.address
+    ] = payment_network_id
+
+    update_token_network_partners(chain_state, token_network_state)
+
+
+def update_token_network_partners(
+        chain_state: 'ChainState',
+        token_network_state: 'TokenNetworkState',
+):
+    """ Update the index of the partners for the channels of
+    `token_network_state`.
+
+    The partners of the removed channels are kept by the token network with an
+    empty list of channels, so they are removed from the index as well.
+    """
+    lookup_indexes = chain_state.lookup_indexes
+    if not lookup_indexes.is_complete:
+        return
+
+    partneraddresses_to_channelidentifiers = (
+        token_network_state.partneraddresses_to_channelidentifiers
+    )
+    partneraddresses_to_tokennetworkids = lookup_indexes.partneraddresses_to_tokennetworkids
+    token_network_id = token_network_state.address
+
+    for partner_address, channel_identifiers in partneraddresses_to_channelidentifiers.items():
+        if channel_identifiers:
+            partneraddresses_to_tokennetworkids.setdefault(
+                partner_address,
+                set(),
+            ).add(token_network_id)
+
+        elif partner_address in partneraddresses_to_tokennetworkids:
+            token_network_ids = partneraddresses_to_tokennetworkids[partner_address]
+            token_network_ids.discard(token_network_id)
+
+            if not token_network_ids:
+                del partneraddresses_to_tokennetworkids[partner_address]
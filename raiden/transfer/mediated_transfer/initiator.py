@@ -2,7 +2,7 @@ import random
 
 from raiden.constants import MAXIMUM_PENDING_TRANSFERS
 from raiden.settings import DEFAULT_WAIT_BEFORE_LOCK_REMOVAL
-from raiden.transfer import channel
+from raiden.transfer import channel, profiling
 from raiden.transfer.architecture import Event, TransitionResult
 from raiden.transfer.events import EventPaymentSentFailed, EventPaymentSentSuccess
 from raiden.transfer.mediated_transfer.events import (
@@ -443,6 +443,7 @@ def handle_onchain_secretreveal(
     return iteration
 
 
+@profiling.profiled
 def state_transition(
         initiator_state: InitiatorTransferState,
         state_change: StateChange,
@@ -1,6 +1,6 @@
 import random
 
-from raiden.transfer import channel
+from raiden.transfer import channel, profiling
 from raiden.transfer.architecture import Event, StateChange, TransitionResult
 from raiden.transfer.events import EventPaymentSentFailed
 from raiden.transfer.mediated_transfer import initiator
@@ -477,6 +477,7 @@ def handle_secretrequest(
     return TransitionResult(payment_state, sub_iteration.events)
 
 
+@profiling.profiled
 def state_transition(
         payment_state: InitiatorPaymentState,
         state_change: StateChange,
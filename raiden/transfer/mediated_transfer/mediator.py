@@ -2,7 +2,7 @@ import itertools
 import random
 
 from raiden.constants import MAXIMUM_PENDING_TRANSFERS
-from raiden.transfer import channel, secret_registry
+from raiden.transfer import channel, profiling, secret_registry
 from raiden.transfer.architecture import Event, StateChange, TransitionResult
 from raiden.transfer.events import SendProcessed
 from raiden.transfer.mediated_transfer.events import (
@@ -1496,6 +1496,7 @@ def handle_node_change_network_state(
     )
 
 
+@profiling.profiled
 def state_transition(
         mediator_state: MediatorTransferState,
         state_change: StateChange,
@@ -1,6 +1,6 @@
 import random
 
-from raiden.transfer import channel, secret_registry
+from raiden.transfer import channel, profiling, secret_registry
 from raiden.transfer.architecture import Event, StateChange, TransitionResult
 from raiden.transfer.events import EventPaymentReceivedSuccess, SendProcessed
 from raiden.transfer.mediated_transfer.events import (
@@ -337,6 +337,7 @@ def handle_lock_expired(
     return TransitionResult(target_state, result.events)
 
 
+@profiling.profiled
 def state_transition(
         target_state: TargetTransferState,
         state_change: StateChange,
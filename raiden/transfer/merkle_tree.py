@@ -1,3 +1,5 @@
+from bisect import bisect_left
+
 from raiden.exceptions import HashLengthNot32
 from raiden.utils import sha3, split_in_pairs
 
@@ -59,6 +61,90 @@ def compute_layers(elements):
     return tree
 
 
+def _index(leaves, element):
+    """ Position of `element` in the sorted `leaves`, None if it is not one of
+    them.
+    """
+    index = bisect_left(leaves, element)
+
+    if index < len(leaves) and leaves[index] == element:
+        return index
+
+    return None
+
+
+def _update_layers(layers, leaves, first_changed):
+    """ Computes the layers of the merkletree with the new `leaves`, which only
+    differ from the leaves of `layers` from the position `first_changed`.
+
+    The elements of a layer are the hashes of consecutive pairs of the layer
+    below it, so only the hashes right of the changed position are computed,
+    the ones on its left are reused.
+    """
+    tree = [leaves]
+
+    layer = leaves
+    height = 1
+    while len(layer) > 1:
+        first_changed //= 2
+        previous_layer = layers[height] if height < len(layers) else []
+
+        next_layer = previous_layer[:first_changed]
+        for index in range(2 * first_changed, len(layer), 2):
+            pair = layer[index + 1] if index + 1 < len(layer) else None
+            next_layer.append(hash_pair(layer[index], pair))
+
+        tree.append(next_layer)
+        layer = next_layer
+        height += 1
+
+    return tree
+
+
+def compute_layers_with(layers, element):
+    """ Computes the layers of the merkletree with `element` added to the
+    leaves of `layers`, or None if `element` is already a leaf.
+
+    The result is the same as `compute_layers` of the new leaves, but only the
+    hashes which depend on the position of `element` are computed.
+    """
+    if not isinstance(element, bytes):
+        raise ValueError('all elements must be bytes')
+
+    if len(element) != 32:
+        raise HashLengthNot32()
+
+    leaves = layers[LEAVES]
+    index = bisect_left(leaves, element)
+
+    if index < len(leaves) and leaves[index] == element:
+        return None
+
+    new_leaves = list(leaves)
+    new_leaves.insert(index, element)
+
+    return _update_layers(layers, new_leaves, index)
+
+
+def compute_layers_without(layers, element):
+    """ Computes the layers of the merkletree with `element` removed from the
+    leaves of `layers`, or None if `element` is not a leaf.
+
+    If `element` was the only leaf the result has no leaves and no root, see
+    `make_empty_merkle_tree` for the empty tree.
+    """
+    leaves = layers[LEAVES]
+    index = _index(leaves, element)
+
+    if index is None:
+        return None
+
+    new_leaves = list(leaves)
+    del new_leaves[index]
+
+    return _update_layers(layers, new_leaves, index)
+
+
 def compute_merkleproof_for(merkletree, element):
     """ Containment proof for element.
 
@@ -68,7 +154,10 @@ def compute_merkleproof_for(merkletree, element):
     Raises:
         IndexError: If the element is not part of the merkletree.
     """
-    idx = merkletree.layers[LEAVES].index(element)
+    idx = _index(merkletree.layers[LEAVES], element)
+
+    if idx is None:
+        raise IndexError('element is not part of the merkletree')
 
     proof = []
     for layer in merkletree.layers:
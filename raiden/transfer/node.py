@@ -1,5 +1,15 @@
-from raiden.transfer import channel, token_network, views
+import heapq
+
+from raiden.transfer import (
+    block_deadlines,
+    channel,
+    lookup_indexes,
+    profiling,
+    token_network,
+    views,
+)
 from raiden.transfer.architecture import (
+    BalanceProofStateChange,
     ContractReceiveStateChange,
     ContractSendEvent,
     Event,
@@ -28,12 +38,18 @@ from raiden.transfer.mediated_transfer.state_change import (
 )
 from raiden.transfer.queue_identifier import QueueIdentifier
 from raiden.transfer.state import (
+    BalanceProofSignedState,
     ChainState,
+    HashTimeLockState,
     InitiatorTask,
     MediatorTask,
+    MessageQueue,
+    MessageQueuesIndexState,
+    NettingChannelState,
     PaymentNetworkState,
     TargetTask,
     TokenNetworkState,
+    TransferTask,
 )
 from raiden.transfer.state_change import (
     ActionChangeNodeNetworkState,
@@ -60,18 +76,60 @@ from raiden.transfer.state_change import (
 )
 from raiden.utils.typing import (
     MYPY_ANNOTATION,
-    BlockHash,
     BlockNumber,
+    BlockTimeout,
     ChannelID,
+    Dict,
     List,
+    Optional,
     PaymentNetworkID,
     SecretHash,
+    Set,
     TokenAddress,
     TokenNetworkID,
     Tuple,
 )
 
 
+# State changes which modify neither the channels nor the payment tasks
+STATE_CHANGES_WITHOUT_DEADLINES = (
+    ActionInitChain,
+    ActionLeaveAllNetworks,
+    ActionUpdateTransportAuthData,
+    ContractReceiveRouteClosed,
+    ContractReceiveRouteNew,
+    ReceiveDelivered,
+    ReceiveProcessed,
+)
+# State changes dispatched to the payment task of their secrethash
+STATE_CHANGES_FOR_PAYMENT_TASK = (
+    ActionInitInitiator,
+    ActionInitMediator,
+    ActionInitTarget,
+    ContractReceiveSecretReveal,
+    ReceiveLockExpired,
+    ReceiveSecretRequest,
+    ReceiveSecretReveal,
+    ReceiveTransferRefund,
+    ReceiveTransferRefundCancelRoute,
+    ReceiveUnlock,
+)
+# State changes dispatched to the channel of their channel_identifier
+STATE_CHANGES_FOR_CHANNEL = (
+    ActionChannelClose,
+    ContractReceiveChannelClosed,
+    ContractReceiveChannelNew,
+    ContractReceiveChannelNewBalance,
+    ContractReceiveChannelSettled,
+    ContractReceiveUpdateTransfer,
+)
+# Of the above, the ones which do not affect the payment tasks
+STATE_CHANGES_FOR_CHANNEL_ONLY = (
+    ContractReceiveChannelNew,
+    ContractReceiveChannelNewBalance,
+)
+
+
 def get_networks(
         chain_state: ChainState,
         payment_network_identifier: PaymentNetworkID,
@@ -109,41 +167,162 @@ def get_token_network_by_token_address(
     return token_network_state
 
 
-def subdispatch_to_all_channels(
+def subdispatch_to_due_channels(
         chain_state: ChainState,
-        state_change: StateChange,
-        block_number: BlockNumber,
-        block_hash: BlockHash,
+        state_change: Block,
 ) -> TransitionResult[ChainState]:
-    events = list()
+    """ Dispatch the Block to the channels which have a deadline at it and
+    schedule them at their next deadline.
+    """
+    events: List[Event] = list()
+    block_number = chain_state.block_number
+    channel_deadlines = chain_state.channel_deadlines
 
-    for payment_network in chain_state.identifiers_to_paymentnetworks.values():
-        for token_network_state in payment_network.tokenidentifiers_to_tokennetworks.values():
-            for channel_state in token_network_state.channelidentifiers_to_channels.values():
-                result = channel.state_transition(
-                    channel_state=channel_state,
-                    state_change=state_change,
-                    block_number=block_number,
-                    block_hash=block_hash,
-                )
-                events.extend(result.events)
+    for key in block_deadlines.pop_due(channel_deadlines, block_number):
+        token_network_identifier, channel_identifier = key
+        channel_state = views.get_channelstate_by_token_network_identifier(
+            chain_state,
+            token_network_identifier,
+            channel_identifier,
+        )
+
+        if channel_state is None:
+            continue
+
+        result = channel.state_transition(
+            channel_state=channel_state,
+            state_change=state_change,
+            block_number=block_number,
+            block_hash=chain_state.block_hash,
+        )
+        events.extend(result.events)
+
+        deadline: Optional[BlockNumber]
+        if result.events:
+            deadline = BlockNumber(block_number + 1)
+        else:
+            deadline = block_deadlines.get_next_deadline(
+                channel.get_block_deadlines(channel_state),
+                block_number,
+            )
+
+        if deadline is not None:
+            block_deadlines.schedule(channel_deadlines, key, deadline)
 
     return TransitionResult(chain_state, events)
 
 
-def subdispatch_to_all_lockedtransfers(
+def subdispatch_to_due_paymenttasks(
         chain_state: ChainState,
-        state_change: StateChange,
+        state_change: Block,
 ) -> TransitionResult[ChainState]:
-    events = list()
+    """ Dispatch the Block to the payment tasks which have a deadline at it and
+    schedule them at their next deadline.
+    """
+    events: List[Event] = list()
+    block_number = chain_state.block_number
+    payment_task_deadlines = chain_state.payment_task_deadlines
 
-    for secrethash in list(chain_state.payment_mapping.secrethashes_to_task.keys()):
+    for secrethash in block_deadlines.pop_due(payment_task_deadlines, block_number):
         result = subdispatch_to_paymenttask(chain_state, state_change, secrethash)
         events.extend(result.events)
 
+        sub_task = chain_state.payment_mapping.secrethashes_to_task.get(secrethash)
+        if sub_task is None:
+            continue
+
+        deadline: Optional[BlockNumber]
+        if result.events:
+            deadline = BlockNumber(block_number + 1)
+        else:
+            deadline = get_paymenttask_deadline(chain_state, sub_task)
+
+        if deadline is not None:
+            block_deadlines.schedule(payment_task_deadlines, secrethash, deadline)
+
     return TransitionResult(chain_state, events)
 
 
+def get_paymenttask_locks_and_channels(
+        sub_task: TransferTask,
+) -> List[Tuple[HashTimeLockState, ChannelID]]:
+    """ Return the locks of `sub_task` with the identifiers of their channels,
+    these are the channels of its token network which the task uses.
+    """
+    locks_and_channels: List[Tuple[HashTimeLockState, ChannelID]] = list()
+
+    if isinstance(sub_task, InitiatorTask):
+        for initiator_state in sub_task.manager_state.initiator_transfers.values():
+            locks_and_channels.append(
+                (initiator_state.transfer.lock, initiator_state.channel_identifier),
+            )
+
+    elif isinstance(sub_task, MediatorTask):
+        mediator_state = sub_task.mediator_state
+        for pair in mediator_state.transfers_pair:
+            for transfer in (pair.payer_transfer, pair.payee_transfer):
+                locks_and_channels.append(
+                    (transfer.lock, transfer.balance_proof.channel_identifier),
+                )
+
+        if mediator_state.waiting_transfer:
+            transfer = mediator_state.waiting_transfer.transfer
+            locks_and_channels.append(
+                (transfer.lock, transfer.balance_proof.channel_identifier),
+            )
+
+    elif isinstance(sub_task, TargetTask):
+        locks_and_channels.append(
+            (sub_task.target_state.transfer.lock, sub_task.channel_identifier),
+        )
+
+    return locks_and_channels
+
+
+def get_paymenttask_deadline(
+        chain_state: ChainState,
+        sub_task: TransferTask,
+) -> Optional[BlockNumber]:
+    """ Return the next block which may affect the locks of `sub_task`, None
+    if no block can affect them anymore.
+    """
+    locks_and_channels = get_paymenttask_locks_and_channels(sub_task)
+
+    token_network_state = views.get_token_network_by_identifier(
+        chain_state,
+        sub_task.token_network_identifier,
+    )
+    channelidentifiers_to_channels: Dict[ChannelID, NettingChannelState] = dict()
+    if token_network_state:
+        channelidentifiers_to_channels = token_network_state.channelidentifiers_to_channels
+
+    # The unsafe region of a lock depends on the reveal timeout of the channel
+    # which is checked, use the largest one of the task for all its locks.
+    reveal_timeout: Optional[int] = 0
+    for _, channel_identifier in locks_and_channels:
+        channel_state = channelidentifiers_to_channels.get(channel_identifier)
+
+        if channel_state is None:
+            # Without the channel the region starts with the lock
+            reveal_timeout = None
+            break
+
+        reveal_timeout = max(reveal_timeout, channel_state.reveal_timeout)
+
+    lock_deadlines = list()
+    for lock, _ in locks_and_channels:
+        lock_deadline = block_deadlines.get_lock_deadline(
+            lock.expiration,
+            BlockTimeout(lock.expiration if reveal_timeout is None else reveal_timeout),
+            chain_state.block_number,
+        )
+        if lock_deadline is not None:
+            lock_deadlines.append(lock_deadline)
+
+    return block_deadlines.get_next_deadline(lock_deadlines, chain_state.block_number)
+
+
+@profiling.profiled
 def subdispatch_to_paymenttask(
         chain_state: ChainState,
         state_change: StateChange,
@@ -412,44 +591,112 @@ def maybe_add_tokennetwork(
         ids_to_tokens[token_network_identifier] = token_network_state
         addresses_to_ids[token_address] = token_network_identifier
 
+        lookup_indexes.add_token_network(
+            chain_state,
+            payment_network_identifier,
+            token_network_state,
+        )
+
 
 def sanity_check(iteration: TransitionResult[ChainState]):
     assert isinstance(iteration.new_state, ChainState)
 
 
+def get_message_queues_index(chain_state: ChainState) -> MessageQueuesIndexState:
+    index = chain_state.message_queues_index
+
+    if not index.is_complete:
+        index.keys_to_messages = dict()
+        for queueid, queue in chain_state.queueids_to_queues.items():
+            for message in queue:
+                index_queued_message(index, queueid, message)
+        index.is_complete = True
+
+    return index
+
+
+def index_queued_message(
+        index: MessageQueuesIndexState,
+        queueid: QueueIdentifier,
+        message: SendMessageEvent,
+):
+    key = (message.recipient, message.message_identifier)
+    index.keys_to_messages.setdefault(key, []).append((queueid, message))
+
+
+def enqueue_message(chain_state: ChainState, message: SendMessageEvent):
+    queue = chain_state.queueids_to_queues.get(message.queue_identifier)
+    if queue is None:
+        queue = MessageQueue()
+        chain_state.queueids_to_queues[message.queue_identifier] = queue
+
+    queue.append(message)
+
+    # Otherwise the message is indexed with the others once it is built
+    index = chain_state.message_queues_index
+    if index.is_complete:
+        index_queued_message(index, message.queue_identifier, message)
+
+
+def delete_message_queue(chain_state: ChainState, queueid: QueueIdentifier):
+    """ Delete the queue with ID `queueid` and its messages from the index. """
+    queue = chain_state.queueids_to_queues.pop(queueid, None)
+    index = chain_state.message_queues_index
+
+    if not queue or not index.is_complete:
+        return
+
+    for key in {(message.recipient, message.message_identifier) for message in queue}:
+        remaining = [
+            (message_queueid, message)
+            for message_queueid, message in index.keys_to_messages.get(key, ())
+            if message_queueid != queueid
+        ]
+        if remaining:
+            index.keys_to_messages[key] = remaining
+        else:
+            index.keys_to_messages.pop(key, None)
+
+
 def inplace_delete_message_queue(
         chain_state: ChainState,
         state_change: StateChange,
-        queueid: QueueIdentifier,
+        queueid: Optional[QueueIdentifier] = None,
 ):
-    """ Filter messages from queue, if the queue becomes empty, cleanup the queue itself. """
-    queue = chain_state.queueids_to_queues.get(queueid)
-    if not queue:
+    """ Delete the messages acknowledged by `state_change` from the queue with
+    ID `queueid`, or from every queue if it is None. If a queue becomes empty,
+    cleanup the queue itself.
+
+    The acknowledged messages are found through the index instead of scanning
+    the queues, and a `MessageQueue` removes a message in O(1) amortized
+    wherever it is in the queue.
+    """
+    index = get_message_queues_index(chain_state)
+    key = (state_change.sender, state_change.message_identifier)
+    indexed = index.keys_to_messages.get(key)
+
+    if not indexed:
         return
 
-    inplace_delete_message(
-        queue,
-        state_change,
-    )
+    remaining = list()
+    for message_queueid, message in indexed:
+        if queueid is not None and message_queueid != queueid:
+            remaining.append((message_queueid, message))
+            continue
 
-    if len(queue) == 0:
-        del chain_state.queueids_to_queues[queueid]
-    else:
-        chain_state.queueids_to_queues[queueid] = queue
+        queue = chain_state.queueids_to_queues.get(message_queueid)
+        if queue is None:
+            continue
 
+        queue.remove(message)
 
-def inplace_delete_message(
-        message_queue: List[SendMessageEvent],
-        state_change: StateChange,
-):
-    """ Check if the message exists in queue with ID `queueid` and exclude if found."""
-    for message in list(message_queue):
-        message_found = (
-            message.message_identifier == state_change.message_identifier and
-            message.recipient == state_change.sender
-        )
-        if message_found:
-            message_queue.remove(message)
+        if len(queue) == 0:
+            del chain_state.queueids_to_queues[message_queueid]
+
+    if remaining:
+        index.keys_to_messages[key] = remaining
+    else:
+        del index.keys_to_messages[key]
 
 
 def handle_block(
@@ -460,14 +707,15 @@ def handle_block(
     chain_state.block_number = block_number
     chain_state.block_hash = state_change.block_hash
 
+    # The entries which are not in the indexes are due now
+    block_deadlines.schedule_all(chain_state, block_number)
+
     # Subdispatch Block state change
-    channels_result = subdispatch_to_all_channels(
-        chain_state=chain_state,
-        state_change=state_change,
-        block_number=block_number,
-        block_hash=chain_state.block_hash,
+    channels_result = subdispatch_to_due_channels(
+        chain_state,
+        state_change,
     )
-    transfers_result = subdispatch_to_all_lockedtransfers(
+    transfers_result = subdispatch_to_due_paymenttasks(
         chain_state,
         state_change,
     )
@@ -508,6 +756,8 @@ def handle_token_network_action(
 
     events: List[Event] = list()
     if token_network_state:
+        channels_count = len(token_network_state.channelidentifiers_to_channels)
+
         pseudo_random_generator = chain_state.pseudo_random_generator
         iteration = token_network.state_transition(
             payment_network_identifier=PaymentNetworkID(payment_network_id),
@@ -519,6 +769,10 @@ def handle_token_network_action(
         )
         assert iteration.new_state, 'No token network state transition leads to None'
 
+        # A channel was either opened or removed
+        if len(token_network_state.channelidentifiers_to_channels) != channels_count:
+            lookup_indexes.update_token_network_partners(chain_state, token_network_state)
+
         events = iteration.events
 
     return TransitionResult(chain_state, events)
@@ -539,8 +793,7 @@ def handle_contract_receive_channel_closed(
             recipient=channel_state.partner_state.address,
             channel_identifier=state_change.channel_identifier,
         )
-        if queue_id in chain_state.queueids_to_queues:
-            chain_state.queueids_to_queues.pop(queue_id)
+        delete_message_queue(chain_state, queue_id)
 
     return handle_token_network_action(chain_state=chain_state, state_change=state_change)
 
@@ -616,6 +869,14 @@ def handle_new_payment_network(
     if payment_network_identifier not in chain_state.identifiers_to_paymentnetworks:
         chain_state.identifiers_to_paymentnetworks[payment_network_identifier] = payment_network
 
+        token_networks = payment_network.tokenidentifiers_to_tokennetworks
+        for token_network_state in token_networks.values():
+            lookup_indexes.add_token_network(
+                chain_state,
+                PaymentNetworkID(payment_network_identifier),
+                token_network_state,
+            )
+
     return TransitionResult(chain_state, events)
 
 
@@ -751,8 +1012,7 @@ def handle_processed(
 ) -> TransitionResult[ChainState]:
     events: List[Event] = list()
     # Clean up message queue
-    for queueid in list(chain_state.queueids_to_queues.keys()):
-        inplace_delete_message_queue(chain_state, state_change, queueid)
+    inplace_delete_message_queue(chain_state, state_change)
 
     return TransitionResult(chain_state, events)
 
@@ -1185,36 +1445,349 @@ def is_transaction_pending(chain_state, transaction, state_change):
     )
 
 
+def get_transaction_key(transaction: ContractSendEvent) -> Tuple:
+    """ Key of `transaction` in the pending transactions index.
+
+    The contract state changes which may satisfy or invalidate the transaction
+    have the same key, see `get_state_change_keys`.
+    """
+    if isinstance(transaction, ContractSendChannelUpdateTransfer):
+        return (
+            ContractSendChannelUpdateTransfer,
+            transaction.token_network_identifier,
+            transaction.channel_identifier,
+        )
+    if isinstance(transaction, ContractSendChannelClose):
+        return (
+            ContractSendChannelClose,
+            transaction.token_network_identifier,
+            transaction.channel_identifier,
+        )
+    if isinstance(transaction, ContractSendChannelSettle):
+        return (
+            ContractSendChannelSettle,
+            transaction.token_network_identifier,
+            transaction.channel_identifier,
+        )
+    if isinstance(transaction, ContractSendSecretReveal):
+        return (ContractSendSecretReveal, transaction.secret)
+    if isinstance(transaction, ContractSendChannelBatchUnlock):
+        return (ContractSendChannelBatchUnlock, transaction.token_network_identifier)
+
+    return (type(transaction), )
+
+
+def get_state_change_keys(state_change: ContractReceiveStateChange) -> List[Tuple]:
+    """ Keys of the pending transactions which `state_change` may satisfy or
+    invalidate, see `is_transaction_effect_satisfied` and
+    `is_transaction_invalidated`.
+    """
+    if isinstance(state_change, ContractReceiveUpdateTransfer):
+        return [(
+            ContractSendChannelUpdateTransfer,
+            state_change.token_network_identifier,
+            state_change.channel_identifier,
+        )]
+    if isinstance(state_change, ContractReceiveChannelClosed):
+        return [(
+            ContractSendChannelClose,
+            state_change.token_network_identifier,
+            state_change.channel_identifier,
+        )]
+    if isinstance(state_change, ContractReceiveChannelSettled):
+        return [
+            (
+                ContractSendChannelSettle,
+                state_change.token_network_identifier,
+                state_change.channel_identifier,
+            ),
+            (
+                ContractSendChannelUpdateTransfer,
+                state_change.token_network_identifier,
+                state_change.channel_identifier,
+            ),
+        ]
+    if isinstance(state_change, ContractReceiveSecretReveal):
+        return [(ContractSendSecretReveal, state_change.secret)]
+    if isinstance(state_change, ContractReceiveChannelBatchUnlock):
+        return [(ContractSendChannelBatchUnlock, state_change.token_network_identifier)]
+
+    return list()
+
+
+def index_pending_transaction(chain_state: ChainState, transaction: ContractSendEvent) -> None:
+    index = chain_state.pending_transactions_index
+
+    key = get_transaction_key(transaction)
+    index.keys_to_transactions.setdefault(key, []).append(transaction)
+
+    expirable = (ContractSendChannelUpdateTransfer, ContractSendSecretReveal)
+    if isinstance(transaction, expirable):
+        index.sequence += 1
+        heapq.heappush(
+            index.expirations,
+            (transaction.expiration, index.sequence, transaction),
+        )
+
+
+def add_pending_transaction(chain_state: ChainState, transaction: ContractSendEvent) -> None:
+    chain_state.pending_transactions.append(transaction)
+
+    # Otherwise the transaction is indexed with the others once it is built
+    if chain_state.pending_transactions_index.is_complete:
+        index_pending_transaction(chain_state, transaction)
+
+
+def clear_pending_transactions(
+        chain_state: ChainState,
+        state_change: ContractReceiveStateChange,
+) -> None:
+    """ Remove the transactions which are satisfied or invalidated by
+    `state_change` and the expired ones.
+
+    Only the transactions indexed by the keys of `state_change` and the
+    expirations which passed are checked.
+    """
+    index = chain_state.pending_transactions_index
+
+    if not index.is_complete:
+        index.keys_to_transactions = dict()
+        index.expirations = list()
+        for transaction in chain_state.pending_transactions:
+            index_pending_transaction(chain_state, transaction)
+        index.is_complete = True
+
+    cleared: List[ContractSendEvent] = list()
+    for key in get_state_change_keys(state_change):
+        for transaction in index.keys_to_transactions.get(key, ()):
+            if not is_transaction_pending(chain_state, transaction, state_change):
+                cleared.append(transaction)
+
+    expirations = index.expirations
+    while expirations and is_transaction_expired(expirations[0][2], chain_state.block_number):
+        _, _, transaction = heapq.heappop(expirations)
+        cleared.append(transaction)
+
+    if not cleared:
+        return
+
+    cleared_ids = {id(transaction) for transaction in cleared}
+
+    for key in {get_transaction_key(transaction) for transaction in cleared}:
+        transactions = [
+            transaction
+            for transaction in index.keys_to_transactions.get(key, ())
+            if id(transaction) not in cleared_ids
+        ]
+        if transactions:
+            index.keys_to_transactions[key] = transactions
+        else:
+            index.keys_to_transactions.pop(key, None)
+
+    chain_state.pending_transactions = [
+        transaction
+        for transaction in chain_state.pending_transactions
+        if id(transaction) not in cleared_ids
+    ]
+
+
 def update_queues(iteration: TransitionResult[ChainState], state_change: StateChange) -> None:
     chain_state = iteration.new_state
     assert chain_state is not None, 'chain_state must be set'
 
     if isinstance(state_change, ContractReceiveStateChange):
-        pending_transactions = [
-            transaction
-            for transaction in chain_state.pending_transactions
-            if is_transaction_pending(chain_state, transaction, state_change)
-        ]
-        chain_state.pending_transactions = pending_transactions
+        clear_pending_transactions(chain_state, state_change)
 
     for event in iteration.events:
         if isinstance(event, SendMessageEvent):
-            queue = chain_state.queueids_to_queues.setdefault(event.queue_identifier, [])
-            queue.append(event)
+            enqueue_message(chain_state, event)
 
         if isinstance(event, ContractSendEvent):
-            chain_state.pending_transactions.append(event)
+            add_pending_transaction(chain_state, event)
 
 
+def update_block_deadlines(
+        iteration: TransitionResult[ChainState],
+        state_change: StateChange,
+) -> None:
+    """ Make the channels and the payment tasks which `state_change` may have
+    modified due at the next block.
+    """
+    # pylint: disable=unidiomatic-typecheck
+    chain_state = iteration.new_state
+    assert chain_state is not None, 'chain_state must be set'
+
+    if type(state_change) in STATE_CHANGES_WITHOUT_DEADLINES:
+        return
+
+    next_block = BlockNumber(chain_state.block_number + 1)
+    channel_deadlines = chain_state.channel_deadlines
+    payment_task_deadlines = chain_state.payment_task_deadlines
+    secrethashes_to_task = chain_state.payment_mapping.secrethashes_to_task
+
+    if type(state_change) in STATE_CHANGES_FOR_PAYMENT_TASK:
+        secrethash = get_secrethash_of_state_change(state_change)
+        block_deadlines.schedule(payment_task_deadlines, secrethash, next_block)
+
+    elif type(state_change) in STATE_CHANGES_FOR_CHANNEL:
+        block_deadlines.schedule(
+            channel_deadlines,
+            (state_change.token_network_identifier, state_change.channel_identifier),
+            next_block,
+        )
+
+        # The payment tasks check the status and the locks of their channels
+        if type(state_change) not in STATE_CHANGES_FOR_CHANNEL_ONLY:
+            for secrethash, sub_task in secrethashes_to_task.items():
+                if sub_task.token_network_identifier == state_change.token_network_identifier:
+                    block_deadlines.schedule(payment_task_deadlines, secrethash, next_block)
+
+    elif type(state_change) == ContractReceiveChannelBatchUnlock:
+        for secrethash, sub_task in secrethashes_to_task.items():
+            if sub_task.token_network_identifier == state_change.token_network_identifier:
+                block_deadlines.schedule(payment_task_deadlines, secrethash, next_block)
+
+    elif type(state_change) == ActionChangeNodeNetworkState:
+        for secrethash in secrethashes_to_task:
+            block_deadlines.schedule(payment_task_deadlines, secrethash, next_block)
+
+    elif type(state_change) in (ActionNewTokenNetwork, ContractReceiveNewTokenNetwork):
+        schedule_token_network_channels(chain_state, state_change.token_network)
+
+    elif type(state_change) == ContractReceiveNewPaymentNetwork:
+        token_networks = state_change.payment_network.tokenidentifiers_to_tokennetworks
+        for token_network_state in token_networks.values():
+            schedule_token_network_channels(chain_state, token_network_state)
+
+    else:
+        # Unknown effect, every entry is due
+        channel_deadlines.all_due = True
+        payment_task_deadlines.all_due = True
+
+
+def schedule_token_network_channels(
+        chain_state: ChainState,
+        token_network_state: TokenNetworkState,
+) -> None:
+    next_block = BlockNumber(chain_state.block_number + 1)
+
+    for channel_identifier in token_network_state.channelidentifiers_to_channels:
+        block_deadlines.schedule(
+            chain_state.channel_deadlines,
+            (token_network_state.address, channel_identifier),
+            next_block,
+        )
+
+
+def get_secrethash_of_state_change(state_change: StateChange) -> SecretHash:
+    # pylint: disable=unidiomatic-typecheck
+    if type(state_change) == ActionInitInitiator:
+        return state_change.transfer.secrethash
+    if type(state_change) == ActionInitMediator:
+        return state_change.from_transfer.lock.secrethash
+    if type(state_change) in (
+            ActionInitTarget,
+            ReceiveTransferRefund,
+            ReceiveTransferRefundCancelRoute,
+    ):
+        return state_change.transfer.lock.secrethash
+    return state_change.secrethash
+
+
+def get_partner_balance_proof(
+        chain_state: Optional[ChainState],
+        state_change: StateChange,
+) -> Optional[BalanceProofSignedState]:
+    """ Return the partner's balance proof of the channel to which the balance
+    proof of `state_change` belongs.
+
+    Only the state changes with a balance proof update the balance proofs of
+    the partners, and only in the channel of their balance proof.
+    """
+    if chain_state is None or not isinstance(state_change, BalanceProofStateChange):
+        return None
+
+    channel_state = views.get_channelstate_by_token_network_identifier(
+        chain_state,
+        state_change.balance_proof.token_network_identifier,
+        state_change.balance_proof.channel_identifier,
+    )
+
+    if channel_state is None:
+        return None
+
+    balance_proof = channel_state.partner_state.balance_proof
+    if not isinstance(balance_proof, BalanceProofSignedState):
+        return None
+
+    return balance_proof
+
+
+def update_balance_proofs(
+        iteration: TransitionResult[ChainState],
+        state_change: StateChange,
+        old_balance_proof: Optional[BalanceProofSignedState],
+) -> None:
+    chain_state = iteration.new_state
+    assert chain_state is not None, 'chain_state must be set'
+
+    chain_state.updated_balance_proofs = list()
+
+    new_balance_proof = get_partner_balance_proof(chain_state, state_change)
+    if new_balance_proof is not None and new_balance_proof != old_balance_proof:
+        chain_state.updated_balance_proofs.append(new_balance_proof)
+
+
+def get_updated_balance_proofs(
+        old_state: Optional[ChainState],
+        new_state: ChainState,
+        state_changes: List[StateChange],
+) -> List[BalanceProofSignedState]:
+    """ Return the balance proofs received by the `state_changes`, which were
+    applied to `old_state` and led to `new_state`.
+
+    `ChainState.updated_balance_proofs` only has the balance proofs of the
+    last state change. For each channel only the latest balance proof is
+    returned, the ones it replaced are outdated.
+    """
+    balance_proofs: List[BalanceProofSignedState] = list()
+    channels: Set[Tuple[TokenNetworkID, ChannelID]] = set()
+
+    for state_change in state_changes:
+        if not isinstance(state_change, BalanceProofStateChange):
+            continue
+
+        channel = (
+            state_change.balance_proof.token_network_identifier,
+            state_change.balance_proof.channel_identifier,
+        )
+        if channel in channels:
+            continue
+        channels.add(channel)
+
+        new_balance_proof = get_partner_balance_proof(new_state, state_change)
+        old_balance_proof = get_partner_balance_proof(old_state, state_change)
+        if new_balance_proof is not None and new_balance_proof != old_balance_proof:
+            balance_proofs.append(new_balance_proof)
+
+    return balance_proofs
+
+
+@profiling.profiled
 def state_transition(
         chain_state: ChainState,
         state_change: StateChange,
 ) -> TransitionResult[ChainState]:
     # pylint: disable=too-many-branches,unidiomatic-typecheck
 
+    old_balance_proof = get_partner_balance_proof(chain_state, state_change)
+
     iteration = handle_state_change(chain_state, state_change)
 
     update_queues(iteration, state_change)
+    update_balance_proofs(iteration, state_change, old_balance_proof)
+    if type(state_change) != Block:
+        update_block_deadlines(iteration, state_change)
     sanity_check(iteration)
 
     return iteration
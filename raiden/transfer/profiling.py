@@ -0,0 +1,145 @@
+""" Opt-in profiling of the state transitions.
+
+The state transition functions decorated with `profiled` record, per state
+change class, the number of calls, the wall time, the allocated bytes and the
+number of events emitted. The profiling is disabled by default, the decorated
+functions then only check a flag before calling the state transition.
+
+The measures are inclusive, e.g. the time of `node.state_transition` includes
+the time of the payment tasks and channels it dispatches the state change to.
+The allocated bytes are the ones allocated by the transition and not yet
+freed once it returns, as traced by `tracemalloc`, which is started while the
+profiling is enabled.
+"""
+import functools
+import json
+import time
+import tracemalloc
+
+from raiden.utils.typing import Any, Callable, Dict, Tuple
+
+
+class TransitionStats:
+    """ The measures of a state transition function for one class of state
+    changes.
+    """
+
+    __slots__ = (
+        'count',
+        'duration',
+        'allocated_bytes',
+        'events',
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.allocated_bytes = 0
+        self.events = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'duration': self.duration,
+            'allocated_bytes': self.allocated_bytes,
+            'events': self.events,
+        }
+
+
+# The stats by (function name, state change class name)
+_stats: Dict[Tuple[str, str], TransitionStats] = dict()
+_enabled = False
+# Set if tracemalloc was started by `enable`, and must be stopped by `disable`
+_started_tracemalloc = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable():
+    """ Start recording the measures of the profiled state transitions. """
+    global _enabled, _started_tracemalloc  # pylint: disable=global-statement
+
+    if _enabled:
+        return
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+
+    _enabled = True
+
+
+def disable():
+    """ Stop recording the measures, the ones already recorded are kept. """
+    global _enabled, _started_tracemalloc  # pylint: disable=global-statement
+
+    _enabled = False
+
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+
+def reset():
+    _stats.clear()
+
+
+def get_stats() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """ Return the measures by state transition function and by state change
+    class.
+    """
+    result: Dict[str, Dict[str, Dict[str, Any]]] = dict()
+
+    for (function_name, state_change_name), stats in sorted(_stats.items()):
+        result.setdefault(function_name, dict())[state_change_name] = stats.to_dict()
+
+    return result
+
+
+def dump_stats(path: str):
+    """ Write the measures to the file at `path`, as JSON. """
+    with open(path, 'w') as stats_file:
+        json.dump(get_stats(), stats_file, indent=2, sort_keys=True)
+
+
+def profiled(state_transition: Callable) -> Callable:
+    """ Record the measures of `state_transition` while the profiling is
+    enabled.
+
+    The state change must be the second argument of `state_transition`,
+    either positional or by the `state_change` keyword, and the result must
+    be a `TransitionResult`.
+    """
+    function_name = f'{state_transition.__module__}.{state_transition.__qualname__}'
+
+    @functools.wraps(state_transition)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return state_transition(*args, **kwargs)
+
+        state_change = kwargs['state_change'] if 'state_change' in kwargs else args[1]
+
+        memory_before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+
+        iteration = state_transition(*args, **kwargs)
+
+        duration = time.perf_counter() - start
+        memory_after, _ = tracemalloc.get_traced_memory()
+
+        key = (function_name, type(state_change).__name__)
+        stats = _stats.get(key)
+        if stats is None:
+            stats = TransitionStats()
+            _stats[key] = stats
+
+        stats.count += 1
+        stats.duration += duration
+        stats.allocated_bytes += memory_after - memory_before
+        stats.events += len(iteration.events)
+
+        return iteration
+
+    return wrapper
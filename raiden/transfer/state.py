@@ -9,7 +9,7 @@ from eth_utils import encode_hex, to_canonical_address, to_checksum_address
 from raiden.constants import EMPTY_MERKLE_ROOT, UINT64_MAX, UINT256_MAX
 from raiden.encoding import messages
 from raiden.encoding.format import buffer_for
-from raiden.transfer.architecture import SendMessageEvent, State
+from raiden.transfer.architecture import ContractSendEvent, SendMessageEvent, State
 from raiden.transfer.merkle_tree import merkleroot
 from raiden.transfer.queue_identifier import QueueIdentifier
 from raiden.transfer.utils import hash_balance_data, pseudo_random_generator_from_json
@@ -28,15 +28,19 @@ from raiden.utils.typing import (
     ChainID,
     ChannelID,
     Dict,
+    Iterable,
+    Iterator,
     Keccak256,
     List,
     LockHash,
     Locksroot,
+    MessageID,
     Nonce,
     Optional,
     PaymentNetworkID,
     Secret,
     SecretHash,
+    Set,
     Signature,
     T_Address,
     T_BlockHash,
@@ -50,12 +54,13 @@ from raiden.utils.typing import (
     TokenAddress,
     TokenAmount,
     TokenNetworkID,
+    Tuple,
     Union,
 )
 
 SecretHashToLock = Dict[SecretHash, 'HashTimeLockState']
 SecretHashToPartialUnlockProof = Dict[SecretHash, 'UnlockPartialProofState']
-QueueIdsToQueues = Dict[QueueIdentifier, List[SendMessageEvent]]
+QueueIdsToQueues = Dict[QueueIdentifier, 'MessageQueue']
 OptionalBalanceProofState = Optional[Union[
     'BalanceProofSignedState',
     'BalanceProofUnsignedState',
@@ -268,6 +273,231 @@ class TargetTask(TransferTask):
         return restored
 
 
+class BlockDeadlinesState(State):
+    """ Index of entries of the chain state by the block at which they have to
+    be visited, see `raiden.transfer.block_deadlines`.
+
+    The index is derived from the rest of the chain state, it is neither
+    serialized nor compared.
+    """
+
+    __slots__ = (
+        'heap',
+        'keys_to_deadlines',
+        'all_due',
+    )
+
+    def __init__(self):
+        #: Heap of (deadline, key) tuples, entries which were rescheduled
+        #: earlier are left in the heap and skipped when popped.
+        self.heap: List[Tuple[BlockNumber, Any]] = list()
+        self.keys_to_deadlines: Dict[Any, BlockNumber] = dict()
+        #: Set for the new and the restored states, the entries which were not
+        #: added by a state transition are not in the index, so every entry is
+        #: due at the next block.
+        self.all_due = True
+
+    def __repr__(self):
+        return '<BlockDeadlinesState entries:{} all_due:{}>'.format(
+            len(self.keys_to_deadlines),
+            self.all_due,
+        )
+
+
+class PendingTransactionsIndexState(State):
+    """ Index of the pending transactions of the chain state by the contract
+    state changes which may clear them and by expiration.
+
+    The index is derived from `ChainState.pending_transactions`, it is neither
+    serialized nor compared.
+    """
+
+    __slots__ = (
+        'keys_to_transactions',
+        'expirations',
+        'sequence',
+        'is_complete',
+    )
+
+    def __init__(self):
+        self.keys_to_transactions: Dict[Tuple, List[ContractSendEvent]] = dict()
+        #: Heap of (expiration, sequence, transaction) tuples for the
+        #: expirable transactions, the unique sequence number keeps the
+        #: transactions from being compared. The cleared transactions are left
+        #: in the heap and skipped when popped.
+        self.expirations: List[Tuple[BlockExpiration, int, ContractSendEvent]] = list()
+        self.sequence = 0
+        #: Unset for the new and the restored states, the index is built from
+        #: the pending transactions when first used.
+        self.is_complete = False
+
+    def __repr__(self):
+        return '<PendingTransactionsIndexState keys:{} is_complete:{}>'.format(
+            len(self.keys_to_transactions),
+            self.is_complete,
+        )
+
+
+class MessageQueue(State):
+    """ FIFO queue of the messages sent to a recipient.
+
+    The positions of the messages are indexed by their identifiers, a removed
+    message is replaced by a tombstone so the positions of the others are
+    kept, which makes the removal O(1) amortized. The entries are compacted
+    once half of them are tombstones.
+
+    The queue compares equal to the list of its messages, and it is
+    serialized as one.
+    """
+
+    __slots__ = (
+        'entries',
+        'identifiers_to_positions',
+        'size',
+    )
+
+    def __init__(self, messages: Iterable[SendMessageEvent] = ()):
+        self.entries: List[Optional[SendMessageEvent]] = list()
+        self.identifiers_to_positions: Dict[MessageID, List[int]] = dict()
+        self.size = 0
+
+        for message in messages:
+            self.append(message)
+
+    def __repr__(self):
+        return '<MessageQueue messages:{}>'.format(self.size)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self) -> Iterator[SendMessageEvent]:
+        for message in self.entries:
+            if message is not None:
+                yield message
+
+    def __eq__(self, other):
+        if isinstance(other, MessageQueue):
+            return list(self) == list(other)
+        if isinstance(other, list):
+            return list(self) == other
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def append(self, message: SendMessageEvent):
+        positions = self.identifiers_to_positions.setdefault(message.message_identifier, [])
+        positions.append(len(self.entries))
+        self.entries.append(message)
+        self.size += 1
+
+    def remove(self, message: SendMessageEvent):
+        """ Remove the first message equal to `message`, like `list.remove`. """
+        positions = self.identifiers_to_positions.get(message.message_identifier, [])
+
+        # The identifiers are random, there is usually a single position
+        position = next(
+            (position for position in positions if self.entries[position] == message),
+            None,
+        )
+        if position is None:
+            raise ValueError('MessageQueue.remove(message): message not in queue')
+
+        positions.remove(position)
+        if not positions:
+            del self.identifiers_to_positions[message.message_identifier]
+
+        self.entries[position] = None
+        self.size -= 1
+
+        if 2 * self.size <= len(self.entries):
+            self.compact()
+
+    def copy(self) -> 'MessageQueue':
+        """ Return a copy of the queue which shares the messages. """
+        copy = MessageQueue()
+        copy.entries = list(self.entries)
+        copy.identifiers_to_positions = {
+            message_identifier: list(positions)
+            for message_identifier, positions in self.identifiers_to_positions.items()
+        }
+        copy.size = self.size
+        return copy
+
+    def compact(self):
+        """ Drop the tombstones, the positions are reindexed. """
+        messages = list(self)
+        self.entries = list()
+        self.identifiers_to_positions = dict()
+        self.size = 0
+
+        for message in messages:
+            self.append(message)
+
+
+class MessageQueuesIndexState(State):
+    """ Index of the messages of `ChainState.queueids_to_queues` by their
+    recipient and message identifier, which are the ones acknowledged by a
+    Delivered or a Processed.
+
+    The index is derived from the queues, it is neither serialized nor
+    compared.
+    """
+
+    __slots__ = (
+        'keys_to_messages',
+        'is_complete',
+    )
+
+    def __init__(self):
+        self.keys_to_messages: Dict[
+            Tuple[Address, MessageID],
+            List[Tuple[QueueIdentifier, SendMessageEvent]],
+        ] = dict()
+        #: Unset for the new and the restored states, the index is built from
+        #: the queues when first used.
+        self.is_complete = False
+
+    def __repr__(self):
+        return '<MessageQueuesIndexState keys:{} is_complete:{}>'.format(
+            len(self.keys_to_messages),
+            self.is_complete,
+        )
+
+
+class LookupIndexesState(State):
+    """ Indexes of the token networks by identifier and of the partners by the
+    token networks in which they have a channel with this node, used by the
+    views which would otherwise walk every payment and token network.
+
+    The indexes are derived from `ChainState.identifiers_to_paymentnetworks`,
+    they are neither serialized nor compared.
+    """
+
+    __slots__ = (
+        'tokennetworkids_to_paymentnetworkids',
+        'partneraddresses_to_tokennetworkids',
+        'is_complete',
+    )
+
+    def __init__(self):
+        self.tokennetworkids_to_paymentnetworkids: Dict[
+            TokenNetworkID,
+            PaymentNetworkID,
+        ] = dict()
+        self.partneraddresses_to_tokennetworkids: Dict[Address, Set[TokenNetworkID]] = dict()
+        #: Unset for the new and the restored states, the indexes are built
+        #: from the payment networks when first used.
+        self.is_complete = False
+
+    def __repr__(self):
+        return '<LookupIndexesState token_networks:{} partners:{} is_complete:{}>'.format(
+            len(self.tokennetworkids_to_paymentnetworkids),
+            len(self.partneraddresses_to_tokennetworkids),
+            self.is_complete,
+        )
+
+
 class ChainState(State):
     """ Umbrella object that stores the per blockchain state.
     For each registry smart contract there must be a payment network. Within the
@@ -288,6 +518,12 @@ class ChainState(State):
         'pseudo_random_generator',
         'queueids_to_queues',
         'last_transport_authdata',
+        'channel_deadlines',
+        'payment_task_deadlines',
+        'updated_balance_proofs',
+        'pending_transactions_index',
+        'message_queues_index',
+        'lookup_indexes',
     )
 
     def __init__(
@@ -314,10 +550,20 @@ class ChainState(State):
         self.nodeaddresses_to_networkstates = dict()
         self.our_address = our_address
         self.payment_mapping = PaymentMappingState()
-        self.pending_transactions = list()
+        self.pending_transactions: List[ContractSendEvent] = list()
+        self.pending_transactions_index = PendingTransactionsIndexState()
         self.pseudo_random_generator = pseudo_random_generator
         self.queueids_to_queues: QueueIdsToQueues = dict()
+        self.message_queues_index = MessageQueuesIndexState()
+        self.lookup_indexes = LookupIndexesState()
         self.last_transport_authdata: Optional[str] = None
+        #: Derived indexes of the channels and the payment tasks by the next
+        #: block which may affect them.
+        self.channel_deadlines = BlockDeadlinesState()
+        self.payment_task_deadlines = BlockDeadlinesState()
+        #: The balance proofs received from the partners by the last state
+        #: transition, derived and neither serialized nor compared.
+        self.updated_balance_proofs: List[BalanceProofSignedState] = list()
 
     def __repr__(self):
         return (
@@ -399,9 +645,12 @@ class ChainState(State):
         )
         restored.payment_mapping = data['payment_mapping']
         restored.pending_transactions = data['pending_transactions']
-        restored.queueids_to_queues = serialization.deserialize_queueid_to_queue(
-            data['queueids_to_queues'],
-        )
+        restored.queueids_to_queues = {
+            queueid: MessageQueue(queue)
+            for queueid, queue in serialization.deserialize_queueid_to_queue(
+                data['queueids_to_queues'],
+            ).items()
+        }
         restored.last_transport_authdata = data.get('last_transport_authdata')
 
         return restored
@@ -1388,6 +1637,7 @@ class NettingChannelEndState(State):
         'secrethashes_to_onchain_unlockedlocks',
         'merkletree',
         'balance_proof',
+        'amount_locked',
     )
 
     def __init__(self, address: Address, balance: Balance):
@@ -1412,6 +1662,9 @@ class NettingChannelEndState(State):
         self.secrethashes_to_onchain_unlockedlocks: SecretHashToPartialUnlockProof = dict()
         self.merkletree = make_empty_merkle_tree()
         self.balance_proof: OptionalBalanceProofState = None
+        #: Sum of the amounts of the locks in the three dictionaries above,
+        #: updated by the functions of `channel` which add and remove them.
+        self.amount_locked = TokenAmount(0)
 
     def __repr__(self):
         return '<NettingChannelEndState address:{} contract_balance:{} merkletree:{}>'.format(
@@ -1485,6 +1738,17 @@ class NettingChannelEndState(State):
             serialization.identity,
             data['secrethashes_to_onchain_unlockedlocks'],
         )
+        restored.amount_locked = TokenAmount(
+            sum(lock.amount for lock in restored.secrethashes_to_lockedlocks.values()) +
+            sum(
+                unlock.lock.amount
+                for unlock in restored.secrethashes_to_unlockedlocks.values()
+            ) +
+            sum(
+                unlock.lock.amount
+                for unlock in restored.secrethashes_to_onchain_unlockedlocks.values()
+            ),
+        )
         restored.merkletree = data['merkletree']
 
         balance_proof = data.get('balance_proof')
@@ -1,5 +1,6 @@
 from raiden.transfer import channel
 from raiden.transfer.architecture import ContractSendEvent, State
+from raiden.transfer.lookup_indexes import get_lookup_indexes, get_payment_network_identifier
 from raiden.transfer.state import (
     CHANNEL_STATE_CLOSED,
     CHANNEL_STATE_CLOSING,
@@ -43,15 +44,8 @@ def all_neighbour_nodes(chain_state: ChainState) -> Set[Address]:
     """ Return the identifiers for all nodes accross all payment networks which
     have a channel open with this one.
     """
-    addresses = set()
-
-    for payment_network in chain_state.identifiers_to_paymentnetworks.values():
-        for token_network in payment_network.tokenidentifiers_to_tokennetworks.values():
-            channel_states = token_network.channelidentifiers_to_channels.values()
-            for channel_state in channel_states:
-                addresses.add(channel_state.partner_state.address)
-
-    return addresses
+    lookup_indexes = get_lookup_indexes(chain_state)
+    return set(lookup_indexes.partneraddresses_to_tokennetworkids)
 
 
 def block_number(chain_state: ChainState) -> BlockNumber:
@@ -155,11 +149,12 @@ def get_payment_network_identifiers(
 
 def get_token_network_registry_by_token_network_identifier(
         chain_state: ChainState,
-        token_network_identifier: Address,
+        token_network_identifier: TokenNetworkID,
 ) -> Optional[PaymentNetworkState]:
-    for payment_network in chain_state.identifiers_to_paymentnetworks.values():
-        if token_network_identifier in payment_network.tokenidentifiers_to_tokennetworks:
-            return payment_network
+    payment_network_id = get_payment_network_identifier(chain_state, token_network_identifier)
+
+    if payment_network_id is not None:
+        return chain_state.identifiers_to_paymentnetworks.get(payment_network_id)
 
     return None
 
@@ -254,13 +249,16 @@ def get_token_network_by_identifier(
         token_network_id: TokenNetworkID,
 ) -> Optional[TokenNetworkState]:
 
+    payment_network_state = get_token_network_registry_by_token_network_identifier(
+        chain_state,
+        token_network_id,
+    )
+
     token_network_state = None
-    for payment_network_state in chain_state.identifiers_to_paymentnetworks.values():
+    if payment_network_state is not None:
         token_network_state = payment_network_state.tokenidentifiers_to_tokennetworks.get(
             token_network_id,
         )
-        if token_network_state:
-            return token_network_state
 
     return token_network_state
 
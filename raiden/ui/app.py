@@ -195,9 +195,20 @@ def run_app(
         network_id,
         environment_type,
         unrecoverable_error_should_crash,
+        profile_state_transitions,
         pathfinding_service_address,
         pathfinding_max_paths,
         enable_monitoring,
+        storage_group_commit,
+        storage_serializer,
+        storage_compression,
+        storage_compress_state_changes,
+        storage_replay_workers,
+        storage_read_connections,
+        storage_io_thread,
+        storage_state_cache,
+        storage_copy_on_write,
+        storage_compaction_retained_snapshots,
         config=None,
         extra_config=None,
         **kwargs,
@@ -238,9 +249,20 @@ def run_app(
     timeout = max_unresponsive_time / DEFAULT_NAT_KEEPALIVE_RETRIES
     config['transport']['udp']['nat_keepalive_timeout'] = timeout
     config['unrecoverable_error_should_crash'] = unrecoverable_error_should_crash
+    config['profile_state_transitions'] = profile_state_transitions
     config['services']['pathfinding_service_address'] = pathfinding_service_address
     config['services']['pathfinding_max_paths'] = pathfinding_max_paths
     config['services']['monitoring_enabled'] = enable_monitoring
+    config['storage']['group_commit'] = storage_group_commit
+    config['storage']['serializer'] = storage_serializer
+    config['storage']['compression'] = storage_compression
+    config['storage']['compress_state_changes'] = storage_compress_state_changes
+    config['storage']['replay_decode_workers'] = storage_replay_workers
+    config['storage']['read_connections'] = storage_read_connections
+    config['storage']['io_thread'] = storage_io_thread
+    config['storage']['state_cache'] = storage_state_cache
+    config['storage']['copy_on_write'] = storage_copy_on_write
+    config['storage']['compaction_retained_snapshots'] = storage_compaction_retained_snapshots
 
     parsed_eth_rpc_endpoint = urlparse(eth_rpc_endpoint)
     if not parsed_eth_rpc_endpoint.scheme:
@@ -248,6 +248,101 @@ def options(func):
                 is_flag=True,
             ),
         ),
+        option_group(
+            'Storage Options',
+            option(
+                '--storage-group-commit',
+                help=(
+                    'Commit the state changes received concurrently in a single '
+                    'database transaction. Improves the throughput under load.'
+                ),
+                is_flag=True,
+            ),
+            option(
+                '--storage-serializer',
+                help=(
+                    'Format of the data written to the database. The existing data is '
+                    'converted on startup when the format is changed.'
+                ),
+                type=click.Choice(['json', 'binary']),
+                default='json',
+                show_default=True,
+            ),
+            option(
+                '--storage-compression',
+                help=(
+                    'Compress the snapshots written to the database. The existing '
+                    'data can be read regardless of this setting.'
+                ),
+                type=click.Choice(['zlib']),
+                default=None,
+            ),
+            option(
+                '--storage-compress-state-changes',
+                help=(
+                    'Also compress the state changes and events, requires '
+                    '--storage-compression.'
+                ),
+                is_flag=True,
+            ),
+            option(
+                '--storage-replay-workers',
+                help=(
+                    'Number of processes used to decode the state changes replayed on '
+                    'startup. The state changes are decoded by the main process if 0.'
+                ),
+                type=click.IntRange(min=0),
+                default=0,
+                show_default=True,
+            ),
+            option(
+                '--storage-read-connections',
+                help=(
+                    'Number of connections used to read the history of the payments and '
+                    'events for the API. If greater than 0 the database uses the WAL '
+                    'journal mode, so that these reads do not block the node.'
+                ),
+                type=click.IntRange(min=0),
+                default=0,
+                show_default=True,
+            ),
+            option(
+                '--storage-io-thread',
+                help=(
+                    'Run the database queries on a dedicated thread, so they do not block '
+                    'the processing of the messages and blocks.'
+                ),
+                is_flag=True,
+            ),
+            option(
+                '--storage-state-cache',
+                help=(
+                    'Write the state to a cache file in the data directory on a graceful '
+                    'shutdown, and load it on the next start instead of restoring it from '
+                    'the database.'
+                ),
+                is_flag=True,
+            ),
+            option(
+                '--storage-copy-on-write',
+                help=(
+                    'Apply the state changes to a copy of the state which only copies the '
+                    'channels and payment tasks the state change modifies, and the path to '
+                    'them, instead of a deep copy of the whole state.'
+                ),
+                is_flag=True,
+            ),
+            option(
+                '--storage-compaction-retained-snapshots',
+                help=(
+                    'Move the history older than this number of snapshots from the '
+                    'database to an archive database in the same directory. The '
+                    'history is kept in the database if not set.'
+                ),
+                type=click.IntRange(min=1),
+                default=None,
+            ),
+        ),
         option_group(
             'UDP Transport Options',
             option(
@@ -386,6 +481,17 @@ def options(func):
                 is_flag=True,
                 default=False,
             ),
+            option(
+                '--profile-state-transitions',
+                help=(
+                    'Record the number of calls, the time, the allocated memory and the '
+                    'events of the state transitions for each type of state change. The '
+                    'measures are served by the debug API and written next to the '
+                    'database when the node stops.'
+                ),
+                is_flag=True,
+                default=False,
+            ),
         ),
     ]
 
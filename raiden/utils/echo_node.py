@@ -1,17 +1,14 @@
-import copy
 import random
 from collections import deque
 
 import gevent
 import structlog
 from gevent.event import Event
-from gevent.lock import BoundedSemaphore
 from gevent.queue import Queue
-from gevent.timeout import Timeout
 
 from raiden.api.python import RaidenAPI
 from raiden.tasks import REMOVE_CALLBACK
-from raiden.transfer import channel
+from raiden.transfer import channel, views
 from raiden.transfer.events import EventPaymentReceivedSuccess
 from raiden.transfer.state import CHANNEL_STATE_OPENED
 from raiden.utils import pex
@@ -57,16 +54,26 @@ class EchoNode:
                 joinable_funds_target=.5,
             )
 
-        self.last_poll_offset = 0
+        token_network_identifier = views.get_token_network_identifier_by_token_address(
+            chain_state=views.state_from_raiden(self.api.raiden),
+            payment_network_id=self.api.raiden.default_registry.address,
+            token_address=self.token_address,
+        )
+        # Subscribed before reading the history, so no transfer is missed
+        self.subscription = self.api.raiden.wal.event_bus.subscribe(
+            event_types=(EventPaymentReceivedSuccess, ),
+            token_network_identifier=token_network_identifier,
+        )
+
         self.received_transfers = Queue()
         self.stop_signal = None  # used to signal REMOVE_CALLBACK and stop echo_workers
         self.greenlets = list()
-        self.lock = BoundedSemaphore()
         self.seen_transfers = deque(list(), TRANSFER_MEMORY)
         self.num_handled_transfers = 0
         self.lottery_pool = Queue()
         # register ourselves with the raiden alarm task
         self.api.raiden.alarm.register_callback(self.echo_node_alarm_callback)
+        self.receive_greenlet = gevent.spawn(self.receive_transfers)
         self.echo_worker_greenlet = gevent.spawn(self.echo_worker)
         log.info('Echo node started')
 
@@ -81,55 +88,30 @@ class EchoNode:
         if self.stop_signal is not None:
             return REMOVE_CALLBACK
         else:
-            self.greenlets.append(gevent.spawn(self.poll_all_received_events))
+            if not self.echo_worker_greenlet.started:
+                log.debug(
+                    'restarting echo_worker_greenlet',
+                    dead=self.echo_worker_greenlet.dead,
+                    successful=self.echo_worker_greenlet.successful(),
+                    exception=self.echo_worker_greenlet.exception,
+                )
+                self.echo_worker_greenlet = gevent.spawn(self.echo_worker)
             return True
 
-    def poll_all_received_events(self):
-        """ This will be triggered once for each `echo_node_alarm_callback`.
-        It polls all channels for `EventPaymentReceivedSuccess` events,
-        adds all new events to the `self.received_transfers` queue and
-        respawns `self.echo_node_worker`, if it died. """
-
-        locked = False
-        try:
-            with Timeout(10):
-                locked = self.lock.acquire(blocking=False)
-                if not locked:
-                    return
-                else:
-                    received_transfers = self.api.get_raiden_events_payment_history(
-                        token_address=self.token_address,
-                        offset=self.last_poll_offset,
-                    )
+    def receive_transfers(self):
+        """ Adds the `EventPaymentReceivedSuccess` events of the history and the
+        ones published afterwards to the `self.received_transfers` queue, until
+        the node is stopped. The duplicates are filtered by the `echo_worker`.
+        """
+        received_transfers = self.api.get_raiden_events_payment_history(
+            token_address=self.token_address,
+        )
+        for event in received_transfers:
+            if isinstance(event, EventPaymentReceivedSuccess):
+                self.received_transfers.put(event)
 
-                    # received transfer is a tuple of (block_number, event)
-                    received_transfers = [
-                        event
-                        for event in received_transfers
-                        if type(event) == EventPaymentReceivedSuccess
-                    ]
-
-                    for event in received_transfers:
-                        transfer = copy.deepcopy(event)
-                        self.received_transfers.put(transfer)
-
-                    # set last_poll_block after events are enqueued (timeout safe)
-                    if received_transfers:
-                        self.last_poll_offset += len(received_transfers)
-
-                    if not self.echo_worker_greenlet.started:
-                        log.debug(
-                            'restarting echo_worker_greenlet',
-                            dead=self.echo_worker_greenlet.dead,
-                            successful=self.echo_worker_greenlet.successful(),
-                            exception=self.echo_worker_greenlet.exception,
-                        )
-                        self.echo_worker_greenlet = gevent.spawn(self.echo_worker)
-        except Timeout:
-            log.info('timeout while polling for events')
-        finally:
-            if locked:
-                self.lock.release()
+        for event in self.subscription:
+            self.received_transfers.put(event)
 
     def echo_worker(self):
         """ The `echo_worker` works through the `self.received_transfers` queue and spawns
@@ -246,5 +228,7 @@ class EchoNode:
 
     def stop(self):
         self.stop_signal = True
+        self.subscription.unsubscribe()
+        self.greenlets.append(self.receive_greenlet)
         self.greenlets.append(self.echo_worker_greenlet)
         gevent.joinall(self.greenlets, raise_error=True)
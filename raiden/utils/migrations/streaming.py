@@ -0,0 +1,128 @@
+""" Migration of the rows of a table in batches.
+
+The rows are read, transformed and written back in batches, every batch is
+committed together with the identifier of its last row. The memory used is
+bounded by the size of a batch, and an interrupted migration resumes after the
+last committed batch instead of starting over.
+"""
+import time
+
+import structlog
+
+from raiden.storage.sqlite import SQLiteStorage
+from raiden.utils.typing import Callable, Optional
+
+log = structlog.get_logger(__name__)  # pylint: disable=invalid-name
+
+# Rows transformed per transaction
+MIGRATION_BATCH_SIZE = 1000
+
+# Every snapshot holds a whole chain state
+SNAPSHOT_MIGRATION_BATCH_SIZE = 10
+
+# Minimum number of seconds between the progress reports
+PROGRESS_LOG_INTERVAL = 10
+
+
+def _progress_setting(name: str) -> str:
+    return f'migration.{name}'
+
+
+def get_migration_progress(storage: SQLiteStorage, name: str) -> int:
+    """ Return the identifier of the last row transformed by the migration
+    `name`, zero if it did not start.
+    """
+    cursor = storage.conn.execute(
+        'SELECT value FROM settings WHERE name=?', (_progress_setting(name),),
+    )
+    row = cursor.fetchone()
+
+    if row is None:
+        return 0
+
+    return int(row[0])
+
+
+def transform_rows(
+        storage: SQLiteStorage,
+        name: str,
+        table: str,
+        transform: Callable[[str], Optional[str]],
+        batch_size: int = MIGRATION_BATCH_SIZE,
+):
+    """ Replace the `data` of the rows of `table` with the result of
+    `transform`, the rows for which it returns None are left unchanged.
+
+    The progress is stored in the settings under the migration's `name`. The
+    setting is removed once all the rows are transformed, but that is only
+    committed along with the version reached by the migration, if the upgrade
+    is interrupted before that the migration resumes without any row left.
+    """
+    if batch_size < 1:
+        raise ValueError('batch_size must be at least one')
+
+    conn = storage.conn
+    last_identifier = get_migration_progress(storage, name)
+
+    cursor = conn.execute(f'SELECT COUNT(1) FROM {table}')
+    total_rows = cursor.fetchone()[0]
+    cursor = conn.execute(
+        f'SELECT COUNT(1) FROM {table} WHERE identifier <= ?', (last_identifier, ),
+    )
+    migrated_rows = cursor.fetchone()[0]
+
+    if migrated_rows:
+        log.info('Resuming migration', migration=name, migrated_rows=migrated_rows)
+
+    start = time.monotonic()
+    resumed_rows = migrated_rows
+    last_report = start
+
+    while True:
+        cursor = conn.execute(
+            f'SELECT identifier, data FROM {table} '
+            f'WHERE identifier > ? ORDER BY identifier ASC LIMIT ?',
+            (last_identifier, batch_size),
+        )
+        rows = cursor.fetchall()
+
+        if not rows:
+            break
+
+        updates = list()
+        for identifier, data in rows:
+            new_data = transform(data)
+            if new_data is not None:
+                updates.append((new_data, identifier))
+
+        last_identifier = rows[-1][0]
+
+        with conn:
+            conn.executemany(f'UPDATE {table} SET data=? WHERE identifier=?', updates)
+            conn.execute(
+                'INSERT OR REPLACE INTO settings(name, value) VALUES(?, ?)',
+                (_progress_setting(name), str(last_identifier)),
+            )
+
+        migrated_rows += len(rows)
+
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_LOG_INTERVAL:
+            rows_per_second = (migrated_rows - resumed_rows) / (now - start)
+            log.info(
+                'Migrating rows',
+                migration=name,
+                migrated_rows=migrated_rows,
+                total_rows=total_rows,
+                eta=(total_rows - migrated_rows) / rows_per_second,
+            )
+            last_report = now
+
+    conn.execute('DELETE FROM settings WHERE name=?', (_progress_setting(name), ))
+
+    log.debug(
+        'Migrated rows',
+        migration=name,
+        migrated_rows=migrated_rows,
+        duration=time.monotonic() - start,
+    )
@@ -1,6 +1,7 @@
 import json
 
 from raiden.storage.sqlite import SQLiteStorage
+from raiden.utils.migrations.streaming import SNAPSHOT_MIGRATION_BATCH_SIZE, transform_rows
 
 SOURCE_VERSION = 16
 TARGET_VERSION = 17
@@ -41,9 +42,13 @@ def _transform_snapshot(raw_snapshot):
 
 
 def _transform_snapshots(storage: SQLiteStorage):
-    for snapshot in storage.get_snapshots():
-        new_snapshot = _transform_snapshot(snapshot.data)
-        storage.update_snapshot(snapshot.identifier, new_snapshot)
+    transform_rows(
+        storage,
+        name='v17_initiator_transfers',
+        table='state_snapshot',
+        transform=_transform_snapshot,
+        batch_size=SNAPSHOT_MIGRATION_BATCH_SIZE,
+    )
 
 
 def upgrade_initiator_manager(storage: SQLiteStorage, old_version: int, current_version: int):
@@ -52,5 +57,7 @@ def upgrade_initiator_manager(storage: SQLiteStorage, old_version: int, current_
     """
     if old_version == SOURCE_VERSION:
         _transform_snapshots(storage)
+        return TARGET_VERSION
 
-    return TARGET_VERSION
+    # Either already upgraded or older than the previous migration
+    return old_version
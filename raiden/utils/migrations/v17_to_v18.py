@@ -3,6 +3,7 @@ import json
 from raiden.exceptions import ChannelNotFound
 from raiden.storage.sqlite import SQLiteStorage
 from raiden.transfer.state import RouteState
+from raiden.utils.migrations.streaming import SNAPSHOT_MIGRATION_BATCH_SIZE, transform_rows
 from raiden.utils.typing import Any, Dict, Optional
 
 SOURCE_VERSION = 17
@@ -74,9 +75,13 @@ def _transform_snapshot(raw_snapshot: Dict[Any, Any]) -> str:
 
 
 def _add_routes_to_mediator(storage: SQLiteStorage):
-    for snapshot in storage.get_snapshots():
-        new_snapshot = _transform_snapshot(snapshot.data)
-        storage.update_snapshot(snapshot.identifier, new_snapshot)
+    transform_rows(
+        storage,
+        name='v18_mediator_routes',
+        table='state_snapshot',
+        transform=_transform_snapshot,
+        batch_size=SNAPSHOT_MIGRATION_BATCH_SIZE,
+    )
 
 
 def upgrade_mediators_with_waiting_transfer(
@@ -86,5 +91,7 @@ def upgrade_mediators_with_waiting_transfer(
 ) -> int:
     if old_version == SOURCE_VERSION:
         _add_routes_to_mediator(storage)
+        return TARGET_VERSION
 
-    return TARGET_VERSION
+    # Either already upgraded or older than the previous migration
+    return old_version
@@ -0,0 +1,55 @@
+from raiden.storage.sqlite import BALANCE_PROOF_LOOKUP_FIELDS, SQLiteStorage
+
+SOURCE_VERSION = 18
+TARGET_VERSION = 19
+
+
+def _backfill_balance_proofs(
+        storage: SQLiteStorage,
+        source_table: str,
+        lookup_table: str,
+        identifier_column: str,
+):
+    """ Copy the balance proof fields of every row of `source_table` which
+    contains a balance proof to `lookup_table`.
+    """
+    columns = ', '.join(BALANCE_PROOF_LOOKUP_FIELDS)
+    extracted_fields = ', '.join(
+        f"json_extract(data, '$.balance_proof.{field}')"
+        for field in BALANCE_PROOF_LOOKUP_FIELDS
+    )
+
+    cursor = storage.conn.cursor()
+    cursor.execute(
+        f'INSERT OR REPLACE INTO {lookup_table}({identifier_column}, {columns}) '
+        f'SELECT identifier, {extracted_fields} FROM {source_table} '
+        f"WHERE json_type(data, '$.balance_proof') = 'object'",
+    )
+
+
+def upgrade_balance_proof_lookup_tables(
+        storage: SQLiteStorage,
+        old_version: int,
+        current_version: int,
+) -> int:
+    """ Version 19 added indexed lookup tables for the balance proofs
+    contained in the state changes and events, the tables are created empty
+    and populated here from the existing rows.
+    """
+    if old_version == SOURCE_VERSION:
+        _backfill_balance_proofs(
+            storage,
+            'state_changes',
+            'state_changes_balance_proofs',
+            'state_change_identifier',
+        )
+        _backfill_balance_proofs(
+            storage,
+            'state_events',
+            'state_events_balance_proofs',
+            'event_identifier',
+        )
+        return TARGET_VERSION
+
+    # Either already upgraded or older than the previous migration
+    return old_version
@@ -0,0 +1,113 @@
+import json
+
+import msgpack
+from eth_utils import to_checksum_address
+
+from raiden.storage.compression import decompress
+from raiden.storage.serialize import BINARY_TYPE_KEY, BINARY_TYPE_REGISTRY, EXT_HEX
+from raiden.storage.sqlite import ITERATION_BATCH_SIZE, SQLiteStorage
+from raiden.utils.typing import Any, Optional, Tuple
+
+SOURCE_VERSION = 19
+TARGET_VERSION = 20
+
+# The payment events of version 19, with the attribute holding the partner of
+# the payment.
+PAYMENT_EVENTS = {
+    'raiden.transfer.events.EventPaymentSentSuccess': 'target',
+    'raiden.transfer.events.EventPaymentSentFailed': 'target',
+    'raiden.transfer.events.EventPaymentReceivedSuccess': 'initiator',
+}
+
+
+def _binary_ext_hook(code: int, data: bytes) -> Any:
+    if code == EXT_HEX:
+        return '0x' + data.hex()
+    return msgpack.ExtType(code, data)
+
+
+def _payment_of_event(data) -> Optional[Tuple[str, str, str]]:
+    """ Return the event type, token network and partner of the payment event
+    stored as `data`, None if it is not a payment event.
+
+    The events are either JSON objects, with the path of their class under
+    `_type`, or msgpack maps, with the position of their class in the type
+    registry, or its path, under the binary type key.
+    """
+    data = decompress(data)
+
+    if isinstance(data, bytes):
+        event = msgpack.unpackb(data, raw=False, ext_hook=_binary_ext_hook)
+        type_ref = event.get(BINARY_TYPE_KEY)
+        if isinstance(type_ref, int):
+            type_ref = BINARY_TYPE_REGISTRY[type_ref]
+    else:
+        event = json.loads(data)
+        type_ref = event.get('_type')
+
+    partner_attribute = PAYMENT_EVENTS.get(type_ref)
+    if partner_attribute is None:
+        return None
+
+    return (
+        type_ref.rpartition('.')[2],
+        to_checksum_address(event['token_network_identifier']),
+        to_checksum_address(event[partner_attribute]),
+    )
+
+
+def _backfill_payment_history(storage: SQLiteStorage):
+    """ Add the existing payment events to the payment_history table.
+
+    The events may have been written with either serializer, and compressed,
+    so they can not be filtered with the SQLite JSON functions, the stored data
+    of every event is decoded instead.
+    """
+    last_identifier = 0
+
+    while True:
+        cursor = storage.conn.execute(
+            'SELECT identifier, log_time, data FROM state_events '
+            'WHERE identifier > ? ORDER BY identifier ASC LIMIT ?',
+            (last_identifier, ITERATION_BATCH_SIZE),
+        )
+        rows = cursor.fetchall()
+
+        if not rows:
+            break
+
+        payments = list()
+        for identifier, log_time, data in rows:
+            payment = _payment_of_event(data)
+
+            if payment is not None:
+                event_type, token_network_identifier, partner = payment
+                payments.append(
+                    (identifier, event_type, token_network_identifier, partner, log_time),
+                )
+
+        storage.conn.executemany(
+            'INSERT INTO payment_history('
+            '    event_identifier, event_type, token_network_identifier, partner, log_time'
+            ') VALUES(?, ?, ?, ?, ?)',
+            payments,
+        )
+
+        last_identifier = rows[-1][0]
+
+
+def upgrade_payment_history(
+        storage: SQLiteStorage,
+        old_version: int,
+        current_version: int,
+) -> int:
+    """ Version 20 added an indexed table of the payment events for the
+    payment history, the table is created empty and populated here from the
+    existing events.
+    """
+    if old_version == SOURCE_VERSION:
+        _backfill_payment_history(storage)
+        return TARGET_VERSION
+
+    # Either already upgraded or older than the previous migration
+    return old_version
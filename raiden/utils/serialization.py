@@ -91,7 +91,7 @@ def deserialize_merkletree_layers(data: typing.List[str]):
 def serialize_queueid_to_queue(data: typing.Dict):
     # QueueId cannot be the key in a JSON dict, so make it a str
     return {
-        str(queue_id): (queue_id, queue)
+        str(queue_id): (queue_id, list(queue))
         for queue_id, queue in data.items()
     }
 
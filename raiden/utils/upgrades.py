@@ -8,14 +8,18 @@ import filelock
 import structlog
 
 from raiden.storage.sqlite import RAIDEN_DB_VERSION, SQLiteStorage
-from raiden.storage.versions import older_db_file
+from raiden.storage.versions import archive_db_file, older_db_file
 from raiden.utils.migrations.v16_to_v17 import upgrade_initiator_manager
 from raiden.utils.migrations.v17_to_v18 import upgrade_mediators_with_waiting_transfer
-from raiden.utils.typing import Callable
+from raiden.utils.migrations.v18_to_v19 import upgrade_balance_proof_lookup_tables
+from raiden.utils.migrations.v19_to_v20 import upgrade_payment_history
+from raiden.utils.typing import Callable, Optional
 
 UPGRADES_LIST = [
     upgrade_initiator_manager,
     upgrade_mediators_with_waiting_transfer,
+    upgrade_balance_proof_lookup_tables,
+    upgrade_payment_history,
 ]
 
 
@@ -35,6 +39,36 @@ def update_version(storage: SQLiteStorage, version: int):
     )
 
 
+def update_upgrade_version(storage: SQLiteStorage, version: int):
+    """ Store the version reached by the upgrade in progress. """
+    storage.conn.execute(
+        'INSERT OR REPLACE INTO settings(name, value) VALUES(?, ?)',
+        ('upgrade_version', str(version)),
+    )
+
+
+def get_upgrade_version(db_filename: Path) -> Optional[int]:
+    """ Return the version reached by an interrupted upgrade of the database,
+    None if the database is not being upgraded.
+    """
+    if not os.path.exists(str(db_filename)):
+        return None
+
+    conn = sqlite3.connect(str(db_filename))
+    with closing(conn):
+        try:
+            cursor = conn.execute('SELECT value FROM settings WHERE name=?;', ('upgrade_version',))
+        except sqlite3.OperationalError:
+            return None
+
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+
+    return int(row[0])
+
+
 def get_db_version(db_filename: Path):
     # Perform a query directly through SQL rather than using
     # storage.get_version()
@@ -55,10 +89,15 @@ def get_db_version(db_filename: Path):
         return 0
 
 
-def _run_upgrade_func(cursor: sqlite3.Cursor, func: Callable, version: int) -> int:
-    """ Run the migration function, store the version and advance the version. """
-    new_version = func(cursor, version, RAIDEN_DB_VERSION)
-    update_version(cursor, new_version)
+def _run_upgrade_func(storage: SQLiteStorage, func: Callable, version: int) -> int:
+    """ Run the migration function and commit the version it reached.
+
+    The changes of the migrations which don't commit by themselves are
+    committed with the version.
+    """
+    new_version = func(storage, version, RAIDEN_DB_VERSION)
+    update_upgrade_version(storage, new_version)
+    storage.conn.commit()
     return new_version
 
 
@@ -67,7 +106,18 @@ def _backup_old_db(filename):
     shutil.move(filename, backup_name)
 
 
-def _copy(old_db_filename, current_db_filename):
+def _move_archive(old_db_filename, current_db_filename):
+    # The archived rows are not migrated, they are only read for the history
+    # of the events
+    old_archive_filename = archive_db_file(old_db_filename)
+    if os.path.exists(old_archive_filename):
+        shutil.move(old_archive_filename, archive_db_file(current_db_filename))
+
+
+def _copy(old_db_filename, current_db_filename, version):
+    """ Copy the database, the copy is marked as being upgraded from
+    `version`.
+    """
     old_conn = sqlite3.connect(
         old_db_filename,
         detect_types=sqlite3.PARSE_DECLTYPES,
@@ -80,6 +130,14 @@ def _copy(old_db_filename, current_db_filename):
     with closing(old_conn), closing(current_conn):
         old_conn.backup(current_conn)
 
+        # Opening the storage sets the latest version, the mark must be set
+        # before so an interrupted upgrade is not mistaken for a finished one
+        with current_conn:
+            current_conn.execute(
+                'INSERT OR REPLACE INTO settings(name, value) VALUES(?, ?)',
+                ('upgrade_version', str(version)),
+            )
+
 
 class UpgradeManager:
     """ Run migrations when a database upgrade is necesary.
@@ -92,11 +150,14 @@ class UpgradeManager:
     Upgrade procedure:
 
     - Copy the old file to the latest version (e.g. copy version v16 as v18).
-    - In a transaction: Run every migration. Each migration must decide whether
-      to proceed or not.
-    - If a single migration fails: The transaction is not commited and the DB
-      copy is deleted.
+    - Run every migration. Each migration must decide whether to proceed or
+      not. The version reached is committed after every migration, the
+      migrations which stream the rows also commit their progress.
+    - If a single migration fails: The DB copy is deleted.
     - If every migration succeeds: Rename the old DB.
+
+    If the upgrade is interrupted, e.g. the node is killed, it is resumed on
+    the next run from the last version and progress committed.
     """
 
     def __init__(self, db_filename: str):
@@ -117,7 +178,11 @@ class UpgradeManager:
             return
 
         with get_file_lock(old_db_filename), get_file_lock(self._current_db_filename):
-            if get_db_version(self._current_db_filename) == RAIDEN_DB_VERSION:
+            version_iteration = get_upgrade_version(self._current_db_filename)
+
+            if version_iteration is not None:
+                log.debug(f'Resuming database upgrade from v{version_iteration}')
+            elif get_db_version(self._current_db_filename) == RAIDEN_DB_VERSION:
                 # The current version has already been created / updraded.
                 return
             else:
@@ -125,31 +190,36 @@ class UpgradeManager:
                 # Delete and re-run migration
                 self._delete_current_db()
 
-            older_version = get_db_version(old_db_filename)
-            if not older_version:
-                # There are no older versions to upgrade from.
-                return
+                older_version = get_db_version(old_db_filename)
+                if not older_version:
+                    # There are no older versions to upgrade from.
+                    return
 
-            _copy(str(old_db_filename), str(self._current_db_filename))
+                _copy(str(old_db_filename), str(self._current_db_filename), older_version)
+                version_iteration = older_version
 
             storage = SQLiteStorage(str(self._current_db_filename))
 
-            log.debug(f'Upgrading database from {older_version} to v{RAIDEN_DB_VERSION}')
+            log.debug(f'Upgrading database from {version_iteration} to v{RAIDEN_DB_VERSION}')
 
             try:
-                with storage.transaction():
-                    version_iteration = older_version
-                    for upgrade_func in UPGRADES_LIST:
-                        version_iteration = _run_upgrade_func(
-                            storage,
-                            upgrade_func,
-                            version_iteration,
-                        )
+                for upgrade_func in UPGRADES_LIST:
+                    version_iteration = _run_upgrade_func(
+                        storage,
+                        upgrade_func,
+                        version_iteration,
+                    )
 
+                with storage.transaction():
                     update_version(storage, RAIDEN_DB_VERSION)
+                    storage.conn.execute(
+                        'DELETE FROM settings WHERE name=?', ('upgrade_version',),
+                    )
                     # Prevent the upgrade from happening on next restart
                     _backup_old_db(old_db_filename)
+                    _move_archive(old_db_filename, str(self._current_db_filename))
             except Exception as e:
+                storage.conn.close()
                 self._delete_current_db()
                 log.error(f'Failed to upgrade database: {str(e)}')
                 raise
@@ -1,3 +1,5 @@
+import itertools
+
 import gevent
 import structlog
 
@@ -291,24 +293,29 @@ def wait_for_transfer_success(
         raiden: RaidenService,
         payment_identifier: typing.PaymentID,
         amount: typing.PaymentAmount,
-        retry_timeout: float,
+        retry_timeout: float,  # pylint: disable=unused-argument
 ) -> None:
     """Wait until a transfer with a specific identifier and amount
     is seen in the WAL.
 
     Note:
-        This does not time out, use gevent.Timeout.
+        This does not time out, use gevent.Timeout. The events are published
+        by the WAL, `retry_timeout` is not used.
     """
-    found = False
-    while not found:
-        state_events = raiden.wal.storage.get_events()
-        for event in state_events:
-            found = (
-                isinstance(event, EventPaymentReceivedSuccess) and
-                event.identifier == payment_identifier and
-                event.amount == amount
-            )
-            if found:
-                break
+    subscription = raiden.wal.event_bus.subscribe(
+        event_types=(EventPaymentReceivedSuccess, ),
+        payment_identifier=payment_identifier,
+    )
+    with subscription:
+        # Subscribed first, the payment may be received while the history is read
+        received_payments = raiden.wal.storage.iterate_payment_history(
+            event_types=[EventPaymentReceivedSuccess.__name__],
+        )
+        events = itertools.chain(
+            (record.data for record in received_payments),
+            subscription,
+        )
 
-        gevent.sleep(retry_timeout)
+        for event in events:
+            if event.identifier == payment_identifier and event.amount == amount:
+                return